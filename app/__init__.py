@@ -51,6 +51,11 @@ P12_OUTCOMES_MAP = {
 P12_COMMON_TARGET_INFO = "Once the confirmation is in you will target 0.5% with stop loss at 0.35%."
 
 
+def _include_in_autogenerate(name, type_, parent_names):
+    """Hides the full-text search tables (created by app/search.py, not the models) from autogenerate."""
+    return not (type_ == 'table' and name.startswith('search_index'))
+
+
 def create_app(config_class=None):
     global serializer
     app = Flask(__name__, instance_relative_config=True)
@@ -73,6 +78,19 @@ def create_app(config_class=None):
         ALLOWED_IMAGE_EXTENSIONS={'png', 'jpg', 'jpeg', 'gif'},  # Used by _is_allowed_image helpers
         ITEMS_PER_PAGE=int(os.environ.get('ITEMS_PER_PAGE', 10)),
         PER_PAGE_TRADES=int(os.environ.get('PER_PAGE_TRADES', 25)),  # Used in trades_bp
+        # Exact "Page x of y" totals on the trades list (cached per filter); turn off to skip the COUNT entirely
+        TRADES_LIST_EXACT_COUNT=os.environ.get('TRADES_LIST_EXACT_COUNT', 'True').lower() in ['true', '1', 't'],
+        # Worker processes running background CSV trade imports (app.import_jobs)
+        IMPORT_WORKERS=int(os.environ.get('IMPORT_WORKERS', 2)),
+        # Exchange clock imported broker fills are stored in (app.trade_import.FillsTradeImporter)
+        TRADING_TIMEZONE=os.environ.get('TRADING_TIMEZONE', 'America/New_York'),
+        # How uploads are delivered once authorized: 'python' (send_file with ETag/Range), 'x-accel' (nginx
+        # X-Accel-Redirect to FILE_DELIVERY_ACCEL_PREFIX + path) or 'x-sendfile' (Apache/lighttpd X-Sendfile)
+        FILE_DELIVERY=os.environ.get('FILE_DELIVERY', 'python'),
+        FILE_DELIVERY_ACCEL_PREFIX=os.environ.get('FILE_DELIVERY_ACCEL_PREFIX', '/protected-uploads'),
+        UPLOAD_CACHE_MAX_AGE=int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 365 * 24 * 3600)),  # Uploads never change
+        # Bytes of files, trade and journal images each user may store (app.storage_usage); 0 means no quota
+        STORAGE_QUOTA_BYTES=int(os.environ.get('STORAGE_QUOTA_BYTES', 0)),
         PROFILE_PICS_FOLDER_REL=os.environ.get('PROFILE_PICS_FOLDER_REL', 'profile_pics'),
         PROFILE_PICS_SAVE_PATH=os.path.join(os.path.abspath(os.path.join(app.root_path, 'static')),
                                             os.environ.get('PROFILE_PICS_FOLDER_REL', 'profile_pics')),
@@ -90,10 +108,12 @@ def create_app(config_class=None):
         app.config.from_object(config_class)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, include_name=_include_in_autogenerate)
     login_manager.init_app(app)
     mail.init_app(app)
     csrf.init_app(app)
+    from .cache import analytics_cache
+    analytics_cache.init_app(app)
 
     serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
@@ -150,6 +170,12 @@ def create_app(config_class=None):
 
     with app.app_context():
         from . import models  # Import models after db is initialized and within app context
+        from . import rollups  # noqa: F401 -- registers the session listeners that maintain PerformanceRollup
+        from . import search  # noqa: F401 -- creates the full-text index and its triggers along with the tables
+        from . import period_summaries  # noqa: F401 -- registers the listener that invalidates cached period summaries
+        from . import storage_usage  # noqa: F401 -- registers the listeners that maintain StorageUsage
+        from .image_derivatives import image_srcset
+        app.jinja_env.filters['image_srcset'] = image_srcset
 
         @login_manager.user_loader
         def load_user(user_id):
@@ -174,6 +200,14 @@ def create_app(config_class=None):
         # ADDED: Import and Register Journal Blueprint
         from .blueprints.journal_bp import journal_bp
         app.register_blueprint(journal_bp, url_prefix='/journal')
+        from .blueprints.analytics_bp import analytics_bp
+        app.register_blueprint(analytics_bp, url_prefix='/analytics')
+        from .blueprints.search_bp import search_bp
+        app.register_blueprint(search_bp, url_prefix='/search')
+
+        # --- Register CLI Commands ---
+        from .commands import register_commands
+        register_commands(app)
 
         @app.errorhandler(403)
         def forbidden_page(error):
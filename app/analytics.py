@@ -0,0 +1,581 @@
+"""Columnar performance analytics over a user's trade history.
+
+Trades are loaded with a single query into contiguous NumPy arrays (one per field) and every
+statistic is computed with vectorized operations, so a 100k-trade history costs one round trip
+plus a handful of array passes instead of one ORM object and several queries per trade.
+"""
+import calendar
+from datetime import date as py_date
+
+import numpy as np
+
+from app import db
+
+TRADING_DAYS_PER_YEAR = 252
+RATING_FIELDS = ('rules_rating', 'management_rating', 'target_rating', 'entry_rating', 'preparation_rating')
+
+
+def _float_array(values):
+    """Builds a float64 array from a sequence that may contain None (NumPy maps None to NaN)."""
+    return np.array(values, dtype=np.float64)
+
+
+def _categorical(values):
+    """Encodes a sequence of labels as (int32 codes, label list); None becomes the '' category."""
+    labels, codes = np.unique(np.array([v or '' for v in values], dtype=str), return_inverse=True)
+    return codes.astype(np.int32), labels.tolist()
+
+
+def _round(value, digits=2):
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+class TradeFrame:
+    """A user's trades as parallel NumPy columns, ordered by (trade_date, id)."""
+
+    def __init__(self, ids, dates, instrument_codes, instruments, directions, model_ids, pnl, r, risk, mae, mfe,
+                 ratings):
+        self.ids = ids
+        self.dates = dates
+        self.instrument_codes = instrument_codes
+        self.instruments = instruments
+        self.directions = directions  # +1 long, -1 short, 0 unknown
+        self.model_ids = model_ids  # -1 when no trading model
+        self.pnl = pnl
+        self.r = r
+        self.risk = risk
+        self.mae = mae
+        self.mfe = mfe
+        self.ratings = ratings  # dict of rating field -> float array (NaN when unrated)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, user_id, start_date=None, end_date=None, trading_model_id=None, instrument=None):
+        from app.models import Trade
+
+        table = Trade.__table__
+        # trade_date is selected as text so the driver skips per-row date object construction;
+        # NumPy parses the ISO strings in one pass.
+        columns = [table.c.id, db.cast(table.c.trade_date, db.String), table.c.instrument, table.c.direction,
+                   table.c.trading_model_id, table.c.gross_pnl, table.c.pnl_in_r, table.c.dollar_risk,
+                   table.c.mae, table.c.mfe] + [table.c[field] for field in RATING_FIELDS]
+        query = db.select(*columns).where(Trade.user_id == user_id)
+        if start_date:
+            query = query.where(Trade.trade_date >= start_date)
+        if end_date:
+            query = query.where(Trade.trade_date <= end_date)
+        if trading_model_id:
+            query = query.where(Trade.trading_model_id == trading_model_id)
+        if instrument:
+            query = query.where(Trade.instrument == instrument)
+        # Core execution on the session's connection avoids the ORM row-loading layer.
+        rows = db.session.connection().execute(query.order_by(Trade.trade_date.asc(), Trade.id.asc())).all()
+        return cls.from_rows(rows)
+
+    @classmethod
+    def from_rows(cls, rows):
+        if not rows:
+            empty = np.empty(0, dtype=np.float64)
+            return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[D]'),
+                       np.empty(0, dtype=np.int32), [], np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int64),
+                       empty, empty, empty, empty, empty, {field: empty for field in RATING_FIELDS})
+        cols = list(zip(*rows))
+        instrument_codes, instruments = _categorical(cols[2])
+        direction_codes, direction_labels = _categorical(cols[3])
+        direction_signs = np.array([1 if d == 'Long' else (-1 if d == 'Short' else 0) for d in direction_labels],
+                                   dtype=np.int8)
+        return cls(
+            ids=np.array(cols[0], dtype=np.int64),
+            dates=np.array([str(d)[:10] for d in cols[1]], dtype='datetime64[D]'),
+            instrument_codes=instrument_codes,
+            instruments=instruments,
+            directions=direction_signs[direction_codes],
+            model_ids=np.nan_to_num(_float_array(cols[4]), nan=-1).astype(np.int64),
+            pnl=np.nan_to_num(_float_array(cols[5])),
+            r=_float_array(cols[6]),
+            risk=_float_array(cols[7]),
+            mae=_float_array(cols[8]),
+            mfe=_float_array(cols[9]),
+            ratings={field: _float_array(cols[10 + i]) for i, field in enumerate(RATING_FIELDS)},
+        )
+
+    # --- Series ---
+    def equity_curve(self):
+        return np.cumsum(self.pnl)
+
+    def cumulative_r(self):
+        """Running total of R multiples; trades without a defined R contribute 0."""
+        return np.cumsum(np.nan_to_num(self.r))
+
+    def drawdown_series(self):
+        """Drawdown (<= 0) from the running equity peak, with the starting balance of 0 counted as a peak."""
+        equity = self.equity_curve()
+        peaks = np.maximum.accumulate(np.maximum(equity, 0.0)) if len(equity) else equity
+        return equity - peaks
+
+    def daily_pnl(self):
+        """Returns (unique trade dates, summed P&L per date)."""
+        if not len(self):
+            return self.dates, self.pnl
+        days, inverse = np.unique(self.dates, return_inverse=True)
+        return days, np.bincount(inverse, weights=self.pnl)
+
+    # --- Statistics ---
+    def max_drawdown(self):
+        """Returns (max drawdown in $, longest underwater stretch in calendar days, in trades)."""
+        if not len(self):
+            return 0.0, 0, 0
+        drawdown = self.drawdown_series()
+        index = np.arange(len(drawdown))
+        # Index of the most recent trade at which equity was at its peak (-1 = the starting balance)
+        last_peak = np.maximum.accumulate(np.where(drawdown >= 0, index, -1))
+        underwater_trades = index - last_peak
+        peak_dates = np.where(last_peak >= 0, self.dates[np.maximum(last_peak, 0)], self.dates[0])
+        underwater_days = (self.dates - peak_dates).astype(np.int64)
+        underwater_days = np.where(drawdown < 0, underwater_days, 0)
+        underwater_trades = np.where(drawdown < 0, underwater_trades, 0)
+        return float(drawdown.min()), int(underwater_days.max()), int(underwater_trades.max())
+
+    def streaks(self):
+        """Returns (longest winning streak, longest losing streak); breakeven trades end a streak."""
+        if not len(self):
+            return 0, 0
+        signs = np.sign(self.pnl).astype(np.int8)
+        run_starts = np.flatnonzero(np.concatenate(([True], signs[1:] != signs[:-1])))
+        run_lengths = np.diff(np.append(run_starts, len(signs)))
+        run_signs = signs[run_starts]
+        longest_win = run_lengths[run_signs > 0].max(initial=0)
+        longest_loss = run_lengths[run_signs < 0].max(initial=0)
+        return int(longest_win), int(longest_loss)
+
+    def ratio_stats(self):
+        """Returns (Sharpe, Sortino) of daily P&L, annualized over TRADING_DAYS_PER_YEAR."""
+        _, daily = self.daily_pnl()
+        if len(daily) < 2:
+            return None, None
+        mean = daily.mean()
+        std = daily.std(ddof=1)
+        downside = np.sqrt(np.mean(np.minimum(daily, 0.0) ** 2))
+        annualize = np.sqrt(TRADING_DAYS_PER_YEAR)
+        sharpe = mean / std * annualize if std > 0 else None
+        sortino = mean / downside * annualize if downside > 0 else None
+        return sharpe, sortino
+
+    def summary(self):
+        n = len(self)
+        wins_mask = self.pnl > 0
+        losses_mask = self.pnl < 0
+        wins, losses = int(wins_mask.sum()), int(losses_mask.sum())
+        gross_profit = float(self.pnl[wins_mask].sum())
+        gross_loss = float(self.pnl[losses_mask].sum())
+        max_dd, dd_days, dd_trades = self.max_drawdown()
+        longest_win, longest_loss = self.streaks()
+        sharpe, sortino = self.ratio_stats()
+        days, _ = self.daily_pnl()
+        r_known = self.r[~np.isnan(self.r)]
+
+        return {
+            'trade_count': n,
+            'trading_days': int(len(days)),
+            'first_date': str(self.dates[0]) if n else None,
+            'last_date': str(self.dates[-1]) if n else None,
+            'wins': wins,
+            'losses': losses,
+            'breakeven': n - wins - losses,
+            'win_rate': _round(wins / n * 100, 1) if n else None,
+            'net_pnl': _round(self.pnl.sum()),
+            'gross_profit': _round(gross_profit),
+            'gross_loss': _round(gross_loss),
+            'expectancy': _round(self.pnl.mean()) if n else None,
+            'expectancy_r': _round(r_known.mean(), 3) if len(r_known) else None,
+            'total_r': _round(r_known.sum()) if len(r_known) else None,
+            'profit_factor': _round(gross_profit / -gross_loss) if gross_loss < 0 else None,
+            'average_win': _round(gross_profit / wins) if wins else None,
+            'average_loss': _round(gross_loss / losses) if losses else None,
+            'largest_win': _round(self.pnl.max()) if n else None,
+            'largest_loss': _round(self.pnl.min()) if n else None,
+            'max_drawdown': _round(max_dd),
+            'max_drawdown_duration_days': dd_days,
+            'max_drawdown_duration_trades': dd_trades,
+            'sharpe_ratio': _round(sharpe),
+            'sortino_ratio': _round(sortino),
+            'longest_win_streak': longest_win,
+            'longest_loss_streak': longest_loss,
+            'average_mae': _round(np.nanmean(self.mae)) if np.any(~np.isnan(self.mae)) else None,
+            'average_mfe': _round(np.nanmean(self.mfe)) if np.any(~np.isnan(self.mfe)) else None,
+            'average_ratings': {field: (_round(np.nanmean(values)) if np.any(~np.isnan(values)) else None)
+                                for field, values in self.ratings.items()},
+        }
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the points to keep.
+
+    The first and last points are always kept; each of the `threshold - 2` buckets in between
+    contributes the point forming the largest triangle with the previously kept point and the
+    average of the next bucket, which preserves the visual shape (peaks, troughs) of the series.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i spans [edges[i], edges[i + 1]); the final edge is the last point.
+    edges = (np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))) + 1).astype(np.int64)
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _columnar(dates, values, points):
+    """Downsamples a per-trade series to `points` with LTTB and returns it as {'t': [...], 'v': [...]}."""
+    indices = lttb_indices(np.arange(len(values)), values, points) if points else np.arange(len(values))
+    return {
+        't': [str(d) for d in dates[indices].tolist()],
+        'v': np.round(values[indices], 2).tolist(),
+    }
+
+
+CHART_SERIES = {
+    'equity': TradeFrame.equity_curve,
+    'drawdown': TradeFrame.drawdown_series,
+    'cumulative_r': TradeFrame.cumulative_r,
+}
+
+
+def chart_series(user_id, name, points=1000, start_date=None, end_date=None, trading_model_id=None,
+                 instrument=None):
+    """One of CHART_SERIES for a user's trades, LTTB-downsampled to at most `points` points."""
+    frame = TradeFrame.load(user_id, start_date=start_date, end_date=end_date,
+                            trading_model_id=trading_model_id, instrument=instrument)
+    series = _columnar(frame.dates, CHART_SERIES[name](frame), points)
+    series.update(series=name, total_points=len(frame))
+    return series
+
+
+def performance_report(user_id, start_date=None, end_date=None, trading_model_id=None, instrument=None,
+                       curve_points=1000):
+    """Loads a user's trades and returns the summary statistics plus the (downsampled) equity curve."""
+    frame = TradeFrame.load(user_id, start_date=start_date, end_date=end_date,
+                            trading_model_id=trading_model_id, instrument=instrument)
+    return {
+        'summary': frame.summary(),
+        'equity_curve': _columnar(frame.dates, frame.equity_curve(), curve_points),
+        'generated_on': py_date.today().isoformat(),
+    }
+
+
+def calendar_heatmap(user_id, start_date, end_date):
+    """Daily P&L, trade count and journal presence for every month between two dates.
+
+    Reads the per-day `PerformanceRollup` rows plus the journal dates (two indexed range queries, no
+    trade scan) and returns one compact entry per month: `pnl` (None on days without trades), `n`
+    (trade count) and `j` (1 when a DailyJournal exists), each indexed by day of month - 1.
+    """
+    from app.models import DailyJournal, PerformanceRollup
+
+    start_date = start_date.replace(day=1)
+    rollups = PerformanceRollup.__table__
+    journals = DailyJournal.__table__
+    connection = db.session.connection()
+    day_rows = connection.execute(
+        db.select(rollups.c.period_start, rollups.c.gross_pnl, rollups.c.trade_count)
+        .where(rollups.c.user_id == user_id, rollups.c.period_type == 'day', rollups.c.dimension == 'all',
+               rollups.c.period_start.between(start_date, end_date))).all()
+    journal_dates = connection.execute(
+        db.select(journals.c.journal_date)
+        .where(journals.c.user_id == user_id, journals.c.journal_date.between(start_date, end_date))).scalars().all()
+
+    months, index = [], {}
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        first_weekday, days_in_month = calendar.monthrange(year, month)
+        index[(year, month)] = len(months)
+        months.append({'y': year, 'm': month, 'first_weekday': first_weekday,
+                       'pnl': [None] * days_in_month, 'n': [0] * days_in_month, 'j': [0] * days_in_month})
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    max_abs_pnl = 0.0
+    for day, pnl, count in day_rows:
+        entry = months[index[(day.year, day.month)]]
+        entry['pnl'][day.day - 1] = round(pnl, 2)
+        entry['n'][day.day - 1] = count
+        max_abs_pnl = max(max_abs_pnl, abs(pnl))
+    for day in journal_dates:
+        months[index[(day.year, day.month)]]['j'][day.day - 1] = 1
+
+    return {'start': start_date.isoformat(), 'end': end_date.isoformat(),
+            'max_abs_pnl': round(max_abs_pnl, 2), 'months': months}
+
+
+BREAKDOWN_DIMENSIONS = ('trading_model_id', 'instrument', 'direction', 'tags', 'news_event', 'how_closed')
+
+
+def trade_breakdown(user_id, group_by, start_date=None, end_date=None, trading_model_id=None, instrument=None):
+    """Per-group trade statistics computed by a single GROUP BY over the materialized trade metrics.
+
+    `group_by` is any combination of BREAKDOWN_DIMENSIONS. Each returned dict carries the group values
+    under 'group' (plus 'model_name' when grouping by model) and count, wins, losses, win rate, net and
+    gross P&L, expectancy, average R and profit factor; groups are ordered by net P&L, best first.
+    """
+    from app.models import Trade, TradingModel, Tag, TradeTag
+
+    group_by = [dimension for dimension in group_by if dimension in BREAKDOWN_DIMENSIONS]
+    if not group_by:
+        raise ValueError("At least one breakdown dimension is required.")
+    table = Trade.__table__
+    pnl = table.c.gross_pnl
+    # Tags live in the trade_tag link table: a trade with several tags counts once in each tag's group.
+    group_columns = [Tag.__table__.c.name.label('tags') if dimension == 'tags' else table.c[dimension]
+                     for dimension in group_by]
+    net_pnl = db.func.sum(pnl).label('net_pnl')
+    query = (db.select(*group_columns,
+                       db.func.count().label('trade_count'),
+                       db.func.sum(db.case((pnl > 0, 1), else_=0)).label('wins'),
+                       db.func.sum(db.case((pnl < 0, 1), else_=0)).label('losses'),
+                       net_pnl,
+                       db.func.sum(db.case((pnl > 0, pnl), else_=0.0)).label('gross_profit'),
+                       db.func.sum(db.case((pnl < 0, pnl), else_=0.0)).label('gross_loss'),
+                       db.func.avg(table.c.pnl_in_r).label('average_r'),
+                       db.func.min(table.c.trade_date).label('first_date'),
+                       db.func.max(table.c.trade_date).label('last_date'))
+             .where(table.c.user_id == user_id)
+             .group_by(*group_columns)
+             .order_by(net_pnl.desc()))
+    if 'tags' in group_by:
+        links = TradeTag.__table__
+        query = query.select_from(
+            table.outerjoin(links, links.c.trade_id == table.c.id)
+            .outerjoin(Tag.__table__, Tag.__table__.c.id == links.c.tag_id))
+    if start_date:
+        query = query.where(table.c.trade_date >= start_date)
+    if end_date:
+        query = query.where(table.c.trade_date <= end_date)
+    if trading_model_id:
+        query = query.where(table.c.trading_model_id == trading_model_id)
+    if instrument:
+        query = query.where(table.c.instrument == instrument)
+    rows = db.session.connection().execute(query).all()
+
+    model_names = {}
+    if 'trading_model_id' in group_by:
+        model_names = dict(db.session.execute(db.select(TradingModel.id, TradingModel.name)
+                                              .where(TradingModel.user_id == user_id)).all())
+    groups = []
+    for row in rows:
+        values = row._mapping
+        count, wins, losses = values['trade_count'], values['wins'] or 0, values['losses'] or 0
+        gross_profit, gross_loss = values['gross_profit'] or 0.0, values['gross_loss'] or 0.0
+        group = {dimension: values[dimension] for dimension in group_by}
+        entry = {
+            'group': group,
+            'trade_count': count,
+            'wins': wins,
+            'losses': losses,
+            'win_rate': _round(wins / count * 100, 1) if count else None,
+            'net_pnl': _round(values['net_pnl'] or 0.0),
+            'gross_profit': _round(gross_profit),
+            'gross_loss': _round(gross_loss),
+            'expectancy': _round((values['net_pnl'] or 0.0) / count) if count else None,
+            'average_r': _round(values['average_r'], 3) if values['average_r'] is not None else None,
+            'profit_factor': _round(gross_profit / -gross_loss) if gross_loss < 0 else None,
+            'first_date': str(values['first_date']) if values['first_date'] else None,
+            'last_date': str(values['last_date']) if values['last_date'] else None,
+        }
+        if 'trading_model_id' in group_by:
+            entry['model_name'] = model_names.get(group['trading_model_id'], 'No Model')
+        groups.append(entry)
+    return groups
+
+
+def model_equity_sparklines(user_id, points=40):
+    """Equity curve per trading model ({model_id: [values]}), from one ordered query and LTTB-downsampled."""
+    from app.models import Trade
+
+    table = Trade.__table__
+    rows = db.session.connection().execute(
+        db.select(table.c.trading_model_id, table.c.gross_pnl)
+        .where(table.c.user_id == user_id, table.c.trading_model_id.isnot(None))
+        .order_by(table.c.trading_model_id, table.c.trade_date, table.c.id)).all()
+    if not rows:
+        return {}
+    model_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    pnl = np.nan_to_num(_float_array([row[1] for row in rows]))
+    boundaries = np.flatnonzero(np.diff(model_ids)) + 1
+    sparklines = {}
+    for start, end in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(model_ids)]))):
+        equity = np.concatenate(([0.0], np.cumsum(pnl[start:end])))
+        indices = lttb_indices(np.arange(len(equity)), equity, points)
+        sparklines[int(model_ids[start])] = np.round(equity[indices], 2).tolist()
+    return sparklines
+
+
+JOURNAL_RATING_FIELDS = (
+    'mental_feeling_rating', 'mental_mind_rating', 'mental_energy_rating', 'mental_motivation_rating',
+    'review_psych_discipline_rating', 'review_psych_motivation_rating', 'review_psych_focus_rating',
+    'review_psych_mastery_rating', 'review_psych_composure_rating', 'review_psych_resilience_rating',
+    'review_psych_mind_rating', 'review_psych_energy_rating',
+)
+JOURNAL_RATING_LABELS = {
+    'mental_feeling_rating': 'Feeling (pre-market)',
+    'mental_mind_rating': 'Clarity (pre-market)',
+    'mental_energy_rating': 'Energy (pre-market)',
+    'mental_motivation_rating': 'Motivation (pre-market)',
+    'review_psych_discipline_rating': 'Discipline (review)',
+    'review_psych_motivation_rating': 'Motivation (review)',
+    'review_psych_focus_rating': 'Focus (review)',
+    'review_psych_mastery_rating': 'Mastery (review)',
+    'review_psych_composure_rating': 'Composure (review)',
+    'review_psych_resilience_rating': 'Resilience (review)',
+    'review_psych_mind_rating': 'Clarity of mind (review)',
+    'review_psych_energy_rating': 'Physical energy (review)',
+}
+JOURNAL_RATING_SCALE = 5  # Journal ratings run 1..5; anything else is ignored
+MIN_CORRELATION_DAYS = 3
+
+
+def _daily_results(user_id, start_date=None, end_date=None, trading_model_id=None, instrument=None):
+    """Per trading day, oldest first: (dates, trade counts, net P&L, summed R) as NumPy arrays.
+
+    Read from the day rollups (one indexed range query) unless both a model and an instrument are
+    filtered, which no rollup dimension covers; then the trades are grouped by day instead.
+    """
+    from app.models import PerformanceRollup, Trade
+
+    if trading_model_id and instrument:
+        table = Trade.__table__
+        query = (db.select(db.cast(table.c.trade_date, db.String), db.func.count(), db.func.sum(table.c.gross_pnl),
+                           db.func.sum(table.c.pnl_in_r))
+                 .where(table.c.user_id == user_id, table.c.trading_model_id == trading_model_id,
+                        table.c.instrument == instrument)
+                 .group_by(table.c.trade_date).order_by(table.c.trade_date))
+        date_column = table.c.trade_date
+    else:
+        table = PerformanceRollup.__table__
+        dimension, value = (('model', str(trading_model_id)) if trading_model_id else
+                            ('instrument', instrument) if instrument else ('all', ''))
+        query = (db.select(db.cast(table.c.period_start, db.String), table.c.trade_count, table.c.gross_pnl,
+                           table.c.sum_r)
+                 .where(table.c.user_id == user_id, table.c.period_type == 'day', table.c.dimension == dimension,
+                        table.c.dimension_value == value, table.c.trade_count > 0)
+                 .order_by(table.c.period_start))
+        date_column = table.c.period_start
+    if start_date:
+        query = query.where(date_column >= start_date)
+    if end_date:
+        query = query.where(date_column <= end_date)
+    rows = db.session.connection().execute(query).all()
+    cols = list(zip(*rows)) if rows else [(), (), (), ()]
+    return (np.array([str(d)[:10] for d in cols[0]], dtype='datetime64[D]'), np.array(cols[1], dtype=np.int64),
+            np.nan_to_num(_float_array(cols[2])), np.nan_to_num(_float_array(cols[3])))
+
+
+def _masked_pearson(matrix, values):
+    """Pearson r of every column of `matrix` (NaN = missing) against `values`; returns (pairs per column, r)."""
+    mask = ~np.isnan(matrix)
+    counts = mask.sum(axis=0)
+    target = np.broadcast_to(values[:, None], matrix.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_dev = np.where(mask, matrix - np.where(mask, matrix, 0.0).sum(axis=0) / counts, 0.0)
+        y_dev = np.where(mask, target - np.where(mask, target, 0.0).sum(axis=0) / counts, 0.0)
+        r = (x_dev * y_dev).sum(axis=0) / np.sqrt((x_dev ** 2).sum(axis=0) * (y_dev ** 2).sum(axis=0))
+    return counts, np.where(counts >= MIN_CORRELATION_DAYS, r, np.nan)
+
+
+def _day_group_stats(days, trades, pnl, r_sum, green):
+    """Stats of a group of trading days from its summed columns."""
+    return {
+        'days': int(days),
+        'trades': int(trades),
+        'net_pnl': _round(pnl),
+        'average_daily_pnl': _round(pnl / days) if days else None,
+        'expectancy': _round(pnl / trades) if trades else None,
+        'average_daily_r': _round(r_sum / days, 3) if days else None,
+        'green_day_rate': _round(green / days * 100, 1) if days else None,
+    }
+
+
+def journal_correlation_report(user_id, start_date=None, end_date=None, trading_model_id=None, instrument=None):
+    """Relates the daily journal ratings and P12 scenario to that day's trading results.
+
+    Journal days are joined to trading days (days without trades are left out) and every statistic is
+    computed over the joined arrays at once: the Pearson correlation of each rating with daily P&L and
+    daily R, per-rating-value (1..5) expectancy buckets, and per-P12-scenario performance.
+    """
+    from app.models import DailyJournal
+
+    journals = DailyJournal.__table__
+    query = (db.select(db.cast(journals.c.journal_date, db.String), journals.c.p12_scenario_selected,
+                       *(journals.c[field] for field in JOURNAL_RATING_FIELDS))
+             .where(journals.c.user_id == user_id).order_by(journals.c.journal_date))
+    if start_date:
+        query = query.where(journals.c.journal_date >= start_date)
+    if end_date:
+        query = query.where(journals.c.journal_date <= end_date)
+    journal_rows = db.session.connection().execute(query).all()
+    days, trade_counts, daily_pnl, daily_r = _daily_results(user_id, start_date, end_date, trading_model_id,
+                                                            instrument)
+
+    journal_dates = np.array([str(row[0])[:10] for row in journal_rows], dtype='datetime64[D]')
+    positions = np.searchsorted(days, journal_dates)
+    clipped = np.minimum(positions, max(len(days) - 1, 0))
+    matched = (positions < len(days)) & (days[clipped] == journal_dates) if len(days) else \
+        np.zeros(len(journal_dates), dtype=bool)
+    day_index = clipped[matched]
+    pnl, r_sum, trades = daily_pnl[day_index], daily_r[day_index], trade_counts[day_index]
+    green = (pnl > 0).astype(np.float64)
+    ratings = _float_array([row[2:] for row in journal_rows]).reshape(len(journal_rows),
+                                                                      len(JOURNAL_RATING_FIELDS))[matched]
+
+    pnl_pairs, pnl_r = _masked_pearson(ratings, pnl)
+    _, r_r = _masked_pearson(ratings, r_sum)
+    correlations = [{'field': field, 'days': int(pnl_pairs[i]), 'pnl_correlation': _round(pnl_r[i], 3),
+                     'r_correlation': _round(r_r[i], 3)} for i, field in enumerate(JOURNAL_RATING_FIELDS)]
+
+    # Buckets: one bincount per summed column over (field, rating value) slots
+    field_count, slots = len(JOURNAL_RATING_FIELDS), JOURNAL_RATING_SCALE + 1
+    valid = ~np.isnan(ratings) & (ratings >= 1) & (ratings <= JOURNAL_RATING_SCALE)
+    slot_index = (np.arange(field_count)[None, :] * slots + np.where(valid, ratings, 0).astype(np.int64))[valid]
+    rows_of_valid = np.nonzero(valid)[0]
+    sums = {name: np.bincount(slot_index, weights=column[rows_of_valid], minlength=field_count * slots)
+            .reshape(field_count, slots)
+            for name, column in (('pnl', pnl), ('r', r_sum), ('trades', trades.astype(np.float64)), ('green', green))}
+    day_counts = np.bincount(slot_index, minlength=field_count * slots).reshape(field_count, slots)
+    buckets = {field: [dict(rating=value, **_day_group_stats(day_counts[i, value], sums['trades'][i, value],
+                                                              sums['pnl'][i, value], sums['r'][i, value],
+                                                              sums['green'][i, value]))
+                        for value in range(1, slots) if day_counts[i, value]]
+               for i, field in enumerate(JOURNAL_RATING_FIELDS)}
+
+    scenario_codes, scenario_labels = _categorical([row[1] for row in journal_rows])
+    scenario_codes = scenario_codes[matched]
+    scenario_days = np.bincount(scenario_codes, minlength=len(scenario_labels))
+    scenario_sums = [np.bincount(scenario_codes, weights=column, minlength=len(scenario_labels))
+                     for column in (trades.astype(np.float64), pnl, r_sum, green)]
+    scenarios = [dict(scenario=label, **_day_group_stats(scenario_days[code], *(s[code] for s in scenario_sums)))
+                 for code, label in enumerate(scenario_labels) if label not in ('', 'None') and scenario_days[code]]
+    scenarios.sort(key=lambda entry: entry['net_pnl'] or 0.0, reverse=True)
+
+    return {
+        'journal_days': len(journal_rows),
+        'trading_days': int(len(days)),
+        'joined_days': int(matched.sum()),
+        'correlations': correlations,
+        'buckets': buckets,
+        'p12_scenarios': scenarios,
+        'generated_on': py_date.today().isoformat(),
+    }
@@ -3,7 +3,9 @@ from flask import (Blueprint, render_template, current_app, request,
 from flask_login import login_required, current_user
 
 from app import db
-from app.models import User, UserRole, Activity  # Ensure Activity is imported for deletion
+from app.cache import analytics_cache
+from app.models import User, UserRole, Activity, StorageUsage  # Ensure Activity is imported for deletion
+from app.storage_usage import get_storage_usage
 from app.forms import AdminCreateUserForm, AdminEditUserForm
 from app.utils import admin_required, record_activity, generate_token, send_email  # Added generate_token, send_email
 
@@ -17,13 +19,59 @@ admin_bp = Blueprint('admin', __name__,
 @admin_required
 def show_admin_dashboard():
     total_users = "N/A"
+    total_storage = None
+    cache_stats = analytics_cache.stats()
     try:
         total_users = User.query.count()
+        total_storage = db.session.query(db.func.sum(StorageUsage.bytes)).scalar() or 0
         current_app.logger.info(f"Admin {current_user.username} accessed admin dashboard.")
     except Exception as e:
         current_app.logger.error(f"Error fetching admin dashboard stats: {e}", exc_info=True)
         flash("Could not load all dashboard statistics.", "warning")
-    return render_template('dashboard.html', title='Admin Dashboard', total_users=total_users)
+    return render_template('dashboard.html', title='Admin Dashboard', total_users=total_users,
+                           total_storage=total_storage, cache_stats=cache_stats)
+
+
+@admin_bp.route('/analytics-cache/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_analytics_cache():
+    analytics_cache.clear()
+    record_activity('admin_cache_clear', f"Admin {current_user.username} cleared the analytics cache",
+                    user_id_for_activity=current_user.id)
+    flash('Analytics cache cleared.', 'success')
+    return redirect(url_for('admin.show_admin_dashboard'))
+
+
+@admin_bp.route('/files')
+@login_required
+@admin_required
+def admin_files():
+    """Storage used by every user, heaviest first, read from the StorageUsage counters (no scan of the uploads)."""
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config.get('ITEMS_PER_PAGE', 10)
+    users_pagination, usage, category_totals = None, {}, {}
+    try:
+        counters = StorageUsage.__table__
+        for category, size, count in db.session.execute(
+                db.select(counters.c.category, db.func.sum(counters.c.bytes), db.func.sum(counters.c.file_count))
+                .group_by(counters.c.category)):
+            category_totals[category] = (size or 0, count or 0)
+        user_totals = (db.select(counters.c.user_id, db.func.sum(counters.c.bytes).label('bytes'))
+                       .group_by(counters.c.user_id).subquery())
+        users_pagination = db.paginate(
+            db.select(User).outerjoin(user_totals, user_totals.c.user_id == User.id)
+            .order_by(db.func.coalesce(user_totals.c.bytes, 0).desc(), User.username.asc()),
+            page=page, per_page=per_page, error_out=False)
+        usage = get_storage_usage([user.id for user in users_pagination.items])
+        current_app.logger.info(f"Admin {current_user.username} accessed storage usage page {page}.")
+    except Exception as e:
+        current_app.logger.error(f"Error fetching storage usage for admin: {e}", exc_info=True)
+        flash("Could not load storage usage.", "danger")
+    return render_template('files.html', title='File Storage', pagination=users_pagination,
+                           users=users_pagination.items if users_pagination else [], usage=usage,
+                           categories=StorageUsage.CATEGORIES, category_totals=category_totals,
+                           quota=current_app.config['STORAGE_QUOTA_BYTES'])
 
 
 @admin_bp.route('/users')
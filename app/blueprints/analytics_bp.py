@@ -0,0 +1,194 @@
+from datetime import date as py_date, datetime as py_datetime
+
+from flask import Blueprint, render_template, request, jsonify, current_app, abort, flash
+from flask_login import login_required, current_user
+
+from app.analytics import (performance_report, calendar_heatmap, chart_series, trade_breakdown,
+                           journal_correlation_report, CHART_SERIES, BREAKDOWN_DIMENSIONS, JOURNAL_RATING_LABELS)
+from app.cache import cached_user_report, versioned_json_response
+from app.forms import TradeForm
+from app.models import TradingModel
+
+analytics_bp = Blueprint('analytics', __name__,
+                         template_folder='../templates/analytics',
+                         url_prefix='/analytics')
+
+
+def _parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return py_datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def _report_filters_from_args():
+    """Reads the shared analytics filters (date range, model, instrument) from the query string."""
+    return {
+        'start_date': _parse_date_arg('start_date'),
+        'end_date': _parse_date_arg('end_date'),
+        'trading_model_id': request.args.get('trading_model_id', type=int) or None,
+        'instrument': request.args.get('instrument') or None,
+    }
+
+
+def _cached_performance_report(filters):
+    return cached_user_report(current_user, 'performance', filters,
+                              lambda: performance_report(current_user.id, **filters))
+
+
+@analytics_bp.route('/', methods=['GET'])
+@login_required
+def performance_dashboard():
+    filters = _report_filters_from_args()
+    report = _cached_performance_report(filters)
+    models = TradingModel.query.filter_by(user_id=current_user.id).order_by(TradingModel.name).all()
+    return render_template('performance.html', title='Performance Metrics',
+                           report=report, summary=report['summary'], filters=filters,
+                           models=models, instrument_choices=TradeForm.instrument_choices[1:])
+
+
+@analytics_bp.route('/api/performance', methods=['GET'])
+@login_required
+def performance_api():
+    filters = _report_filters_from_args()
+    try:
+        return versioned_json_response(current_user, 'performance', filters,
+                                       lambda: performance_report(current_user.id, **filters))
+    except Exception as e:
+        current_app.logger.error(f"Error building performance report for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build performance report.'}), 500
+
+
+CHART_DEFAULT_POINTS = 1000
+CHART_MAX_POINTS = 5000
+
+
+@analytics_bp.route('/api/series/<string:name>', methods=['GET'])
+@login_required
+def chart_series_api(name):
+    """Columnar {"t": [...], "v": [...]} chart series, LTTB-downsampled to ?points=N (0 = every trade)."""
+    if name not in CHART_SERIES:
+        abort(404)
+    filters = _report_filters_from_args()
+    points = request.args.get('points', CHART_DEFAULT_POINTS, type=int)
+    points = 0 if points == 0 else min(max(points, 3), CHART_MAX_POINTS)
+    try:
+        return versioned_json_response(current_user, f'series:{name}', dict(filters, points=points),
+                                       lambda: chart_series(current_user.id, name, points=points, **filters))
+    except Exception as e:
+        current_app.logger.error(f"Error building '{name}' series for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build chart series.'}), 500
+
+
+BREAKDOWN_LABELS = {
+    'trading_model_id': 'Trading Model',
+    'instrument': 'Instrument',
+    'direction': 'Direction',
+    'tags': 'Tags',
+    'news_event': 'News Event',
+    'how_closed': 'How Closed',
+}
+
+
+def _breakdown_group_by_from_args():
+    """Reads ?group_by=a&group_by=b (or a comma-separated list), keeping only known dimensions in order."""
+    requested = [value for arg in request.args.getlist('group_by') for value in arg.split(',')]
+    group_by = [dimension for dimension in BREAKDOWN_DIMENSIONS if dimension in requested]
+    return group_by or ['trading_model_id']
+
+
+@analytics_bp.route('/breakdown', methods=['GET'])
+@login_required
+def trade_breakdown_view():
+    filters = _report_filters_from_args()
+    group_by = _breakdown_group_by_from_args()
+    groups = []
+    try:
+        groups = cached_user_report(current_user, 'breakdown', dict(filters, group_by=','.join(group_by)),
+                                    lambda: trade_breakdown(current_user.id, group_by, **filters))
+    except Exception as e:
+        current_app.logger.error(f"Error building trade breakdown for user {current_user.id}: {e}", exc_info=True)
+        flash("Could not build the breakdown.", "danger")
+    models = TradingModel.query.filter_by(user_id=current_user.id).order_by(TradingModel.name).all()
+    return render_template('breakdown.html', title='Breakdown', groups=groups, group_by=group_by,
+                           dimension_labels=BREAKDOWN_LABELS, filters=filters, models=models,
+                           instrument_choices=TradeForm.instrument_choices[1:])
+
+
+@analytics_bp.route('/api/breakdown', methods=['GET'])
+@login_required
+def trade_breakdown_api():
+    filters = _report_filters_from_args()
+    group_by = _breakdown_group_by_from_args()
+    try:
+        return versioned_json_response(current_user, 'breakdown_api', dict(filters, group_by=','.join(group_by)),
+                                       lambda: {'group_by': group_by,
+                                                'groups': trade_breakdown(current_user.id, group_by, **filters)})
+    except Exception as e:
+        current_app.logger.error(f"Error building trade breakdown for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build the breakdown.'}), 500
+
+
+CALENDAR_MAX_YEARS = 10
+
+
+def _calendar_range_from_args():
+    """Reads ?year=YYYY&years=N (the N years ending with YYYY); defaults to the current year."""
+    end_year = request.args.get('year', py_date.today().year, type=int)
+    years = min(max(request.args.get('years', 1, type=int), 1), CALENDAR_MAX_YEARS)
+    end_year = min(max(end_year, 1900), 9999)
+    return end_year, years, py_date(end_year - years + 1, 1, 1), py_date(end_year, 12, 31)
+
+
+@analytics_bp.route('/calendar', methods=['GET'])
+@login_required
+def pnl_calendar():
+    end_year, years, start_date, end_date = _calendar_range_from_args()
+    heatmap = cached_user_report(current_user, 'calendar', {'start': start_date, 'end': end_date},
+                                 lambda: calendar_heatmap(current_user.id, start_date, end_date))
+    return render_template('calendar.html', title='P&L Calendar', heatmap=heatmap,
+                           year=end_year, years=years, max_years=CALENDAR_MAX_YEARS)
+
+
+@analytics_bp.route('/api/calendar', methods=['GET'])
+@login_required
+def pnl_calendar_api():
+    _, _, start_date, end_date = _calendar_range_from_args()
+    try:
+        return versioned_json_response(current_user, 'calendar', {'start': start_date, 'end': end_date},
+                                       lambda: calendar_heatmap(current_user.id, start_date, end_date))
+    except Exception as e:
+        current_app.logger.error(f"Error building P&L calendar for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build P&L calendar.'}), 500
+
+
+@analytics_bp.route('/journal-correlation', methods=['GET'])
+@login_required
+def journal_correlation_view():
+    filters = _report_filters_from_args()
+    report = None
+    try:
+        report = cached_user_report(current_user, 'journal_correlation', filters,
+                                    lambda: journal_correlation_report(current_user.id, **filters))
+    except Exception as e:
+        current_app.logger.error(f"Error building journal correlation for user {current_user.id}: {e}", exc_info=True)
+        flash("Could not build the journal correlation report.", "danger")
+    models = TradingModel.query.filter_by(user_id=current_user.id).order_by(TradingModel.name).all()
+    return render_template('journal_correlation.html', title='Journal vs Performance', report=report,
+                           rating_labels=JOURNAL_RATING_LABELS, filters=filters, models=models,
+                           instrument_choices=TradeForm.instrument_choices[1:])
+
+
+@analytics_bp.route('/api/journal-correlation', methods=['GET'])
+@login_required
+def journal_correlation_api():
+    filters = _report_filters_from_args()
+    try:
+        return versioned_json_response(current_user, 'journal_correlation', filters,
+                                       lambda: journal_correlation_report(current_user.id, **filters))
+    except Exception as e:
+        current_app.logger.error(f"Error building journal correlation for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build the journal correlation report.'}), 500
@@ -1,5 +1,4 @@
 import os
-import uuid
 from flask import (Blueprint, render_template, redirect, url_for,
                    flash, request, current_app, session, abort)
 from flask_login import login_user, logout_user, login_required, current_user
@@ -13,6 +12,7 @@ from app.forms import (LoginForm, RegistrationForm, RequestPasswordResetForm,
                        ProfileForm, ChangePasswordForm)
 # Import allowed_file from utils
 from app.utils import (generate_token, verify_token, send_email, record_activity, allowed_file)
+from app.storage import new_file_path
 
 auth_bp = Blueprint('auth', __name__,
                     template_folder='../templates/auth',
@@ -250,8 +250,7 @@ def user_profile():
                         except Exception as e_del:
                             current_app.logger.error(f"Error deleting old profile pic: {e_del}")
 
-                picture_fn = uuid.uuid4().hex + file_ext
-                picture_save_path = os.path.join(current_app.config['PROFILE_PICS_SAVE_PATH'], picture_fn)
+                picture_fn, picture_save_path = new_file_path(current_app.config['PROFILE_PICS_SAVE_PATH'], file_ext)
 
                 try:
                     i = Image.open(picture_file)
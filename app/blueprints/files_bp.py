@@ -1,15 +1,18 @@
 import os
-import uuid
 from flask import (Blueprint, render_template, request, redirect, url_for,
-                   flash, current_app, send_from_directory, abort)
+                   flash, current_app, abort)
 from flask_login import login_required, current_user
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from PIL import Image # For thumbnail generation, make sure Pillow is in requirements.txt
 import io
 
 from app import db
 from app.models import File, Activity # Assuming File model is defined in app.models
+from app.file_delivery import file_content_hash, send_upload
 from app.forms import FileUploadForm # Assuming FileUploadForm is in app.forms
+from app.storage import new_file_path
+from app.storage_usage import check_storage_quota, upload_size
 # You'll need the record_activity helper, ideally from utils.py
 # For now, we can define a placeholder or copy it here temporarily if not in utils
 
@@ -54,15 +57,18 @@ def user_upload_file():
     form = FileUploadForm()
     if form.validate_on_submit():
         file_to_upload = form.file.data
-        if file_to_upload and allowed_file(file_to_upload.filename):
+        quota_error = file_to_upload and check_storage_quota(current_user.id, upload_size([file_to_upload]))
+        if quota_error:
+            flash(quota_error, 'danger')
+        elif file_to_upload and allowed_file(file_to_upload.filename):
             original_filename = secure_filename(file_to_upload.filename)
             file_ext = ''
             if '.' in original_filename:
                 file_ext = original_filename.rsplit('.', 1)[1].lower()
 
-            unique_filename = f"{uuid.uuid4().hex}.{file_ext if file_ext else 'bin'}"
-            # UPLOAD_FOLDER is now instance_path + 'uploads'
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+            # Sharded under UPLOAD_FOLDER, e.g. 3f/a9/<uuid>.pdf
+            unique_filename, file_path = new_file_path(current_app.config['UPLOAD_FOLDER'],
+                                                       f".{file_ext if file_ext else 'bin'}")
 
             try:
                 file_to_upload.save(file_path)
@@ -70,6 +76,7 @@ def user_upload_file():
                     filename=original_filename,
                     filepath=unique_filename, # Store only the unique part
                     filesize=os.path.getsize(file_path),
+                    content_hash=file_content_hash(file_path),
                     file_type=file_ext,
                     user_id=current_user.id,
                     mime_type=file_to_upload.mimetype,
@@ -101,16 +108,11 @@ def view_file(file_id):
     if not (file_record.user_id == current_user.id or getattr(current_user, 'is_admin', lambda: False)() or file_record.is_public):
         abort(403)
     try:
-        record_activity('file_view', f"Viewed: {file_record.filename}")
-        return send_from_directory(
-            current_app.config['UPLOAD_FOLDER'],
-            file_record.filepath,
-            mimetype=file_record.mime_type,
-            as_attachment=False # View in browser if possible
-        )
-    except FileNotFoundError:
-        current_app.logger.error(f"File not found on disk: {file_record.filepath}")
-        abort(404)
+        if request.range is None:  # PDF viewers fetch large files as many Range requests; log the view once
+            record_activity('file_view', f"Viewed: {file_record.filename}")
+        return send_upload(file_record, mimetype=file_record.mime_type)  # View in browser if possible
+    except HTTPException:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error viewing file {file_id}: {e}", exc_info=True)
         abort(500)
@@ -122,17 +124,13 @@ def download_file(file_id):
     if not (file_record.user_id == current_user.id or getattr(current_user, 'is_admin', lambda: False)() or file_record.is_public):
         abort(403)
     try:
-        file_record.record_access(commit=True) # Increment download count and update last_accessed
-        record_activity('file_download', f"Downloaded: {file_record.filename}")
-        return send_from_directory(
-            current_app.config['UPLOAD_FOLDER'],
-            file_record.filepath,
-            as_attachment=True,
-            download_name=file_record.filename # Use original filename for download
-        )
-    except FileNotFoundError:
-        current_app.logger.error(f"File not found on disk for download: {file_record.filepath}")
-        abort(404)
+        if request.range is None:  # Resumed downloads continue with Range requests; count the download once
+            file_record.record_access(commit=True) # Increment download count and update last_accessed
+            record_activity('file_download', f"Downloaded: {file_record.filename}")
+        # Use original filename for download
+        return send_upload(file_record, as_attachment=True, download_name=file_record.filename)
+    except HTTPException:
+        raise
     except Exception as e:
         current_app.logger.error(f"Error downloading file {file_id}: {e}", exc_info=True)
         abort(500)
@@ -1,13 +1,22 @@
 from flask import (Blueprint, render_template, request, redirect,
-                   url_for, flash, current_app, abort)
+                   url_for, flash, current_app, abort, jsonify)
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
-import uuid
 from datetime import date as py_date, datetime as py_datetime, timedelta
 
 from app import db
-from app.models import DailyJournal, DailyJournalImage, Trade
+from app.models import (DailyJournal, DailyJournalImage, MonthlyJournal, QuarterlyJournal, Trade, WeeklyJournal,
+                        YearlyJournal)
+from app.cache import versioned_json_response
+from app.file_delivery import file_content_hash, send_upload
+from app.image_derivatives import (remove_image_files, schedule_image_derivatives, variant_filepath,
+                                   DERIVATIVE_WIDTHS)
+from app.rollups import get_period_rollups, period_end
+from app.storage import new_file_path
+from app.storage_usage import check_storage_quota, upload_size
+from app.period_summaries import SUMMARY_PERIOD_TYPES, format_period, get_period_summary, parse_period
+from app.analytics import JOURNAL_RATING_LABELS
 from app.forms import DailyJournalForm  # Assuming DailyJournalForm is in app.forms
 from app.utils import record_activity  # Assuming record_activity is in app.utils
 
@@ -25,19 +34,14 @@ def _is_allowed_image(filename):
 
 
 def _handle_daily_journal_image_uploads(form, daily_journal_instance, image_field_name, image_type_tag):
-    """Helper to handle image uploads for a daily journal field."""
+    """Helper to handle image uploads for a daily journal field; returns the new DailyJournalImage rows."""
+    new_images = []
     if form[image_field_name].data:
         for image_file in form[image_field_name].data:
             if image_file and _is_allowed_image(image_file.filename):
                 original_filename = secure_filename(image_file.filename)
                 file_ext = os.path.splitext(original_filename)[1].lower()
-                unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                # Consider a subfolder for journal images:
-                # journal_image_upload_folder = os.path.join(upload_folder, 'daily_journal_images')
-                # if not os.path.exists(journal_image_upload_folder): os.makedirs(journal_image_upload_folder)
-                # file_path = os.path.join(journal_image_upload_folder, unique_filename)
-                file_path = os.path.join(upload_folder, unique_filename)  # Using main UPLOAD_FOLDER for now
+                unique_filename, file_path = new_file_path(current_app.config['UPLOAD_FOLDER'], file_ext)
 
                 try:
                     image_file.save(file_path)
@@ -47,10 +51,12 @@ def _handle_daily_journal_image_uploads(form, daily_journal_instance, image_fiel
                         filename=original_filename,
                         filepath=unique_filename,
                         filesize=os.path.getsize(file_path),
+                        content_hash=file_content_hash(file_path),
                         mime_type=image_file.mimetype,
                         image_type=image_type_tag
                     )
                     db.session.add(dj_image)
+                    new_images.append(dj_image)
                 except Exception as e_save:
                     current_app.logger.error(
                         f"Failed to save journal image {original_filename} for journal {daily_journal_instance.id}: {e_save}",
@@ -58,6 +64,47 @@ def _handle_daily_journal_image_uploads(form, daily_journal_instance, image_fiel
                     flash(f"Could not save image: {original_filename}", "warning")
             elif image_file:
                 flash(f"Image type not allowed for journal image: {image_file.filename}", "warning")
+    return new_images
+
+
+PSYCH_SCORECARD_FIELDS = (
+    ("Discipline", 'review_psych_discipline_rating'), ("Motivation", 'review_psych_motivation_rating'),
+    ("Focus", 'review_psych_focus_rating'), ("Mastery", 'review_psych_mastery_rating'),
+    ("Composure", 'review_psych_composure_rating'), ("Resilience", 'review_psych_resilience_rating'),
+    ("Mind", 'review_psych_mind_rating'), ("Energy", 'review_psych_energy_rating'),
+)
+
+
+def _psych_scorecard(user_id, target_date):
+    """The day's review psych ratings as columnar chart data: {'t': labels, 'v': ratings (None if unrated)}."""
+    columns = [getattr(DailyJournal, field) for _, field in PSYCH_SCORECARD_FIELDS]
+    row = db.session.execute(db.select(*columns).where(DailyJournal.user_id == user_id,
+                                                       DailyJournal.journal_date == target_date)).first()
+    return {'t': [label for label, _ in PSYCH_SCORECARD_FIELDS],
+            'v': list(row) if row else [None] * len(PSYCH_SCORECARD_FIELDS)}
+
+
+@journal_bp.route('/daily/<string:date_str>/psych.json', methods=['GET'])
+@login_required
+def daily_psych_data(date_str):
+    try:
+        target_date = py_datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        abort(404)
+    return versioned_json_response(current_user, 'psych_scorecard', {'date': target_date},
+                                   lambda: _psych_scorecard(current_user.id, target_date))
+
+
+@journal_bp.route('/images/<int:image_id>/<string:variant>', methods=['GET'])
+@login_required
+def daily_journal_image(image_id, variant):
+    """Serves one rendition ('original', 'medium' or 'thumbnail') of the user's journal screenshot."""
+    if variant != 'original' and variant not in DERIVATIVE_WIDTHS:
+        abort(404)
+    image = db.get_or_404(DailyJournalImage, image_id)
+    if image.user_id != current_user.id:
+        abort(403)
+    return send_upload(image, variant_filepath(image, variant), variant=None if variant == 'original' else variant)
 
 
 @journal_bp.route('/daily', methods=['GET'])
@@ -99,25 +146,28 @@ def manage_daily_journal(date_str=None):
         try:
             db.session.flush()  # To get daily_journal.id if it's new
 
-            # Handle image uploads
-            _handle_daily_journal_image_uploads(form, daily_journal, 'pre_market_screenshots', 'pre_market')
-            _handle_daily_journal_image_uploads(form, daily_journal, 'eod_chart_screenshots', 'eod_chart')
-
-            # Handle deletion of existing images (if checkboxes are added to the form)
+            # Handle deletion of existing images first, so the space they free counts towards the uploads
             if daily_journal.id:  # Only if journal entry exists
                 for image in daily_journal.images:
                     if request.form.get(f'delete_dj_image_{image.id}'):
-                        if image.filepath:
-                            try:
-                                image_path_to_delete = os.path.join(current_app.config['UPLOAD_FOLDER'], image.filepath)
-                                if os.path.exists(image_path_to_delete):
-                                    os.remove(image_path_to_delete)
-                            except OSError:
-                                current_app.logger.warning(
-                                    f"Could not delete daily journal image file on disk: {image.filepath}")
+                        remove_image_files(image)
                         db.session.delete(image)
 
+            # Handle image uploads, refusing them all up front if they would exceed the storage quota
+            new_images = []
+            quota_error = check_storage_quota(current_user.id, upload_size(
+                image_file for field in ('pre_market_screenshots', 'eod_chart_screenshots')
+                for image_file in form[field].data or [] if image_file and _is_allowed_image(image_file.filename)))
+            if quota_error:
+                flash(quota_error, 'warning')
+            else:
+                new_images = _handle_daily_journal_image_uploads(form, daily_journal, 'pre_market_screenshots',
+                                                                 'pre_market')
+                new_images += _handle_daily_journal_image_uploads(form, daily_journal, 'eod_chart_screenshots',
+                                                                  'eod_chart')
+
             db.session.commit()
+            schedule_image_derivatives(new_images)
             record_activity('daily_journal_save',
                             f"Daily journal for {target_date.strftime('%Y-%m-%d')} {action_desc}.")
             flash(f'Daily journal for {target_date.strftime("%d-%b-%Y")} has been {action_desc}!', 'success')
@@ -134,24 +184,9 @@ def manage_daily_journal(date_str=None):
     trades_for_day = Trade.query.filter_by(user_id=current_user.id, trade_date=target_date) \
         .order_by(Trade.id.asc()).all()
 
-    # Calculate cumulative PNL for the day
-    cumulative_daily_pnl = sum(trade.gross_pnl for trade in trades_for_day if trade.gross_pnl is not None)
-
-    # Prepare data for psych scorecard radar chart
-    # The DailyJournal model has review_psych_..._rating fields for the day, and an average_review_psych_rating property.
-    psych_labels = ["Discipline", "Motivation", "Focus", "Mastery", "Composure", "Resilience", "Mind", "Energy"]
-    psych_values = [
-        daily_journal.review_psych_discipline_rating if daily_journal else None,
-        daily_journal.review_psych_motivation_rating if daily_journal else None,
-        daily_journal.review_psych_focus_rating if daily_journal else None,
-        daily_journal.review_psych_mastery_rating if daily_journal else None,
-        daily_journal.review_psych_composure_rating if daily_journal else None,
-        daily_journal.review_psych_resilience_rating if daily_journal else None,
-        daily_journal.review_psych_mind_rating if daily_journal else None,
-        daily_journal.review_psych_energy_rating if daily_journal else None,
-    ]
-    # Filter out None values if chart library requires it, or handle in JS
-    valid_psych_values = [v if v is not None else 0 for v in psych_values]  # Default to 0 for chart if None
+    # Day, week-, month-, quarter- and year-to-date totals come straight from the rollup rows
+    period_rollups = get_period_rollups(current_user.id, target_date)
+    cumulative_daily_pnl = period_rollups['day'].gross_pnl if period_rollups['day'] else 0.0
 
     # Previous and next day for navigation
     prev_day = target_date - timedelta(days=1)
@@ -164,8 +199,89 @@ def manage_daily_journal(date_str=None):
                            journal_date=target_date,
                            trades_for_day=trades_for_day,
                            cumulative_daily_pnl=cumulative_daily_pnl,
-                           psych_labels=psych_labels,
-                           psych_values=valid_psych_values,  # Pass processed values for chart
+                           period_rollups=period_rollups,
                            prev_day_str=prev_day.strftime('%Y-%m-%d'),
                            next_day_str=next_day.strftime('%Y-%m-%d'),
-                           today_str=py_date.today().strftime('%Y-%m-%d'))
\ No newline at end of file
+                           today_str=py_date.today().strftime('%Y-%m-%d'))
+
+# --- Period reviews: the weekly/monthly/quarterly/yearly journal text next to the period's summary ---
+PERIOD_LABELS = {'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly', 'year': 'Yearly'}
+
+
+def _period_journal(period_type, start):
+    """The user's free-text journal of the period, or None."""
+    filters = {'user_id': current_user.id, 'year': start.year}
+    if period_type == 'week':
+        model = WeeklyJournal
+        filters['year'], filters['week_number'] = start.isocalendar()[:2]
+    elif period_type == 'month':
+        model, filters['month'] = MonthlyJournal, start.month
+    elif period_type == 'quarter':
+        model, filters['quarter'] = QuarterlyJournal, (start.month - 1) // 3 + 1
+    else:
+        model = YearlyJournal
+    return model.query.filter_by(**filters).first()
+
+
+def _review_period_or_404(period_type, period):
+    start = parse_period(period_type, period) if period_type in SUMMARY_PERIOD_TYPES else None
+    if start is None:
+        abort(404)
+    return start
+
+
+@journal_bp.route('/review/<string:period_type>', methods=['GET'])
+@login_required
+def current_period_review(period_type):
+    """Redirects to the review of the period containing ?date= (default today)."""
+    if period_type not in SUMMARY_PERIOD_TYPES:
+        abort(404)
+    try:
+        day = py_datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') \
+            else py_date.today()
+    except ValueError:
+        day = py_date.today()
+    return redirect(url_for('journal.period_review', period_type=period_type,
+                            period=format_period(period_type, day)))
+
+
+@journal_bp.route('/review/<string:period_type>/<string:period>', methods=['GET'])
+@login_required
+def period_review(period_type, period):
+    start = _review_period_or_404(period_type, period)
+    try:
+        summary = get_period_summary(current_user.id, period_type, start)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error building {period_type} summary {period} for user {current_user.id}: {e}",
+                                 exc_info=True)
+        flash('Could not build the performance summary for this period.', 'danger')
+        summary = None
+    journal = _period_journal(period_type, start)
+    journal_sections = []
+    if journal is not None:
+        for column in journal.__table__.columns:
+            value = getattr(journal, column.name)
+            if isinstance(column.type, db.Text) and value and value.strip():
+                journal_sections.append((column.name.replace('_', ' ').capitalize(), value))
+    end = period_end(period_type, start)
+    return render_template('journal/period_review.html',
+                           title=f"{PERIOD_LABELS[period_type]} Review - {period}",
+                           period_type=period_type, period=period, start=start, end=end,
+                           summary=summary, journal_sections=journal_sections,
+                           rating_labels=JOURNAL_RATING_LABELS,
+                           prev_period=format_period(period_type, start - timedelta(days=1)),
+                           next_period=format_period(period_type, end + timedelta(days=1)))
+
+
+@journal_bp.route('/review/<string:period_type>/<string:period>/summary.json', methods=['GET'])
+@login_required
+def period_summary_data(period_type, period):
+    start = _review_period_or_404(period_type, period)
+    try:
+        return jsonify({'status': 'success', 'summary': get_period_summary(current_user.id, period_type, start)})
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error building {period_type} summary {period} for user {current_user.id}: {e}",
+                                 exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Could not build the period summary.'}), 500
@@ -1,6 +1,9 @@
+from datetime import date as py_date
+
 from flask import Blueprint, render_template
 from flask_login import login_required, current_user
 from app.models import Activity # Import the Activity model
+from app.rollups import get_period_rollups
 
 main_bp = Blueprint('main', __name__,
                     template_folder='../templates/main')
@@ -9,5 +12,7 @@ main_bp = Blueprint('main', __name__,
 @main_bp.route('/index') # You can have multiple routes for the same function
 @login_required
 def index():
+    # Current day/week/month/year P&L, read from the rollup table (one small query, no trade scan)
+    period_rollups = get_period_rollups(current_user.id, py_date.today(), period_types=('day', 'week', 'month', 'year'))
     # Pass the Activity model to the template context so it can be used for ordering
-    return render_template('index.html', title="Dashboard", Activity=Activity)
\ No newline at end of file
+    return render_template('index.html', title="Dashboard", Activity=Activity, period_rollups=period_rollups)
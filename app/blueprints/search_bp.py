@@ -0,0 +1,100 @@
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for
+from flask_login import login_required, current_user
+
+from app import db
+from app.search import SEARCH_KINDS, search_documents
+
+search_bp = Blueprint('search', __name__,
+                      template_folder='../templates/search',
+                      url_prefix='/search')
+
+SEARCH_PAGE_SIZE = 20
+KIND_LABELS = {
+    'trade': 'Trades',
+    'daily_journal': 'Daily Journals',
+    'weekly_journal': 'Weekly Journals',
+    'monthly_journal': 'Monthly Journals',
+    'quarterly_journal': 'Quarterly Journals',
+    'yearly_journal': 'Yearly Journals',
+    'trading_model': 'Trading Models',
+}
+
+
+def _hit_title_and_url(kind, row):
+    if kind == 'trade':
+        return (f"{row.trade_date.strftime('%d %b %Y')} · {row.instrument} {row.direction}",
+                url_for('trades.view_trade_detail', trade_id=row.id))
+    if kind == 'daily_journal':
+        return (f"Daily Journal · {row.journal_date.strftime('%d %b %Y')}",
+                url_for('journal.manage_daily_journal', date_str=row.journal_date.strftime('%Y-%m-%d')))
+    if kind == 'trading_model':
+        return row.name, url_for('trading_models.edit_trading_model', model_id=row.id)
+    if kind == 'weekly_journal':
+        return f"Weekly Journal · week of {row.week_start_date_display}", None
+    if kind == 'monthly_journal':
+        return f"Monthly Journal · {row.month_year_display}", None
+    if kind == 'quarterly_journal':
+        return f"Quarterly Journal · {row.quarter_display_name} {row.year}", None
+    return f"Yearly Journal · {row.year}", None
+
+
+def _describe_hits(hits):
+    """Title and link of each hit; the source rows are loaded with one query per kind on the page."""
+    ids_by_kind = {}
+    for hit in hits:
+        ids_by_kind.setdefault(hit.kind, []).append(hit.source_id)
+    rows = {}
+    for kind, ids in ids_by_kind.items():
+        model = SEARCH_KINDS[kind][1]
+        for row in db.session.execute(db.select(model).where(model.id.in_(ids),
+                                                             model.user_id == current_user.id)).scalars():
+            rows[kind, row.id] = row
+    results = []
+    for hit in hits:
+        row = rows.get((hit.kind, hit.source_id))
+        if row is None:
+            continue
+        title, url = _hit_title_and_url(hit.kind, row)
+        results.append({'kind': hit.kind, 'kind_label': KIND_LABELS[hit.kind], 'id': hit.source_id,
+                        'title': title, 'url': url, 'snippet_html': hit.snippet})
+    return results
+
+
+def _run_search():
+    """Runs the search described by the query string; returns (query, kinds, page, results, has_more)."""
+    query = (request.args.get('q') or '').strip()
+    kinds = [kind for kind in request.args.getlist('kind') if kind in SEARCH_KINDS]
+    page = max(request.args.get('page', 1, type=int), 1)
+    if not query:
+        return query, kinds, page, [], False
+    hits, has_more = search_documents(current_user.id, query, kinds=kinds, limit=SEARCH_PAGE_SIZE,
+                                      offset=(page - 1) * SEARCH_PAGE_SIZE)
+    return query, kinds, page, _describe_hits(hits), has_more
+
+
+@search_bp.route('/', methods=['GET'])
+@login_required
+def search_page():
+    try:
+        query, kinds, page, results, has_more = _run_search()
+    except Exception as e:
+        current_app.logger.error(f"Search failed for user {current_user.id}: {e}", exc_info=True)
+        query, kinds, page, results, has_more = request.args.get('q', ''), [], 1, [], False
+        db.session.rollback()
+    return render_template('search.html', title='Search', query=query, kinds=kinds, page=page,
+                           results=results, has_more=has_more, kind_labels=KIND_LABELS)
+
+
+@search_bp.route('/api', methods=['GET'])
+@login_required
+def search_api():
+    try:
+        query, kinds, page, results, has_more = _run_search()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Search failed for user {current_user.id}: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Search failed.'}), 500
+    for result in results:
+        result['snippet_html'] = str(result['snippet_html'])
+    return jsonify({'status': 'success', 'query': query, 'kinds': kinds, 'page': page,
+                    'has_more': has_more, 'results': results})
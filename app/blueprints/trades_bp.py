@@ -1,15 +1,32 @@
 from flask import (Blueprint, render_template, request, redirect,
-                   url_for, flash, current_app, Response, abort)
+                   url_for, flash, current_app, Response, abort, stream_with_context, send_from_directory,
+                   jsonify)
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 import os
-import uuid
+import re
 import csv
 import io
+import json
+import math
+import zlib
+import base64
 from datetime import date as py_date, datetime as py_datetime, time as py_time
 
 from app import db
-from app.models import Trade, EntryPoint, ExitPoint, TradingModel, NewsEventItem, TradeImage
+from app.cache import cached_user_report
+from app.columnar_export import FORMATS as COLUMNAR_FORMATS, stream_export_archive
+from app.file_cleanup import queue_file_removals, schedule_file_sweep
+from app.file_delivery import file_content_hash, send_upload
+from app.image_derivatives import (image_filepaths_select, remove_image_files, schedule_image_derivatives,
+                                   variant_filepath, DERIVATIVE_WIDTHS)
+from app.import_jobs import (IMPORT_JOBS_KEPT, cancel_import_job, create_import_job, create_retry_job,
+                             import_reports_dir, submit_import_job)
+from app.models import (Trade, EntryPoint, ExitPoint, TradingModel, NewsEventItem, TradeImage, Tag, TradeTag,
+                        ImportJob, bump_data_version)
+from app.rollups import remove_deleted_trades, rollup_rows_for_trades
+from app.storage import new_file_path
+from app.storage_usage import check_storage_quota, remove_deleted_uploads, upload_size
 from app.forms import TradeForm, EntryPointForm, ExitPointForm, TradeFilterForm, ImportTradesForm
 from app.utils import (_parse_form_float, _parse_form_int, _parse_form_time,
                        get_news_event_options, record_activity)
@@ -32,7 +49,30 @@ def _is_allowed_image(filename):
                                                                      {'png', 'jpg', 'jpeg', 'gif'})
 
 
+def _uploadable_images(image_files):
+    """The submitted images to save, or none (with a warning) when they would exceed the storage quota."""
+    image_files = [image_file for image_file in image_files or [] if image_file]
+    quota_error = check_storage_quota(current_user.id, upload_size(
+        image_file for image_file in image_files if _is_allowed_image(image_file.filename)))
+    if quota_error:
+        flash(quota_error, 'warning')
+        return []
+    return image_files
+
+
+def _tag_choices(with_counts=False):
+    """The predefined tags plus the user's own, optionally labelled with how many trades carry each."""
+    counts = Tag.counts_for_user(current_user.id)
+    choices = list(TradeForm.SIMPLE_TAG_CHOICES[1:])
+    predefined = {value for value, _ in choices}
+    choices += [(name, name) for name in sorted(counts) if name not in predefined]
+    if with_counts:
+        choices = [(value, f"{label} ({counts.get(value, 0)})") for value, label in choices]
+    return choices
+
+
 def _populate_trade_form_choices(form):
+    form.tags.choices = _tag_choices()
     form.trading_model_id.choices = [(0, '-- Select Model --')] + \
                                     [(tm.id, tm.name) for tm in
                                      TradingModel.query.filter_by(user_id=current_user.id, is_active=True).order_by(
@@ -53,47 +93,214 @@ def _populate_filter_form_choices(filter_form):
         filter_form.instrument.choices = [('', 'All Instruments')] + TradeForm.instrument_choices[1:]
     if hasattr(TradeForm, 'direction_choices'):
         filter_form.direction.choices = [('', 'All Directions')] + TradeForm.direction_choices[1:]
-    if hasattr(TradeForm, 'SIMPLE_TAG_CHOICES'):
-        filter_form.tags.choices = [('', 'All Tags')] + TradeForm.SIMPLE_TAG_CHOICES[1:]
+    filter_form.tags.choices = filter_form.exclude_tags.choices = _tag_choices(with_counts=True)
     return filter_form
 
 
+# Sortable columns for the trades list; all are indexed together with user_id.
+TRADE_SORT_COLUMNS = {
+    'date': Trade.trade_date,
+    'pnl': Trade.gross_pnl,
+    'r': Trade.pnl_in_r,
+    'duration': Trade.time_in_trade_seconds,
+}
+
+
+def _apply_tag_filters(query, tag_names, tag_mode='any', exclude_tag_names=None):
+    """Restricts a Trade query by tags: any (OR) / all (AND) of `tag_names`, and none of `exclude_tag_names`.
+
+    Each condition is a semi-join on trade_tag served by the (user_id, tag_id, trade_id) index.
+    """
+    names = set(tag_names or []) | set(exclude_tag_names or [])
+    tag_ids = dict(db.session.execute(db.select(Tag.name, Tag.id)
+                                      .where(Tag.user_id == current_user.id, Tag.name.in_(names))).all()) if names else {}
+    if tag_names:
+        wanted = [tag_ids[name] for name in tag_names if name in tag_ids]
+        if tag_mode == 'all' and len(wanted) < len(set(tag_names)):
+            return query.filter(db.false())  # A requested tag doesn't exist, so no trade can carry all of them
+        matching = db.select(TradeTag.trade_id).where(TradeTag.user_id == current_user.id,
+                                                       TradeTag.tag_id.in_(wanted))
+        if tag_mode == 'all':
+            matching = matching.group_by(TradeTag.trade_id).having(
+                db.func.count(TradeTag.tag_id) == len(set(wanted)))
+        query = query.filter(Trade.id.in_(matching))
+    excluded = [tag_ids[name] for name in exclude_tag_names or [] if name in tag_ids]
+    if excluded:
+        query = query.filter(Trade.id.notin_(
+            db.select(TradeTag.trade_id).where(TradeTag.user_id == current_user.id, TradeTag.tag_id.in_(excluded))))
+    return query
+
+
+def _apply_trade_filters(query, filter_form):
+    """Applies the TradeFilterForm criteria to a Trade query as SQL over the materialized metric columns."""
+    if filter_form.start_date.data:
+        query = query.filter(Trade.trade_date >= filter_form.start_date.data)
+    if filter_form.end_date.data:
+        query = query.filter(Trade.trade_date <= filter_form.end_date.data)
+    if filter_form.instrument.data:
+        query = query.filter(Trade.instrument == filter_form.instrument.data)
+    if filter_form.direction.data:
+        query = query.filter(Trade.direction == filter_form.direction.data)
+    if filter_form.trading_model_id.data and filter_form.trading_model_id.data != 0:
+        query = query.filter(Trade.trading_model_id == filter_form.trading_model_id.data)
+    if filter_form.tags.data or filter_form.exclude_tags.data:
+        query = _apply_tag_filters(query, filter_form.tags.data, filter_form.tag_mode.data,
+                                   filter_form.exclude_tags.data)
+    if filter_form.min_pnl.data is not None:
+        query = query.filter(Trade.gross_pnl >= filter_form.min_pnl.data)
+    if filter_form.max_pnl.data is not None:
+        query = query.filter(Trade.gross_pnl <= filter_form.max_pnl.data)
+    if filter_form.min_r.data is not None:
+        query = query.filter(Trade.pnl_in_r >= filter_form.min_r.data)
+    if filter_form.max_r.data is not None:
+        query = query.filter(Trade.pnl_in_r <= filter_form.max_r.data)
+    if filter_form.outcome.data == 'win':
+        query = query.filter(Trade.gross_pnl > 0)
+    elif filter_form.outcome.data == 'loss':
+        query = query.filter(Trade.gross_pnl < 0)
+    elif filter_form.outcome.data == 'breakeven':
+        query = query.filter(Trade.gross_pnl == 0, Trade.total_contracts_exited > 0)
+    if filter_form.min_duration.data is not None:
+        query = query.filter(Trade.time_in_trade_seconds >= filter_form.min_duration.data * 60)
+    if filter_form.max_duration.data is not None:
+        query = query.filter(Trade.time_in_trade_seconds <= filter_form.max_duration.data * 60)
+    if filter_form.status.data == 'open':
+        query = query.filter(Trade.is_open)
+    elif filter_form.status.data == 'closed':
+        query = query.filter(db.not_(Trade.is_open))
+    return query
+
+
+def _apply_trade_sort(query, sort_by, sort_dir):
+    column = TRADE_SORT_COLUMNS.get(sort_by, Trade.trade_date)
+    if sort_dir == 'asc':
+        return query.order_by(column.asc().nulls_last(), Trade.id.asc())
+    return query.order_by(column.desc().nulls_last(), Trade.id.desc())
+
+
+# --- Keyset pagination ---
+# Pages are addressed by the (sort value, id) of the row they start after / end before, so every page
+# is an index seek plus LIMIT, however deep it is; there is no OFFSET and no per-page COUNT(*).
+def _encode_cursor(value, trade_id):
+    if isinstance(value, py_date):
+        value = value.isoformat()
+    payload = json.dumps([value, trade_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token, column):
+    """(value, trade_id) from a cursor token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        value, trade_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if value is not None and column is Trade.trade_date:
+            value = py_date.fromisoformat(value)
+        return value, int(trade_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _seek_segments(column, descending, nulls_last, value, trade_id):
+    """Conditions selecting the rows strictly after (value, trade_id) in ORDER BY column, id.
+
+    Each condition is a single range on the (user_id, column) index, listed in scan order; the block of
+    NULL sort values is its own segment so that no condition needs an OR (which would defeat the seek).
+    """
+    ahead = (lambda a, b: a < b) if descending else (lambda a, b: a > b)
+    if value is None:  # The cursor sits inside the block of NULL sort values
+        segments = [db.and_(column.is_(None), ahead(Trade.id, trade_id))]
+        return segments if nulls_last else segments + [column.isnot(None)]
+    segments = [ahead(db.tuple_(column, Trade.id), db.tuple_(value, trade_id))]
+    if nulls_last and column.nullable:
+        segments.append(column.is_(None))
+    return segments
+
+
+def _keyset_page(query, sort_by, sort_dir, per_page, after=None, before=None):
+    """One page of `query` in the list's sort order (column, then id; NULLs last), seeking from a cursor.
+
+    Returns (trades, next_cursor, prev_cursor); a cursor is None when there is nothing further that way.
+    """
+    column = TRADE_SORT_COLUMNS.get(sort_by, Trade.trade_date)
+    descending = sort_dir != 'asc'
+    backwards = before is not None and after is None
+    cursor = _decode_cursor(before if backwards else after, column)
+    # Paging backwards walks the reversed order (NULLs first) and flips the rows afterwards
+    scan_descending = descending != backwards
+    if scan_descending:
+        order = [column.desc().nulls_first() if backwards else column.desc().nulls_last(), Trade.id.desc()]
+    else:
+        order = [column.asc().nulls_first() if backwards else column.asc().nulls_last(), Trade.id.asc()]
+    segments = _seek_segments(column, scan_descending, not backwards, *cursor) if cursor else [db.true()]
+    rows = []
+    for condition in segments:
+        rows += query.filter(condition).order_by(*order).limit(per_page + 1 - len(rows)).all()
+        if len(rows) > per_page:
+            break
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    next_cursor = _encode_cursor(getattr(last, column.key), last.id) if (backwards or has_more) else None
+    prev_cursor = (_encode_cursor(getattr(first, column.key), first.id)
+                   if ((has_more if backwards else cursor is not None)) else None)
+    return rows, next_cursor, prev_cursor
+
+
+def _trade_list_count(query, filter_args):
+    """Total rows for the filtered list; cached per user, filter set and data version (None when disabled)."""
+    if not current_app.config.get('TRADES_LIST_EXACT_COUNT', True):
+        return None
+    return cached_user_report(current_user, 'trade_list_count', filter_args,
+                              lambda: query.order_by(None).count())
+
+
 # --- VIEW TRADES LIST ---
 @trades_bp.route('/', methods=['GET'])
 @login_required
 def view_trades_list():
-    # MODIFIED: Removed meta={'csrf': False} to enable the CSRF field on this form
-    filter_form = TradeFilterForm(request.args)
+    # GET filter form: CSRF is not needed for a read-only query string
+    filter_form = TradeFilterForm(request.args, meta={'csrf': False})
     _populate_filter_form_choices(filter_form)
 
     query = Trade.query.filter_by(user_id=current_user.id)
 
     # This validation is for GET requests so it's a bit different, but WTForms can handle it.
     if filter_form.validate():
-        if filter_form.start_date.data:
-            query = query.filter(Trade.trade_date >= filter_form.start_date.data)
-        if filter_form.end_date.data:
-            query = query.filter(Trade.trade_date <= filter_form.end_date.data)
-        if filter_form.instrument.data:
-            query = query.filter(Trade.instrument == filter_form.instrument.data)
-        if filter_form.direction.data:
-            query = query.filter(Trade.direction == filter_form.direction.data)
-        if filter_form.trading_model_id.data and filter_form.trading_model_id.data != 0:
-            query = query.filter(Trade.trading_model_id == filter_form.trading_model_id.data)
-        if filter_form.tags.data:
-            query = query.filter(Trade.tags == filter_form.tags.data)
-
-    page = request.args.get('page', 1, type=int)
-    per_page = current_app.config.get('PER_PAGE_TRADES', 10)
+        query = _apply_trade_filters(query, filter_form)
 
-    trades_pagination = query.order_by(Trade.trade_date.desc(), Trade.id.desc()).paginate(page=page, per_page=per_page,
-                                                                                          error_out=False)
+    per_page = current_app.config.get('PER_PAGE_TRADES', 10)
+    page = max(request.args.get('page', 1, type=int), 1)  # Display only; the cursor decides which rows load
+    after, before = request.args.get('after'), request.args.get('before')
+    if not (after or before):
+        page = 1
+    trades, next_cursor, prev_cursor = _keyset_page(query, filter_form.sort_by.data, filter_form.sort_dir.data,
+                                                    per_page, after=after, before=before)
+
+    # Everything except the cursor, page number and sort order identifies the filtered set
+    filter_args = {key: ','.join(values) for key, values in request.args.lists()
+                   if key not in ('after', 'before', 'page', 'sort_by', 'sort_dir')}
+    total = _trade_list_count(query, filter_args)
+    pager = {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': math.ceil(total / per_page) if total is not None else None,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'args': {key: values for key, values in request.args.lists() if key not in ('after', 'before', 'page')},
+    }
 
     # MODIFIED: No longer need to generate and pass the CSRF token manually
     return render_template("trades/view_trades_list.html",
                            title="Trades List",
-                           trades=trades_pagination.items,
-                           pagination=trades_pagination,
+                           trades=trades,
+                           pager=pager,
                            filter_form=filter_form)  # Pass the filter_form which contains the CSRF token
 
 
@@ -117,7 +324,6 @@ def add_trade():
         try:
             instrument = form.instrument.data
             point_value_for_trade = INSTRUMENT_POINT_VALUES.get(instrument, 1.0)
-            tag_value = form.tags.data if form.tags.data and form.tags.data != '' else None
 
             new_trade = Trade(user_id=current_user.id)
 
@@ -147,13 +353,14 @@ def add_trade():
 
             # Set specific fields
             new_trade.point_value = point_value_for_trade
-            new_trade.tags = tag_value
+            new_trade.tags = form.tags.data
             new_trade.trading_model_id = form.trading_model_id.data if form.trading_model_id.data and form.trading_model_id.data != 0 else None
             new_trade.news_event = form.news_event_select.data if form.news_event_select.data else None
 
             db.session.add(new_trade)
             db.session.flush()
 
+            new_entries, new_exits = [], []
             for entry_data in form.entries.data:
                 if entry_data.get('entry_time') and entry_data.get('contracts') is not None and entry_data.get(
                         'entry_price') is not None:
@@ -164,6 +371,7 @@ def add_trade():
                         entry_price=entry_data['entry_price']
                     )
                     db.session.add(entry)
+                    new_entries.append(entry)
 
             for exit_data in form.exits.data:
                 if exit_data.get('exit_time') and exit_data.get('contracts') is not None and exit_data.get(
@@ -175,28 +383,30 @@ def add_trade():
                         exit_price=exit_data['exit_price']
                     )
                     db.session.add(exit_point)
+                    new_exits.append(exit_point)
                 elif any(val for key, val in exit_data.items() if key != 'id' and val is not None and val != ''):
                     flash(
                         f"An exit for trade was partially filled and not saved. Please provide all of time, contracts, and price for a complete exit log.",
                         "warning")
 
-            if form.trade_images.data:
-                for image_file in form.trade_images.data:
+            new_images = []
+            image_files = _uploadable_images(form.trade_images.data)  # Checked against the quota up front
+            if image_files:
+                for image_file in image_files:
                     if image_file and _is_allowed_image(image_file.filename):
                         original_filename = secure_filename(image_file.filename)
                         file_ext = os.path.splitext(original_filename)[1].lower()
-                        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-                        upload_folder = current_app.config['UPLOAD_FOLDER']
-                        if not os.path.exists(upload_folder): os.makedirs(upload_folder)
-                        file_path = os.path.join(upload_folder, unique_filename)
+                        unique_filename, file_path = new_file_path(current_app.config['UPLOAD_FOLDER'], file_ext)
                         try:
                             image_file.save(file_path)
                             trade_image = TradeImage(
                                 trade_id=new_trade.id, user_id=current_user.id, filename=original_filename,
                                 filepath=unique_filename, filesize=os.path.getsize(file_path),
+                                content_hash=file_content_hash(file_path),
                                 mime_type=image_file.mimetype
                             )
                             db.session.add(trade_image)
+                            new_images.append(trade_image)
                         except Exception as e_save:
                             current_app.logger.error(
                                 f"Failed to save image {original_filename} for trade {new_trade.id}: {e_save}",
@@ -205,7 +415,9 @@ def add_trade():
                     elif image_file:
                         flash(f"Image type not allowed for file: {image_file.filename}", "warning")
 
+            new_trade.recalculate_metrics(entries=new_entries, exits=new_exits)
             db.session.commit()
+            schedule_image_derivatives(new_images)
             record_activity('trade_logged', f"Logged new trade ID: {new_trade.id} for {new_trade.instrument}")
             flash(
                 f'Trade for {new_trade.instrument} on {new_trade.trade_date.strftime("%Y-%m-%d")} logged successfully!',
@@ -234,6 +446,18 @@ def view_trade_detail(trade_id):
     return render_template('trades/view_trade_detail.html', title="Trade Details", trade=trade)
 
 
+@trades_bp.route('/images/<int:image_id>/<string:variant>')
+@login_required
+def trade_image(image_id, variant):
+    """Serves one rendition ('original', 'medium' or 'thumbnail') of the user's trade screenshot."""
+    if variant != 'original' and variant not in DERIVATIVE_WIDTHS:
+        abort(404)
+    image = db.get_or_404(TradeImage, image_id)
+    if image.user_id != current_user.id:
+        abort(403)
+    return send_upload(image, variant_filepath(image, variant), variant=None if variant == 'original' else variant)
+
+
 # --- EDIT TRADE ---
 @trades_bp.route('/<int:trade_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -292,94 +516,49 @@ def edit_trade(trade_id):
             trade_to_edit.errors_notes = form.errors_notes.data
             trade_to_edit.improvements_notes = form.improvements_notes.data
             trade_to_edit.screenshot_link = form.screenshot_link.data
-            trade_to_edit.tags = form.tags.data if form.tags.data and form.tags.data != '' else None
-
-            # Handle Entries: Update existing, Add new, Delete removed
-            current_entry_ids_in_db = {entry.id for entry in trade_to_edit.entries}
-            submitted_entry_ids = set()
-            new_entries_to_add = []
-
-            for entry_form_data in form.entries.data:
-                entry_id = entry_form_data.get('id')
-                if entry_form_data.get('entry_time') and entry_form_data.get(
-                        'contracts') is not None and entry_form_data.get('entry_price') is not None:
-                    if entry_id:
-                        entry_to_update = EntryPoint.query.get(entry_id)
-                        if entry_to_update and entry_to_update.trade_id == trade_to_edit.id:
-                            entry_to_update.entry_time = entry_form_data['entry_time']
-                            entry_to_update.contracts = entry_form_data['contracts']
-                            entry_to_update.entry_price = entry_form_data['entry_price']
-                            submitted_entry_ids.add(entry_id)
-                    else:
-                        new_entries_to_add.append(EntryPoint(
-                            trade_id=trade_to_edit.id, entry_time=entry_form_data['entry_time'],
-                            contracts=entry_form_data['contracts'], entry_price=entry_form_data['entry_price']
-                        ))
-            for id_to_delete in current_entry_ids_in_db - submitted_entry_ids:
-                entry_to_delete = EntryPoint.query.get(id_to_delete)
-                if entry_to_delete: db.session.delete(entry_to_delete)
-            for new_entry in new_entries_to_add:
-                db.session.add(new_entry)
-
-            # Handle Exits: Update existing, Add new, Delete removed
-            current_exit_ids_in_db = {exit_item.id for exit_item in trade_to_edit.exits}
-            submitted_exit_ids = set()
-            new_exits_to_add = []
-            for exit_form_data in form.exits.data:
-                exit_id = exit_form_data.get('id')
-                if exit_form_data.get('exit_time') and exit_form_data.get(
-                        'contracts') is not None and exit_form_data.get('exit_price') is not None:
-                    if exit_id:
-                        exit_to_update = ExitPoint.query.get(exit_id)
-                        if exit_to_update and exit_to_update.trade_id == trade_to_edit.id:
-                            exit_to_update.exit_time = exit_form_data['exit_time']
-                            exit_to_update.contracts = exit_form_data['contracts']
-                            exit_to_update.exit_price = exit_form_data['exit_price']
-                            submitted_exit_ids.add(exit_id)
-                    else:
-                        new_exits_to_add.append(ExitPoint(
-                            trade_id=trade_to_edit.id, exit_time=exit_form_data['exit_time'],
-                            contracts=exit_form_data['contracts'], exit_price=exit_form_data['exit_price']
-                        ))
-            for id_to_delete in current_exit_ids_in_db - submitted_exit_ids:
-                exit_to_delete = ExitPoint.query.get(id_to_delete)
-                if exit_to_delete: db.session.delete(exit_to_delete)
-            for new_exit in new_exits_to_add:
-                db.session.add(new_exit)
+            trade_to_edit.tags = form.tags.data
+
+            # Entries and exits: diff the submitted rows against the stored legs and write the changes in bulk
+            stored_legs = _load_trade_legs(trade_to_edit.id)
+            entries, entries_changed = _sync_trade_legs(trade_to_edit.id, EntryPoint, stored_legs[EntryPoint],
+                                                        form.entries.data)
+            exits, exits_changed = _sync_trade_legs(trade_to_edit.id, ExitPoint, stored_legs[ExitPoint],
+                                                    form.exits.data)
+            if entries_changed or exits_changed:
+                bump_data_version([current_user.id])  # Bulk leg writes bypass the flush listener
 
             # Handle image deletion
             for image in trade_to_edit.images:  # Iterate over a copy if modifying the list
                 if request.form.get(f'delete_image_{image.id}'):
-                    image_path_to_delete = os.path.join(current_app.config['UPLOAD_FOLDER'], image.filepath)
-                    if os.path.exists(image_path_to_delete):
-                        try:
-                            os.remove(image_path_to_delete)
-                        except OSError:
-                            current_app.logger.warning(f"Could not delete image file on disk: {image.filepath}")
+                    remove_image_files(image)
                     db.session.delete(image)
 
             # Handle new image uploads
-            if form.trade_images.data:
-                for image_file in form.trade_images.data:
+            new_images = []
+            image_files = _uploadable_images(form.trade_images.data)  # Checked against the quota up front
+            if image_files:
+                for image_file in image_files:
                     if image_file and _is_allowed_image(image_file.filename):
                         original_filename = secure_filename(image_file.filename)
                         file_ext = os.path.splitext(original_filename)[1].lower()
-                        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-                        upload_folder = current_app.config['UPLOAD_FOLDER']
-                        file_path = os.path.join(upload_folder, unique_filename)
+                        unique_filename, file_path = new_file_path(current_app.config['UPLOAD_FOLDER'], file_ext)
                         try:
                             image_file.save(file_path)
                             trade_image = TradeImage(
                                 trade_id=trade_to_edit.id, user_id=current_user.id, filename=original_filename,
                                 filepath=unique_filename, filesize=os.path.getsize(file_path),
+                                content_hash=file_content_hash(file_path),
                                 mime_type=image_file.mimetype)
                             db.session.add(trade_image)
+                            new_images.append(trade_image)
                         except Exception as e_save:
                             current_app.logger.error(
                                 f"Failed to save new image during edit {original_filename} for trade {trade_to_edit.id}: {e_save}",
                                 exc_info=True)
 
+            trade_to_edit.recalculate_metrics(entries=entries, exits=exits)
             db.session.commit()
+            schedule_image_derivatives(new_images)
             flash('Trade updated successfully!', 'success')
             return redirect(url_for('trades.view_trade_detail', trade_id=trade_to_edit.id))
         except Exception as e:
@@ -390,6 +569,62 @@ def edit_trade(trade_id):
     return render_template('trades/edit_trade.html', title="Edit Trade", form=form, trade=trade_to_edit)
 
 
+# (time column, price column) of each leg model edited through TradeForm's entries/exits FieldLists
+_LEG_COLUMNS = {EntryPoint: ('entry_time', 'entry_price'), ExitPoint: ('exit_time', 'exit_price')}
+
+
+def _load_trade_legs(trade_id):
+    """All entry and exit legs of a trade in one query, as {model: {leg id: (time, contracts, price)}}."""
+    selects = []
+    for kind, (model, (time_column, price_column)) in enumerate(_LEG_COLUMNS.items()):
+        table = model.__table__
+        selects.append(db.select(db.literal(kind).label('kind'), table.c.id, table.c[time_column],
+                                 table.c.contracts, table.c[price_column]).where(table.c.trade_id == trade_id))
+    models = list(_LEG_COLUMNS)
+    legs = {model: {} for model in models}
+    for kind, leg_id, *values in db.session.execute(
+            db.union_all(*selects).order_by(db.literal_column('kind'), db.literal_column('id'))):
+        legs[models[kind]][leg_id] = tuple(values)
+    return legs
+
+
+def _sync_trade_legs(trade_id, model, stored, submitted):
+    """Applies the submitted FieldList rows to a trade's stored legs with at most one bulk UPDATE, INSERT
+    and DELETE; returns (the resulting legs as unsaved `model` instances, whether anything changed).
+
+    Rows missing a time, contracts or price are dropped (deleting the leg they carried), as are ids that
+    are not legs of this trade.
+    """
+    time_column, price_column = _LEG_COLUMNS[model]
+    table = model.__table__
+    legs, updates, inserts, kept = [], [], [], set()
+    for row in submitted:
+        values = (row.get(time_column), row.get('contracts'), row.get(price_column))
+        if not values[0] or values[1] is None or values[2] is None:
+            continue
+        leg_id = row.get('id')
+        if leg_id:
+            if leg_id not in stored or leg_id in kept:
+                continue
+            kept.add(leg_id)
+            if stored[leg_id] != values:
+                updates.append({'b_id': leg_id, time_column: values[0], 'contracts': values[1],
+                                price_column: values[2]})
+        else:
+            inserts.append({'trade_id': trade_id, time_column: values[0], 'contracts': values[1],
+                            price_column: values[2]})
+        legs.append(model(id=leg_id, trade_id=trade_id, **{time_column: values[0], 'contracts': values[1],
+                                                           price_column: values[2]}))
+    removed = stored.keys() - kept
+    if updates:
+        db.session.execute(db.update(table).where(table.c.id == db.bindparam('b_id')), updates)
+    if inserts:
+        db.session.execute(db.insert(table), inserts)
+    if removed:
+        db.session.execute(db.delete(table).where(table.c.id.in_(removed)))
+    return legs, bool(updates or inserts or removed)
+
+
 # --- DELETE TRADE (Single) ---
 @trades_bp.route('/<int:trade_id>/delete', methods=['POST'])
 @login_required
@@ -398,14 +633,9 @@ def delete_trade(trade_id):
     if trade_to_delete.user_id != current_user.id:
         abort(403)
     try:
-        for img in trade_to_delete.images:
-            if img.filepath:
-                try:
-                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], img.filepath))
-                except OSError:
-                    current_app.logger.warning(f"Could not delete image file: {img.filepath}")
-        db.session.delete(trade_to_delete)  # Cascades should handle entries, exits, images in DB
+        _delete_user_trades([trade_to_delete.id])
         db.session.commit()
+        schedule_file_sweep()
         flash('Trade deleted successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -414,6 +644,31 @@ def delete_trade(trade_id):
     return redirect(url_for('trades.view_trades_list'))
 
 
+def _delete_user_trades(trade_ids):
+    """Deletes the current user's trades among `trade_ids` with one DELETE per table; returns how many.
+
+    Runs in the caller's transaction. Image files are only queued for the background sweep, and since
+    Core deletes bypass the session listeners the rollups, storage usage and cache version are adjusted here.
+    """
+    trades, images, links = Trade.__table__, TradeImage.__table__, TradeTag.__table__
+    owned = db.session.execute(db.select(trades.c.id).where(trades.c.user_id == current_user.id,
+                                                            trades.c.id.in_(trade_ids))).scalars().all()
+    if not owned:
+        return 0
+    rollup_rows = rollup_rows_for_trades(owned)
+    queue_file_removals(image_filepaths_select(images, images.c.user_id == current_user.id,
+                                               images.c.trade_id.in_(owned)))
+    remove_deleted_uploads(TradeImage, images.c.user_id == current_user.id, images.c.trade_id.in_(owned))
+    db.session.execute(db.delete(images).where(images.c.user_id == current_user.id, images.c.trade_id.in_(owned)))
+    db.session.execute(db.delete(links).where(links.c.user_id == current_user.id, links.c.trade_id.in_(owned)))
+    for leg_table in (EntryPoint.__table__, ExitPoint.__table__):
+        db.session.execute(db.delete(leg_table).where(leg_table.c.trade_id.in_(owned)))
+    db.session.execute(db.delete(trades).where(trades.c.user_id == current_user.id, trades.c.id.in_(owned)))
+    remove_deleted_trades(rollup_rows)
+    bump_data_version([current_user.id])
+    return len(owned)
+
+
 # --- BULK DELETE TRADES ---
 @trades_bp.route('/bulk_delete', methods=['POST'])
 @login_required
@@ -423,37 +678,21 @@ def bulk_delete_trades():
         flash('No trades selected for deletion.', 'warning')
         return redirect(url_for('trades.view_trades_list'))
 
-    deleted_count = 0
-    error_count = 0
-    for trade_id_str in trade_ids_to_delete:
-        try:
-            trade_id = int(trade_id_str)
-            trade = Trade.query.get(trade_id)
-            if trade and trade.user_id == current_user.id:
-                for img in trade.images:
-                    if img.filepath:
-                        try:
-                            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], img.filepath))
-                        except OSError:
-                            pass
-                db.session.delete(trade)
-                deleted_count += 1
-            else:
-                error_count += 1
-        except ValueError:
-            error_count += 1
-        except Exception as e:
-            error_count += 1
-            current_app.logger.error(f"Error during bulk delete of trade ID {trade_id_str}: {e}", exc_info=True)
+    trade_ids = {int(value) for value in trade_ids_to_delete if value.strip().isdigit()}
+    try:
+        deleted_count = _delete_user_trades(trade_ids) if trade_ids else 0
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash('An error occurred during bulk deletion.', 'danger')
+        current_app.logger.error(f"Error during bulk delete of {len(trade_ids)} trades: {e}", exc_info=True)
+        return redirect(url_for('trades.view_trades_list'))
 
     if deleted_count > 0:
-        try:
-            db.session.commit()
-            flash(f'Successfully deleted {deleted_count} trade(s).', 'success')
-        except Exception as e_commit:
-            db.session.rollback()
-            flash('An error occurred during bulk deletion commit.', 'danger')
-            current_app.logger.error(f"Error committing bulk delete: {e_commit}", exc_info=True)
+        schedule_file_sweep()
+        flash(f'Successfully deleted {deleted_count} trade(s).', 'success')
+        record_activity('trades_bulk_deleted', f"Deleted {deleted_count} trades")
+    error_count = len(trade_ids_to_delete) - deleted_count
     if error_count > 0:
         flash(f'Could not delete {error_count} selected item(s) due to errors or permissions.', 'warning')
 
@@ -461,147 +700,196 @@ def bulk_delete_trades():
 
 
 # --- EXPORT TRADES ---
+EXPORT_CHUNK_SIZE = 500
+EXPORT_HEADERS = [
+    'ID', 'Date', 'Instrument', 'Direction', 'Point Value',
+    'Total Entry Contracts', 'Avg Entry Price', 'Total Exit Contracts', 'Avg Exit Price',
+    'Gross P&L', 'R-Value (Initial)', 'Dollar Risk (Initial)',
+    'Initial SL', 'Terminus Target', 'MAE', 'MFE', 'How Closed',
+    'Trading Model', 'Tags', 'Trade Notes', 'Overall Analysis', 'Management Notes',
+    'Errors', 'Improvements', 'External Screenshot Link'
+]
+# Appended when per-leg detail rows are requested; trade rows leave the leg columns blank
+EXPORT_DETAIL_HEADERS = ['Row Type', 'Leg Time', 'Leg Contracts', 'Leg Price']
+
+
+def _export_csv_rows(query, include_legs=False):
+    """Yields CSV text a chunk of trades at a time, so memory stays flat however many trades match.
+
+    Trades are streamed with yield_per; model names are loaded once and the entry/exit legs of each
+    chunk with one query per leg table, instead of lazy loads per trade.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS + (EXPORT_DETAIL_HEADERS if include_legs else []))
+    yield buffer.getvalue()
+
+    model_names = dict(db.session.execute(db.select(TradingModel.id, TradingModel.name)
+                                          .where(TradingModel.user_id == current_user.id)).all())
+    statement = query.statement.execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    for trades in db.session.scalars(statement).partitions():
+        legs = {}
+        if include_legs:
+            trade_ids = [trade.id for trade in trades]
+            for leg_type, leg_model, time_attr, price_attr in (('Entry', EntryPoint, 'entry_time', 'entry_price'),
+                                                                ('Exit', ExitPoint, 'exit_time', 'exit_price')):
+                leg_query = leg_model.query.filter(leg_model.trade_id.in_(trade_ids)) \
+                    .order_by(getattr(leg_model, time_attr), leg_model.id)
+                for leg in leg_query:
+                    leg_time = getattr(leg, time_attr)
+                    legs.setdefault(leg.trade_id, []).append(
+                        (leg_type, leg_time.strftime('%H:%M:%S') if leg_time else '', leg.contracts,
+                         getattr(leg, price_attr)))
+
+        buffer.seek(0)
+        buffer.truncate()
+        for trade in trades:
+            row = [
+                trade.id, trade.trade_date.strftime('%Y-%m-%d'), trade.instrument, trade.direction, trade.point_value,
+                trade.total_contracts_entered, trade.average_entry_price,
+                trade.total_contracts_exited, trade.average_exit_price,
+                trade.gross_pnl, trade.pnl_in_r, trade.dollar_risk,
+                trade.initial_stop_loss, trade.terminus_target, trade.mae, trade.mfe,
+                trade.how_closed, model_names.get(trade.trading_model_id, ''),
+                ', '.join(trade.tags), trade.trade_notes, trade.overall_analysis_notes, trade.trade_management_notes,
+                trade.errors_notes, trade.improvements_notes, trade.screenshot_link
+            ]
+            if not include_legs:
+                writer.writerow(row)
+                continue
+            writer.writerow(row + ['Trade', '', '', ''])
+            blank = [''] * (len(EXPORT_HEADERS) - 4)
+            for leg_type, leg_time, contracts, price in legs.get(trade.id, []):
+                writer.writerow(row[:4] + blank + [leg_type, leg_time, contracts, price])
+        yield buffer.getvalue()
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 @trades_bp.route('/export_csv', methods=['GET'])
 @login_required
 def export_trades_csv():
     filter_form = TradeFilterForm(request.args, meta={'csrf': False})
     _populate_filter_form_choices(filter_form)
 
-    query = Trade.query.filter_by(user_id=current_user.id)
-    if filter_form.start_date.data: query = query.filter(Trade.trade_date >= filter_form.start_date.data)
-    if filter_form.end_date.data: query = query.filter(Trade.trade_date <= filter_form.end_date.data)
-    if filter_form.instrument.data: query = query.filter(Trade.instrument == filter_form.instrument.data)
-    if filter_form.direction.data: query = query.filter(Trade.direction == filter_form.direction.data)
-    if filter_form.trading_model_id.data and filter_form.trading_model_id.data != 0:
-        query = query.filter(Trade.trading_model_id == filter_form.trading_model_id.data)
-    if filter_form.tags.data: query = query.filter(Trade.tags == filter_form.tags.data)
-
-    trades_to_export = query.order_by(Trade.trade_date.asc()).all()
+    query = _apply_trade_filters(Trade.query.filter_by(user_id=current_user.id), filter_form)
+    if request.args.get('sort_by'):
+        query = _apply_trade_sort(query, filter_form.sort_by.data, filter_form.sort_dir.data)
+    else:
+        query = query.order_by(Trade.trade_date.asc(), Trade.id.asc())
 
-    if not trades_to_export:
+    if query.with_entities(Trade.id).first() is None:
         flash('No trades found matching current filters to export.', 'warning')
         return redirect(url_for('trades.view_trades_list', **request.args))
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    headers = [
-        'ID', 'Date', 'Instrument', 'Direction', 'Point Value',
-        'Total Entry Contracts', 'Avg Entry Price', 'Total Exit Contracts', 'Avg Exit Price',
-        'Gross P&L', 'R-Value (Initial)', 'Dollar Risk (Initial)',
-        'Initial SL', 'Terminus Target', 'MAE', 'MFE', 'How Closed',
-        'Trading Model', 'Tags', 'Trade Notes', 'Overall Analysis', 'Management Notes',
-        'Errors', 'Improvements', 'External Screenshot Link'
-        # Detailed entries/exits would require a more complex CSV or separate export
-    ]
-    writer.writerow(headers)
-    for trade in trades_to_export:
-        writer.writerow([
-            trade.id, trade.trade_date.strftime('%Y-%m-%d'), trade.instrument, trade.direction, trade.point_value,
-            trade.total_contracts_entered, trade.average_entry_price,
-            trade.total_contracts_exited, trade.average_exit_price,
-            trade.gross_pnl, trade.pnl_in_r, trade.dollar_risk,
-            trade.initial_stop_loss, trade.terminus_target, trade.mae, trade.mfe,
-            trade.how_closed, trade.trading_model.name if trade.trading_model else '',
-            trade.tags, trade.trade_notes, trade.overall_analysis_notes, trade.trade_management_notes,
-            trade.errors_notes, trade.improvements_notes, trade.screenshot_link
-        ])
-    output.seek(0)
-    return Response(output, mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment;filename=trades_export.csv"})
+    include_legs = request.args.get('detail') == 'legs'
+    filename = 'trades_export_detailed.csv' if include_legs else 'trades_export.csv'
+    rows = _export_csv_rows(query, include_legs=include_legs)
+    if request.args.get('compress') == 'gzip':
+        return Response(stream_with_context(_gzip_stream(rows)), mimetype='application/gzip',
+                        headers={"Content-Disposition": f"attachment;filename={filename}.gz"})
+    return Response(stream_with_context(rows), mimetype="text/csv",
+                    headers={"Content-Disposition": f"attachment;filename={filename}"})
+
+
+@trades_bp.route('/export_research', methods=['GET'])
+@login_required
+def export_trades_columnar():
+    """Trades, legs and daily journals as a ZIP of Parquet (default) or Arrow IPC files, for pandas/polars."""
+    file_format = request.args.get('format', 'parquet')
+    if file_format not in COLUMNAR_FORMATS:
+        abort(400)
+    filter_form = TradeFilterForm(request.args, meta={'csrf': False})
+    _populate_filter_form_choices(filter_form)
+    query = _apply_trade_filters(Trade.query.filter_by(user_id=current_user.id), filter_form)
+    query = query.order_by(Trade.trade_date.asc(), Trade.id.asc())
+
+    archive = stream_export_archive(current_user.id, query, file_format,
+                                    start_date=filter_form.start_date.data, end_date=filter_form.end_date.data)
+    return Response(stream_with_context(archive), mimetype='application/zip',
+                    headers={"Content-Disposition": f"attachment;filename=trading_journal_{file_format}.zip"})
 
 
 # --- IMPORT TRADES ---
+# Imports run as background jobs (app.import_jobs); the page polls import_job_status for progress.
 @trades_bp.route('/import', methods=['GET', 'POST'])
 @login_required
 def import_trades():
     form = ImportTradesForm()
     if form.validate_on_submit():
-        csv_file = form.csv_file.data
-        try:
-            stream = io.StringIO(csv_file.stream.read().decode("UTF-8"), newline=None)
-            csv_reader = csv.DictReader(stream)
-            imported_count = 0
-            error_count = 0
-            error_details = []
-
-            for row_num, row in enumerate(csv_reader, 1):
-                try:
-                    trade_date_str = row.get('Date')
-                    if not trade_date_str:
-                        error_details.append(f"Row {row_num + 1}: Missing Date.");
-                        error_count += 1;
-                        continue
-                    trade_date = py_datetime.strptime(trade_date_str, '%Y-%m-%d').date()
-
-                    instrument = row.get('Instrument')
-                    direction = row.get('Direction')
-                    if not instrument or not direction:
-                        error_details.append(f"Row {row_num + 1}: Missing Instrument or Direction.");
-                        error_count += 1;
-                        continue
-
-                    new_trade = Trade(user_id=current_user.id, trade_date=trade_date, instrument=instrument,
-                                      direction=direction)
-                    new_trade.point_value = INSTRUMENT_POINT_VALUES.get(instrument, 1.0)
-
-                    # Optional fields from CSV
-                    new_trade.initial_stop_loss = _parse_form_float(row.get('Initial SL'))
-                    new_trade.terminus_target = _parse_form_float(row.get('Terminus Target'))
-                    new_trade.mae = _parse_form_float(row.get('MAE'))
-                    new_trade.mfe = _parse_form_float(row.get('MFE'))
-                    new_trade.how_closed = row.get('How Closed')
-                    new_trade.tags = row.get('Tags')
-                    new_trade.trade_notes = row.get('Trade Notes')
-                    new_trade.overall_analysis_notes = row.get('Overall Analysis')
-                    new_trade.trade_management_notes = row.get('Management Notes')
-                    new_trade.errors_notes = row.get('Errors')
-                    new_trade.improvements_notes = row.get('Improvements')
-                    new_trade.screenshot_link = row.get('External Screenshot Link')
-
-                    # Gross P&L is usually calculated, but if provided, can be stored or used for verification
-                    # For simplicity, not directly setting P&L if entries/exits are also imported
-
-                    model_name = row.get('Trading Model')
-                    if model_name:
-                        model = TradingModel.query.filter_by(user_id=current_user.id, name=model_name).first()
-                        if model:
-                            new_trade.trading_model_id = model.id
-                        else:
-                            error_details.append(
-                                f"Row {row_num + 1}: Trading Model '{model_name}' not found. Trade imported without model.")
-
-                    # Placeholder for importing entries/exits - requires more complex CSV structure and parsing
-                    # e.g., if CSV has Entry 1 Price, Entry 1 Contracts, Entry 1 Time, etc.
-                    # Or if entries/exits for one trade are on multiple CSV lines.
-                    # For now, this import creates a trade without detailed entry/exit points.
-
-                    db.session.add(new_trade)
-                    imported_count += 1
-                except ValueError as ve:
-                    error_details.append(f"Row {row_num + 1}: Data conversion error - {ve}. Row data: {row}");
-                    error_count += 1
-                except Exception as e_row:
-                    error_details.append(f"Row {row_num + 1}: Unexpected error - {e_row}. Row data: {row}");
-                    error_count += 1
-
-            if imported_count > 0:
-                db.session.commit()
-            else:
-                db.session.rollback()
-
-            if imported_count > 0: flash(f'Successfully imported {imported_count} trades.', 'success')
-            if error_count > 0: flash(f'Skipped or had errors with {error_count} rows during import.', 'danger')
-            if error_details:
-                for err_detail in error_details[:10]:  # Show first few errors
-                    flash(err_detail, 'warning')
-                if len(error_details) > 10:
-                    flash(f"...and {len(error_details) - 10} more errors. Check server logs for all details.",
-                          'warning')
+        job = create_import_job(current_user.id, form.csv_file.data, form.file_format.data)
+        if _submit_import_job(job):
+            flash(f"Importing '{job.filename}' in the background; progress is shown below.", 'info')
+            record_activity('trades_import_queued', f"Queued import job {job.id} for '{job.filename}'")
+        return redirect(url_for('trades.import_trades'))
+
+    jobs = (ImportJob.query.filter_by(user_id=current_user.id)
+            .order_by(ImportJob.created_at.desc(), ImportJob.id.desc()).limit(IMPORT_JOBS_KEPT).all())
+    return render_template('trades/import_trades.html', title="Import Trades", form=form, jobs=jobs)
+
+
+def _submit_import_job(job):
+    try:
+        submit_import_job(job, INSTRUMENT_POINT_VALUES)
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Could not start import job {job.id}: {e}", exc_info=True)
+        job.status, job.finished_at = 'failed', py_datetime.utcnow()
+        job.error_message = 'The import could not be started. Please try again later.'
+        db.session.commit()
+        flash(job.error_message, 'danger')
+        return False
 
-            return redirect(url_for('trades.view_trades_list'))
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error importing trades file: {str(e)}', 'danger')
-            current_app.logger.error(f"Fatal error during trade import process: {e}", exc_info=True)
 
-    return render_template('trades/import_trades.html', title="Import Trades", form=form)
\ No newline at end of file
+def _get_user_import_job(job_id):
+    return ImportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+
+
+@trades_bp.route('/import/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def import_job_status(job_id):
+    return jsonify(_get_user_import_job(job_id).to_dict())
+
+
+@trades_bp.route('/import/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_import(job_id):
+    job = _get_user_import_job(job_id)
+    if job.is_finished:
+        flash('That import has already finished.', 'info')
+    else:
+        cancel_import_job(job)
+        flash('Import cancelled; trades already imported are kept.' if job.is_finished
+              else 'Cancelling the import after its current batch.', 'warning')
+    return redirect(url_for('trades.import_trades'))
+
+
+@trades_bp.route('/import/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_import(job_id):
+    job = _get_user_import_job(job_id)
+    if not job.can_retry:
+        flash('That import has no failed rows to retry.', 'info')
+        return redirect(url_for('trades.import_trades'))
+    retry = create_retry_job(job)
+    if retry is None:
+        flash('The uploaded file for that import is no longer available; please upload it again.', 'warning')
+    elif _submit_import_job(retry):
+        flash(f"Retrying the failed rows of '{job.filename}'.", 'info')
+    return redirect(url_for('trades.import_trades'))
+
+
+@trades_bp.route('/import/report/<report_token>.csv', methods=['GET'])
+@login_required
+def download_import_report(report_token):
+    if not re.fullmatch(r'[0-9a-f]{32}', report_token):
+        abort(404)
+    return send_from_directory(import_reports_dir(current_user.id), f"{report_token}.csv", as_attachment=True,
+                               download_name='trade_import_errors.csv', mimetype='text/csv')
\ No newline at end of file
@@ -3,6 +3,8 @@ from flask_login import login_required, current_user
 from app import db  # Import db from the app package (app/__init__.py)
 from app.models import TradingModel  # Import your TradingModel from app/models.py
 from app.forms import TradingModelForm  # Import your TradingModelForm from app/forms.py
+from app.analytics import trade_breakdown, model_equity_sparklines
+from app.cache import cached_user_report
 
 # Utils might be needed later if you add more complex parsing not handled by WTForms directly
 # from app.utils import _parse_form_float # Example if needed
@@ -25,7 +27,20 @@ def view_trading_models_list():
     current_app.logger.info(f"User {current_user.username} viewing their trading models list.")
     # Filter models by the current_user's id
     models = TradingModel.query.filter_by(user_id=current_user.id).order_by(TradingModel.name).all()
-    return render_template('view_trading_models_list.html', models=models, title="Your Trading Models")
+    # Per-model stats and equity sparklines: two grouped queries in total, however many models there are
+    model_stats, model_sparklines = {}, {}
+    try:
+        model_stats = cached_user_report(
+            current_user, 'model_breakdown', None,
+            lambda: {group['group']['trading_model_id']: group
+                     for group in trade_breakdown(current_user.id, ['trading_model_id'])})
+        model_sparklines = cached_user_report(current_user, 'model_sparklines', None,
+                                              lambda: model_equity_sparklines(current_user.id))
+    except Exception as e:
+        current_app.logger.error(f"Error building trading model stats for user {current_user.id}: {e}", exc_info=True)
+        flash("Could not load trading model statistics.", "warning")
+    return render_template('view_trading_models_list.html', models=models, title="Your Trading Models",
+                           model_stats=model_stats, model_sparklines=model_sparklines)
 
 
 @trading_models_bp.route('/add', methods=['GET', 'POST'])
@@ -0,0 +1,148 @@
+"""In-process cache for per-user analytics results.
+
+Entries are keyed by (user_id, report name, filter params, user data version). The data version
+(`User.data_version`) is bumped in the same transaction as any change to the user's trades,
+journals or trading models, so a stale entry can never be looked up again: it simply ages out
+through LRU/TTL eviction.
+"""
+import hashlib
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify, request
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 15 * 60
+
+
+def _freeze(params):
+    """Turns a filter dict into a hashable, order-independent key component."""
+    if not params:
+        return ()
+    return tuple(sorted((k, str(v) if v is not None else None) for k, v in params.items()))
+
+
+def _estimate_size(value):
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class AnalyticsCache:
+    """Thread-safe LRU cache with a per-entry TTL and an approximate memory cap."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('ANALYTICS_CACHE_MAX_ENTRIES', self.max_entries)
+        self.max_bytes = app.config.get('ANALYTICS_CACHE_MAX_BYTES', self.max_bytes)
+        self.ttl = app.config.get('ANALYTICS_CACHE_TTL', self.ttl)
+        app.extensions['analytics_cache'] = self
+
+    @staticmethod
+    def make_key(user_id, report_name, params, data_version):
+        return (user_id, report_name, _freeze(params), data_version)
+
+    def get(self, key):
+        """Returns (found, value)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < now:
+                self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return  # Never cache something that would flush the whole cache
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get_or_compute(self, user_id, report_name, params, data_version, builder):
+        """Returns the cached result for this key, calling builder() and storing its result on a miss."""
+        key = self.make_key(user_id, report_name, params, data_version)
+        found, value = self.get(key)
+        if found:
+            return value
+        value = builder()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups * 100, 1) if lookups else None,
+            }
+
+
+analytics_cache = AnalyticsCache()
+
+
+def cached_user_report(user, report_name, params, builder):
+    """Serves a per-user report from the analytics cache, keyed on the user's current data version."""
+    return analytics_cache.get_or_compute(user.id, report_name, params, user.data_version or 0, builder)
+
+
+def versioned_json_response(user, report_name, params, builder):
+    """JSON response for a cached per-user report, with an ETag derived from the cache key.
+
+    Browsers revalidate with If-None-Match and get a bodyless 304 until the user's data version changes.
+    """
+    key = AnalyticsCache.make_key(user.id, report_name, params, user.data_version or 0)
+    etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(analytics_cache.get_or_compute(user.id, report_name, params, user.data_version or 0,
+                                                          builder))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,177 @@
+"""Columnar (Parquet / Arrow IPC) export of a user's trades, legs and daily journals for offline research.
+
+The download is a ZIP holding one file per table: trades, entry_points, exit_points and daily_journals.
+Each table is read with a streaming query EXPORT_BATCH_SIZE rows at a time. Every batch becomes one
+Arrow record batch (one Parquet row group), is written straight into its ZIP entry, and the ZIP bytes
+are yielded as they are produced, so memory stays at about one batch whatever the table sizes.
+
+Column types follow the SQLAlchemy columns: dates, times, timestamps, floats, ints and bools. Short
+enumerated strings (instrument, direction, trading model, session statuses, ...) are dictionary-encoded
+with one dictionary per column for the whole file, so pandas/polars load them as categoricals.
+"""
+import zipfile
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from app import db
+from app.models import DailyJournal, EntryPoint, ExitPoint, Tag, Trade, TradeTag, TradingModel
+
+EXPORT_BATCH_SIZE = 10000  # Rows per record batch / Parquet row group
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+# String columns exported as categoricals (dictionary-encoded); all other strings stay plain
+_CATEGORICAL_COLUMNS = {
+    'trade': ('instrument', 'direction', 'how_closed'),
+    'daily_journal': ('p12_scenario_selected',) + tuple(
+        f"{session}_{field}" for session in ('asia', 'london', 'ny1', 'ny2')
+        for field in ('direction', 'session_status', 'model_status')),
+}
+_EXCLUDED_COLUMNS = ('user_id', 'source_key')  # Constant per export / internal bookkeeping
+
+
+def _arrow_type(column):
+    python_type = column.type.python_type.__name__
+    return {
+        'bool': pa.bool_(), 'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(),
+        'date': pa.date32(), 'time': pa.time64('us'), 'datetime': pa.timestamp('us'),
+    }.get(python_type, pa.string())
+
+
+class _ChunkSink:
+    """Write-only file object collecting bytes until the response generator drains them."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _TableExport:
+    """One exported table: a streaming Core select plus the Arrow schema its rows are converted to."""
+
+    def __init__(self, name, table, statement, categories=None, extra_fields=(), extra_values=None):
+        self.name = name
+        self.columns = [column for column in table.columns if column.name not in _EXCLUDED_COLUMNS]
+        self.statement = statement.with_only_columns(*self.columns)
+        self.categories = categories or {}  # {column name: [every value it takes]} -> dictionary-encoded
+        fields = []
+        for column in self.columns:
+            if column.name in self.categories:
+                fields.append(pa.field(column.name, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(column.name, _arrow_type(column)))
+        self.schema = pa.schema(fields + list(extra_fields))
+        self.extra_values = extra_values  # Optional callable(rows) -> arrays for extra_fields
+        self._dictionaries = {name: (pa.array(values, pa.string()), {value: i for i, value in enumerate(values)})
+                              for name, values in self.categories.items()}
+
+    def _array(self, column, values):
+        if column.name in self._dictionaries:
+            dictionary, positions = self._dictionaries[column.name]
+            indices = pa.array([positions.get(value) for value in values], pa.int32())
+            return pa.DictionaryArray.from_arrays(indices, dictionary)
+        return pa.array(values, self.schema.field(column.name).type)
+
+    def batches(self):
+        result = db.session.execute(self.statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            arrays = [self._array(column, [row[i] for row in rows]) for i, column in enumerate(self.columns)]
+            if self.extra_values:
+                arrays += self.extra_values(rows)
+            yield pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def _distinct_values(statement, column):
+    return sorted(value for value in db.session.execute(
+        statement.with_only_columns(column).distinct().order_by(None)).scalars() if value is not None)
+
+
+def _trade_tables(user_id, trade_query):
+    trade_table = Trade.__table__
+    trade_statement = trade_query.statement
+    model_names = dict(db.session.execute(db.select(TradingModel.id, TradingModel.name)
+                                          .where(TradingModel.user_id == user_id)).all())
+    model_dictionary = sorted(set(model_names.values()))
+    model_positions = {name: i for i, name in enumerate(model_dictionary)}
+    exported = [column.name for column in trade_table.columns if column.name not in _EXCLUDED_COLUMNS]
+    id_position, model_position = exported.index('id'), exported.index('trading_model_id')
+
+    def trade_extras(rows):
+        """The model name (categorical) and tag list of each trade in the batch; tags in one query."""
+        trade_ids = [row[id_position] for row in rows]
+        tags = {}
+        for trade_id, name in db.session.execute(
+                db.select(TradeTag.trade_id, Tag.name).join(Tag, Tag.id == TradeTag.tag_id)
+                .where(TradeTag.trade_id.in_(trade_ids)).order_by(Tag.name)):
+            tags.setdefault(trade_id, []).append(name)
+        models = pa.DictionaryArray.from_arrays(
+            pa.array([model_positions.get(model_names.get(row[model_position])) for row in rows], pa.int32()),
+            pa.array(model_dictionary, pa.string()))
+        return [models, pa.array([tags.get(trade_id, []) for trade_id in trade_ids], pa.list_(pa.string()))]
+
+    yield _TableExport(
+        'trades', trade_table, trade_statement,
+        categories={name: _distinct_values(trade_statement, trade_table.c[name])
+                    for name in _CATEGORICAL_COLUMNS['trade']},
+        extra_fields=[pa.field('trading_model', pa.dictionary(pa.int32(), pa.string())),
+                      pa.field('tags', pa.list_(pa.string()))],
+        extra_values=trade_extras)
+
+    trade_ids = trade_query.with_entities(Trade.id).order_by(None).statement
+    for name, leg_model in (('entry_points', EntryPoint), ('exit_points', ExitPoint)):
+        leg_table = leg_model.__table__
+        yield _TableExport(name, leg_table, db.select(leg_table).where(leg_table.c.trade_id.in_(trade_ids))
+                           .order_by(leg_table.c.trade_id, leg_table.c.id))
+
+
+def _journal_table(user_id, start_date=None, end_date=None):
+    journal_table = DailyJournal.__table__
+    statement = db.select(journal_table).where(journal_table.c.user_id == user_id)
+    if start_date:
+        statement = statement.where(journal_table.c.journal_date >= start_date)
+    if end_date:
+        statement = statement.where(journal_table.c.journal_date <= end_date)
+    return _TableExport('daily_journals', journal_table, statement.order_by(journal_table.c.journal_date),
+                        categories={name: _distinct_values(statement, journal_table.c[name])
+                                    for name in _CATEGORICAL_COLUMNS['daily_journal']})
+
+
+def _open_writer(file_format, sink, schema):
+    if file_format == 'arrow':
+        return ipc.new_file(sink, schema, options=ipc.IpcWriteOptions(compression='zstd'))
+    return pq.ParquetWriter(sink, schema, compression='zstd')
+
+
+def stream_export_archive(user_id, trade_query, file_format='parquet', start_date=None, end_date=None):
+    """Yields the bytes of a ZIP with the user's filtered trades, their legs and daily journals.
+
+    `trade_query` is the (filtered, ordered) Trade query; legs follow the same trades and journals are
+    limited to the optional date range.
+    """
+    extension = FORMATS[file_format]
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED)  # Parquet/Arrow are compressed already
+    tables = list(_trade_tables(user_id, trade_query)) + [_journal_table(user_id, start_date, end_date)]
+    for table in tables:
+        with archive.open(table.name + extension, 'w', force_zip64=True) as entry:
+            writer = _open_writer(file_format, entry, table.schema)
+            for batch in table.batches():
+                writer.write_batch(batch)
+                data = sink.drain()
+                if data:
+                    yield data
+            writer.close()
+        yield sink.drain()
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _backfill_trade_metrics_chunk(app, trade_ids):
+    """Recomputes and bulk-updates the metric columns for one chunk of trades (runs in a worker thread)."""
+    from app.models import Trade, EntryPoint, ExitPoint, compute_trade_metrics, bump_data_version
+
+    with app.app_context():
+        try:
+            trades = db.session.execute(
+                db.select(Trade.id, Trade.user_id, Trade.trade_date, Trade.direction, Trade.point_value,
+                          Trade.initial_stop_loss, Trade.terminus_target, Trade.how_closed).where(Trade.id.in_(trade_ids))).all()
+            entries, exits = {}, {}
+            for trade_id, t, c, p in db.session.execute(
+                    db.select(EntryPoint.trade_id, EntryPoint.entry_time, EntryPoint.contracts,
+                              EntryPoint.entry_price).where(EntryPoint.trade_id.in_(trade_ids))):
+                entries.setdefault(trade_id, []).append((t, c, p))
+            for trade_id, t, c, p in db.session.execute(
+                    db.select(ExitPoint.trade_id, ExitPoint.exit_time, ExitPoint.contracts,
+                              ExitPoint.exit_price).where(ExitPoint.trade_id.in_(trade_ids))):
+                exits.setdefault(trade_id, []).append((t, c, p))
+
+            now = datetime.utcnow()
+            rows = []
+            for trade in trades:
+                metrics = compute_trade_metrics(trade.trade_date, trade.direction, trade.point_value,
+                                                trade.initial_stop_loss, trade.terminus_target, trade.how_closed,
+                                                entries.get(trade.id, []), exits.get(trade.id, []))
+                metrics.update(id=trade.id, metrics_updated_at=now)
+                rows.append(metrics)
+            if rows:
+                db.session.execute(db.update(Trade), rows)
+                bump_data_version({trade.user_id for trade in trades})
+            db.session.commit()
+            return len(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+@click.command('backfill-trade-metrics')
+@click.option('--user-id', type=int, default=None, help='Only backfill trades belonging to this user.')
+@click.option('--only-missing', is_flag=True, help='Skip trades whose metrics have already been computed.')
+@click.option('--chunk-size', type=int, default=500, show_default=True, help='Trades per worker chunk.')
+@click.option('--workers', type=int, default=min(4, os.cpu_count() or 1), show_default=True,
+              help='Number of chunks processed in parallel.')
+@with_appcontext
+def backfill_trade_metrics_command(user_id, only_missing, chunk_size, workers):
+    """Recomputes the materialized P&L/R/duration columns on existing trades."""
+    from app.models import Trade
+
+    query = db.select(Trade.id).order_by(Trade.id)
+    if user_id is not None:
+        query = query.where(Trade.user_id == user_id)
+    if only_missing:
+        query = query.where(Trade.metrics_updated_at.is_(None))
+    trade_ids = db.session.execute(query).scalars().all()
+    if not trade_ids:
+        click.echo("No trades to backfill.")
+        return
+
+    app = current_app._get_current_object()
+    updated, failed_chunks = 0, 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_backfill_trade_metrics_chunk, app, chunk) for chunk in _chunks(trade_ids, chunk_size)]
+        with click.progressbar(length=len(trade_ids), label='Backfilling trade metrics') as bar:
+            for future in as_completed(futures):
+                try:
+                    count = future.result()
+                    updated += count
+                    bar.update(count)
+                except Exception as e:
+                    failed_chunks += 1
+                    current_app.logger.error(f"Trade metrics backfill chunk failed: {e}", exc_info=True)
+    click.echo(f"Updated metrics for {updated} of {len(trade_ids)} trades.")
+    if updated:
+        # The bulk UPDATEs above bypass the rollup listeners; refresh the affected users' rollups.
+        from app.rollups import rebuild_performance_rollups
+        rebuild_performance_rollups([user_id] if user_id is not None else None)
+        db.session.commit()
+    if failed_chunks:
+        click.echo(f"{failed_chunks} chunk(s) failed; see the application log. Re-run with --only-missing to retry.")
+
+
+@click.command('rebuild-performance-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild rollups for this user.')
+@with_appcontext
+def rebuild_performance_rollups_command(user_id):
+    """Recomputes the day/week/month/quarter/year P&L rollups from the trades table."""
+    from app.rollups import rebuild_performance_rollups
+
+    try:
+        count = rebuild_performance_rollups([user_id] if user_id is not None else None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Rebuilding performance rollups failed: {e}", exc_info=True)
+        raise click.ClickException(f"Rebuilding performance rollups failed: {e}")
+    click.echo(f"Rebuilt {count} rollup rows.")
+
+
+@click.command('sweep-file-removals')
+@with_appcontext
+def sweep_file_removals_command():
+    """Removes uploaded files queued for deletion (normally done by the background sweep after each delete)."""
+    from app.file_cleanup import sweep_file_removals
+
+    click.echo(f"Removed {sweep_file_removals()} queued file(s).")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Recreates the full-text search index (and its triggers) from the notes, journals and trading models."""
+    from app.search import create_search_index, rebuild_search_index
+
+    connection = db.session.connection()
+    create_search_index(connection)
+    count = rebuild_search_index(connection)
+    db.session.commit()
+    click.echo(f"Indexed {count} documents.")
+
+
+@click.command('backfill-image-derivatives')
+@click.option('--batch-size', default=50, show_default=True, help='Images rendered per batch.')
+@click.option('--force', is_flag=True, help='Re-render images that already have derivatives.')
+@with_appcontext
+def backfill_image_derivatives_command(batch_size, force):
+    """Renders the thumbnail/medium derivatives of trade and journal screenshots that lack them."""
+    from app.image_derivatives import backfill_image_derivatives
+
+    click.echo(f"Rendered derivatives for {backfill_image_derivatives(batch_size=batch_size, force=force)} image(s).")
+
+
+@click.command('shard-uploads')
+@click.option('--batch-size', default=500, show_default=True, help='Rows moved per transaction.')
+@with_appcontext
+def shard_uploads_command(batch_size):
+    """Moves flat uploads and profile pictures into the sharded directory layout (safe to rerun)."""
+    from app.file_cleanup import sweep_file_removals
+    from app.storage import shard_existing_uploads
+
+    for model_name, (moved, missing) in shard_existing_uploads(batch_size=batch_size).items():
+        click.echo(f"{model_name}: moved {moved}, skipped {missing} with missing files.")
+    click.echo(f"Removed {sweep_file_removals()} flat file name(s).")
+
+
+@click.command('reconcile-storage-usage')
+@click.option('--user-id', type=int, default=None, help='Only reconcile this user.')
+@with_appcontext
+def reconcile_storage_usage_command(user_id):
+    """Recomputes the per-user storage usage counters from the uploaded files and images."""
+    from app.storage_usage import reconcile_storage_usage
+
+    try:
+        corrected = reconcile_storage_usage([user_id] if user_id is not None else None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Reconciling storage usage failed: {e}", exc_info=True)
+        raise click.ClickException(f"Reconciling storage usage failed: {e}")
+    click.echo(f"Corrected {corrected} storage usage counter(s).")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_trade_metrics_command)
+    app.cli.add_command(rebuild_performance_rollups_command)
+    app.cli.add_command(sweep_file_removals_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(backfill_image_derivatives_command)
+    app.cli.add_command(shard_uploads_command)
+    app.cli.add_command(reconcile_storage_usage_command)
@@ -0,0 +1,81 @@
+"""Deferred removal of uploaded files whose rows were deleted.
+
+Deleting rows in bulk must not wait on the filesystem. Instead, the paths of the files the deleted
+rows owned are queued as PendingFileRemoval rows in the same transaction, so they are committed or
+rolled back with the delete. After the commit a single background thread sweeps the queue and
+removes the files. `flask sweep-file-removals` runs the same sweep, e.g. from cron, for anything left
+behind by a restart.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app import db
+from app.models import PendingFileRemoval
+
+SWEEP_BATCH_SIZE = 500
+
+_sweeper = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file-cleanup')
+
+
+def queue_file_removals(paths_select):
+    """Queues the files named by `paths_select` (a SELECT of one UPLOAD_FOLDER-relative path column).
+
+    Runs as one INSERT ... SELECT in the caller's transaction; call it before deleting the rows it reads.
+    """
+    table = PendingFileRemoval.__table__
+    db.session.execute(db.insert(table).from_select(['path'], paths_select))
+
+
+def queue_file_paths(paths):
+    """Queues the given UPLOAD_FOLDER-relative paths, in the caller's transaction."""
+    if paths:
+        db.session.execute(db.insert(PendingFileRemoval.__table__), [{'path': path} for path in paths])
+
+
+def sweep_file_removals(batch_size=SWEEP_BATCH_SIZE):
+    """Removes queued files from disk and drops their queue rows; returns the number of files handled.
+
+    Files that are already gone count as handled; other OS errors are logged and the row is kept for
+    the next sweep.
+    """
+    table = PendingFileRemoval.__table__
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    handled, last_id = 0, 0
+    while True:
+        rows = db.session.execute(db.select(table.c.id, table.c.path).where(table.c.id > last_id)
+                                  .order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        done = []
+        for row_id, path in rows:
+            try:
+                os.remove(os.path.join(upload_folder, path))
+                done.append(row_id)
+            except FileNotFoundError:
+                done.append(row_id)
+            except OSError as e:
+                current_app.logger.warning(f"Could not remove queued file {path}: {e}")
+        if done:
+            db.session.execute(db.delete(table).where(table.c.id.in_(done)))
+            db.session.commit()
+        handled += len(done)
+        last_id = rows[-1][0]
+    return handled
+
+
+def schedule_file_sweep():
+    """Runs sweep_file_removals() on the background thread; call after committing queued removals."""
+    _sweeper.submit(_run_sweep, current_app._get_current_object())
+
+
+def _run_sweep(app):
+    with app.app_context():
+        try:
+            sweep_file_removals()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Background file sweep failed: {e}", exc_info=True)
+        finally:
+            db.session.remove()
@@ -0,0 +1,92 @@
+"""Delivery of uploaded files (File, TradeImage, DailyJournalImage) after the view's authorization check.
+
+Uploads are immutable: a new upload always gets a new uuid path. Each row keeps the SHA-256 of its
+original (`content_hash`, stored at upload or on first delivery), which becomes a strong ETag, and
+responses are cacheable for UPLOAD_CACHE_MAX_AGE with `immutable`, so browsers revalidate rarely and a
+revalidation is a 304 without reading the file. Derivatives use the original's hash plus their variant.
+
+FILE_DELIVERY picks who copies the bytes:
+- 'python': Werkzeug's send_file (Range requests, conditional GET, the server's file wrapper);
+- 'x-accel': nginx, via `X-Accel-Redirect: <FILE_DELIVERY_ACCEL_PREFIX>/<path>` on an `internal` location
+  aliasing UPLOAD_FOLDER;
+- 'x-sendfile': Apache mod_xsendfile / lighttpd, via `X-Sendfile: <absolute path>`.
+The proxy then handles Range itself; the app only answers If-None-Match.
+"""
+import hashlib
+import os
+from urllib.parse import quote
+
+from flask import abort, current_app, make_response, request, send_file
+
+from app import db
+
+
+def file_content_hash(path):
+    """Hex SHA-256 of the file at `path`."""
+    with open(path, 'rb') as stream:
+        return hashlib.file_digest(stream, 'sha256').hexdigest()
+
+
+def ensure_content_hash(row):
+    """The row's stored content hash, computing and saving it first for rows uploaded before it existed."""
+    if row.content_hash is None:
+        table = type(row).__table__
+        row.content_hash = file_content_hash(os.path.join(current_app.config['UPLOAD_FOLDER'], row.filepath))
+        db.session.execute(db.update(table).where(table.c.id == row.id).values(content_hash=row.content_hash))
+        db.session.commit()
+    return row.content_hash
+
+
+def _cache_headers(response, etag, immutable):
+    response.set_etag(etag)
+    response.cache_control.private = True  # Every upload sits behind a login
+    if immutable:
+        response.cache_control.no_cache = None  # send_file always sets it
+        response.cache_control.max_age = current_app.config['UPLOAD_CACHE_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def send_upload(row, path=None, variant=None, mimetype=None, as_attachment=False, download_name=None):
+    """Response delivering the upload `path` (default the row's original) of an authorized `row`.
+
+    `variant` names the derivative requested; while it is not rendered yet `path` is the original, which is
+    then served revalidate-always so the derivative replaces it in browser caches once it exists. Once the
+    image is rendered (its width is known) a missing derivative was skipped for being no smaller than the
+    original, which then stands in for it for good.
+    """
+    path = path or row.filepath
+    is_derivative = path != row.filepath
+    absolute = os.path.join(current_app.config['UPLOAD_FOLDER'], path)
+    if not os.path.isfile(absolute):
+        current_app.logger.error(f"Upload not found on disk: {path}")
+        abort(404)
+    etag = ensure_content_hash(row) + (f'-{variant}' if is_derivative else '')
+    immutable = is_derivative or not variant or getattr(row, 'width', None) is not None
+
+    delivery = current_app.config['FILE_DELIVERY']
+    if delivery == 'python':
+        response = send_file(absolute, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                             conditional=True, etag=etag)
+        response.accept_ranges = 'bytes'  # Werkzeug only announces it on 206 responses
+        return _cache_headers(response, etag, immutable)
+
+    if request.if_none_match.contains(etag):
+        return _cache_headers(make_response('', 304), etag, immutable)
+    response = make_response('')
+    if delivery == 'x-accel':
+        prefix = current_app.config['FILE_DELIVERY_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = quote(f"{prefix}/{path}")
+    elif delivery == 'x-sendfile':
+        response.headers['X-Sendfile'] = absolute
+    else:
+        raise ValueError(f"Unknown FILE_DELIVERY: {delivery}")
+    response.headers.pop('Content-Type', None)  # Let the proxy type the file unless the row knows better
+    if mimetype:
+        response.content_type = mimetype
+    if as_attachment or download_name:
+        response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                             filename=download_name or os.path.basename(path))
+    return _cache_headers(response, etag, immutable)
@@ -2,7 +2,7 @@ from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import (StringField, PasswordField, BooleanField, SubmitField, MultipleFileField,
                      TextAreaField, FloatField, SelectField, IntegerField, DateField,
-                     TimeField, FormField, FieldList)
+                     TimeField, FormField, FieldList, SelectMultipleField)
 from wtforms.validators import DataRequired, Email, Length, EqualTo, Optional, NumberRange, InputRequired
 from app.models import UserRole  # Assuming UserRole is used elsewhere or for consistency
 
@@ -312,7 +312,7 @@ class TradeForm(FlaskForm):
         ['jpg', 'png', 'jpeg', 'gif'], 'Images only!')])
     screenshot_link = StringField('TradingView Screenshot Link', validators=[Optional(), Length(max=255)],
                                   render_kw={"placeholder": "http://..."})
-    tags = SelectField('Tags', choices=SIMPLE_TAG_CHOICES, validators=[Optional()])
+    tags = SelectMultipleField('Tags', choices=SIMPLE_TAG_CHOICES[1:], validators=[Optional()])  # Plus the user's own tags (set in route)
     submit = SubmitField('Save Trade')
 
     def __init__(self, *args, **kwargs):
@@ -330,9 +330,26 @@ class TradeFilterForm(FlaskForm):
                             validators=[Optional()])
     trading_model_id = SelectField('Trading Model', coerce=int, choices=[(0, 'All Models')],
                                    validators=[Optional()])  # Choices populated in route
-    tags = SelectField('Tag', choices=[('', 'All Tags')] + TradeForm.SIMPLE_TAG_CHOICES[1:],
-                       validators=[Optional()])  # For single tag filter
-    # You can add more fields like P&L range, R-value range, etc.
+    tags = SelectMultipleField('Tags', choices=TradeForm.SIMPLE_TAG_CHOICES[1:],
+                               validators=[Optional()])  # Choices (with per-tag counts) populated in route
+    tag_mode = SelectField('Match', choices=[('any', 'Any tag (OR)'), ('all', 'All tags (AND)')], default='any',
+                           validators=[Optional()])
+    exclude_tags = SelectMultipleField('Exclude Tags', choices=TradeForm.SIMPLE_TAG_CHOICES[1:],
+                                       validators=[Optional()])
+    min_pnl = FloatField('Min P&L ($)', validators=[Optional()])
+    max_pnl = FloatField('Max P&L ($)', validators=[Optional()])
+    min_r = FloatField('Min R', validators=[Optional()])
+    max_r = FloatField('Max R', validators=[Optional()])
+    outcome = SelectField('Outcome', choices=[('', 'All Outcomes'), ('win', 'Winners'), ('loss', 'Losers'),
+                                              ('breakeven', 'Breakeven')], validators=[Optional()])
+    min_duration = IntegerField('Min Duration (min)', validators=[Optional(), NumberRange(min=0)])
+    max_duration = IntegerField('Max Duration (min)', validators=[Optional(), NumberRange(min=0)])
+    status = SelectField('Status', choices=[('', 'Open & Closed'), ('open', 'Open'), ('closed', 'Closed')],
+                         validators=[Optional()])
+    sort_by = SelectField('Sort By', choices=[('date', 'Date'), ('pnl', 'P&L'), ('r', 'R-Multiple'),
+                                              ('duration', 'Duration')], default='date', validators=[Optional()])
+    sort_dir = SelectField('Order', choices=[('desc', 'Descending'), ('asc', 'Ascending')], default='desc',
+                           validators=[Optional()])
     submit = SubmitField('Filter Trades')
     clear = SubmitField('Clear Filters', render_kw={'formnovalidate': True, 'class': 'btn btn-outline-secondary'})
 
@@ -341,6 +358,10 @@ class TradeFilterForm(FlaskForm):
 class ImportTradesForm(FlaskForm):
     csv_file = FileField('CSV File to Import',
                          validators=[DataRequired(), FileAllowed(['csv'], 'Only CSV files are allowed!')])
+    file_format = SelectField('File Contains',
+                              choices=[('trades', 'Trades (one row per trade, or the Export format)'),
+                                       ('fills', 'Broker execution fills (grouped into trades)')],
+                              default='trades', validators=[DataRequired()])
     submit = SubmitField('Upload and Import Trades')
 
 class DailyJournalForm(FlaskForm):
@@ -0,0 +1,190 @@
+"""Web-sized derivatives of uploaded trade and daily journal screenshots.
+
+Every TradeImage / DailyJournalImage gets a thumbnail and a medium rendition, resized to DERIVATIVE_WIDTHS
+and saved as WebP (JPEG where Pillow lacks WebP) next to the original as `<name>_thumbnail.webp` /
+`<name>_medium.webp`. A rendition at least as wide as the original would only be a re-encoded copy, so it
+is skipped and its path left NULL; the original serves in its place. The paths and the original's pixel
+size (set once the image is rendered) are stored on the row, which is all a template needs for an `srcset`.
+
+Uploads are rendered after the request commits, on a small thread pool (Pillow releases the GIL while
+decoding and resampling). Pages fall back to the original until a derivative exists, and
+`flask backfill-image-derivatives` renders the images uploaded before the pipeline existed.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, features
+
+from app import db
+from app.models import DailyJournalImage, TradeImage
+
+DERIVATIVE_WIDTHS = {'medium': 1280, 'thumbnail': 400}  # Largest first: each one is resized from the previous
+IMAGE_MODELS = (TradeImage, DailyJournalImage)
+BACKFILL_BATCH_SIZE = 50
+_WEBP_QUALITY = 80
+_JPEG_QUALITY = 82
+
+_renderer = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='image-derivatives')
+
+
+def _output_format():
+    return ('WEBP', '.webp') if features.check('webp') else ('JPEG', '.jpg')
+
+
+def render_derivatives(upload_folder, filepath):
+    """Writes the derivatives of one original; returns the column values to store on its row."""
+    image_format, extension = _output_format()
+    stem = os.path.splitext(filepath)[0]
+    with Image.open(os.path.join(upload_folder, filepath)) as original:
+        original.seek(0)  # First frame of animated GIFs
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        values = {'width': width, 'height': height}
+        for variant, target_width in DERIVATIVE_WIDTHS.items():
+            if image.width <= target_width:
+                values[f'{variant}_filepath'] = None  # No smaller than the original: serve that instead
+                try:
+                    os.remove(os.path.join(upload_folder, f"{stem}_{variant}{extension}"))  # From an older render
+                except FileNotFoundError:
+                    pass
+                continue
+            image = image.resize((target_width, max(1, round(image.height * target_width / image.width))),
+                                 Image.LANCZOS, reducing_gap=3.0)
+            path = f"{stem}_{variant}{extension}"
+            temporary = os.path.join(upload_folder, path + '.tmp')
+            if image_format == 'WEBP':
+                image.save(temporary, 'WEBP', quality=_WEBP_QUALITY, method=4)
+            else:
+                image.save(temporary, 'JPEG', quality=_JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(temporary, os.path.join(upload_folder, path))
+            values[f'{variant}_filepath'] = path
+    return values
+
+
+def derivative_width(image, variant):
+    """Pixel width of the image's `variant` rendition ('original' included), or None if unknown."""
+    if image.width is None:
+        return None
+    return image.width if variant == 'original' else min(image.width, DERIVATIVE_WIDTHS[variant])
+
+
+def variant_filepath(image, variant):
+    """UPLOAD_FOLDER-relative path of the requested rendition, falling back to the original."""
+    if variant in DERIVATIVE_WIDTHS:
+        return getattr(image, f'{variant}_filepath') or image.filepath
+    return image.filepath
+
+
+def image_srcset(image, endpoint):
+    """Jinja filter: the `srcset` of an image row served by `endpoint` (image_id, variant), '' until rendered."""
+    if image.width is None:
+        return ''
+    candidates = {image.width: 'original'}
+    for variant in DERIVATIVE_WIDTHS:
+        if getattr(image, f'{variant}_filepath'):
+            candidates[derivative_width(image, variant)] = variant
+    return ', '.join(f"{url_for(endpoint, image_id=image.id, variant=variant)} {width}w"
+                     for width, variant in sorted(candidates.items()))
+
+
+def _store_derivatives(model, rendered):
+    """Saves rendered column values on their rows: {image id: (original filepath, values)}.
+
+    A row that was deleted (or moved) while its image was rendered gets no update; its new files are
+    removed again so nothing is orphaned.
+    """
+    table = model.__table__
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for image_id, (filepath, values) in rendered.items():
+        result = db.session.execute(db.update(table).where(table.c.id == image_id, table.c.filepath == filepath)
+                                    .values(**values))
+        if result.rowcount == 0:
+            for variant in DERIVATIVE_WIDTHS:
+                if not values[f'{variant}_filepath']:
+                    continue
+                try:
+                    os.remove(os.path.join(upload_folder, values[f'{variant}_filepath']))
+                except OSError:
+                    pass
+    db.session.commit()
+
+
+def _render_rows(rows):
+    """Renders (id, filepath) rows on the pool; returns {id: (filepath, values)} for the ones that worked."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    futures = {image_id: (filepath, _renderer.submit(render_derivatives, upload_folder, filepath))
+               for image_id, filepath in rows}
+    rendered = {}
+    for image_id, (filepath, future) in futures.items():
+        try:
+            rendered[image_id] = (filepath, future.result())
+        except Exception as e:  # Unreadable or truncated uploads keep serving their original
+            current_app.logger.warning(f"Could not render derivatives of image {filepath}: {e}")
+    return rendered
+
+
+def schedule_image_derivatives(images):
+    """Renders derivatives for freshly uploaded image rows in the background; call after the commit."""
+    app = current_app._get_current_object()
+    for image in images:
+        _renderer.submit(_render_upload, app, type(image), image.id, image.filepath)
+
+
+def _render_upload(app, model, image_id, filepath):
+    with app.app_context():
+        try:
+            values = render_derivatives(app.config['UPLOAD_FOLDER'], filepath)
+            _store_derivatives(model, {image_id: (filepath, values)})
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not render derivatives of image {filepath}: {e}")
+        finally:
+            db.session.remove()
+
+
+def backfill_image_derivatives(batch_size=BACKFILL_BATCH_SIZE, force=False):
+    """Renders derivatives for every image row lacking them (all rows with `force`); returns the count."""
+    total = 0
+    for model in IMAGE_MODELS:
+        table = model.__table__
+        last_id = 0
+        while True:
+            query = db.select(table.c.id, table.c.filepath).where(table.c.id > last_id)
+            if not force:
+                query = query.where(table.c.width.is_(None))  # Set by every render, even one skipping variants
+            rows = db.session.execute(query.order_by(table.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            rendered = _render_rows(rows)
+            _store_derivatives(model, rendered)
+            total += len(rendered)
+            last_id = rows[-1][0]
+    return total
+
+
+def image_filepaths_select(table, *conditions):
+    """A one-column SELECT of every file (original and derivatives) of the matching image rows, e.g. for
+    file_cleanup.queue_file_removals()."""
+    columns = [table.c.filepath] + [table.c[f'{variant}_filepath'] for variant in DERIVATIVE_WIDTHS]
+    paths = db.union_all(*(db.select(column.label('path')).where(column.isnot(None), *conditions)
+                           for column in columns)).subquery()
+    return db.select(paths.c.path)
+
+
+def remove_image_files(image):
+    """Removes the original and derivatives of one image row from disk (missing files are ignored)."""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for path in [image.filepath] + [getattr(image, f'{variant}_filepath') for variant in DERIVATIVE_WIDTHS]:
+        if not path:
+            continue
+        try:
+            os.remove(os.path.join(upload_folder, path))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            current_app.logger.warning(f"Could not delete image file on disk: {path}")
@@ -0,0 +1,270 @@
+"""Background trade imports.
+
+An upload is saved under instance/import_uploads/<user_id>/, recorded as an ImportJob and handed to a
+local process pool (IMPORT_WORKERS processes), so the request returns at once and web workers never
+run a long import. The worker streams the file through CsvTradeImporter and, after every committed
+chunk, writes the job's progress and checks whether the user asked to cancel. A retry job re-reads the
+original upload but only the rows that were skipped with errors or never reached.
+"""
+import csv
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+from types import SimpleNamespace
+
+from flask import current_app
+
+from app import db
+from app.models import Activity, ImportJob
+from app.trade_import import CsvTradeImporter, FillsTradeImporter
+
+IMPORT_JOBS_KEPT = 5  # Jobs per user whose upload and error report are kept on disk (for download/retry)
+# Settings the worker processes need to build an app talking to the same database
+_WORKER_CONFIG_KEYS = ('SQLALCHEMY_DATABASE_URI', 'TESTING', 'TRADING_TIMEZONE')
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker_app = None  # The app of a worker process, created on its first job
+
+
+class ImportCancelled(Exception):
+    """Raised from the progress callback to stop a job the user cancelled (committed chunks are kept)."""
+
+
+def import_uploads_dir(user_id):
+    return os.path.join(current_app.instance_path, 'import_uploads', str(user_id))
+
+
+def import_reports_dir(user_id):
+    return os.path.join(current_app.instance_path, 'import_reports', str(user_id))
+
+
+def _upload_path(job):
+    return os.path.join(import_uploads_dir(job.user_id), f"{job.upload_token}.csv")
+
+
+def _report_path(job):
+    return os.path.join(import_reports_dir(job.user_id), f"{job.report_token}.csv")
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# --- Submitting (web process) ---
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 'spawn': workers build their own app and engine instead of inheriting the web process's connections
+            _executor = ProcessPoolExecutor(max_workers=max(1, current_app.config.get('IMPORT_WORKERS', 2)),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def create_import_job(user_id, file_storage, file_format='trades'):
+    """Saves the uploaded file and records a queued ImportJob for it (committed; not yet submitted)."""
+    folder = import_uploads_dir(user_id)
+    os.makedirs(folder, exist_ok=True)
+    job = ImportJob(user_id=user_id, filename=(file_storage.filename or 'upload.csv')[:255],
+                    file_format=file_format, upload_token=uuid.uuid4().hex, status='queued')
+    path = _upload_path(job)
+    file_storage.save(path)
+    job.bytes_total = os.path.getsize(path)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def create_retry_job(job):
+    """A queued job re-importing only the failed and unprocessed rows of `job`, or None if its upload is gone."""
+    if not os.path.exists(_upload_path(job)):
+        return None
+    retry = ImportJob(user_id=job.user_id, filename=job.filename, file_format=job.file_format,
+                      upload_token=job.upload_token,
+                      retry_of_id=job.id, bytes_total=job.bytes_total, status='queued')
+    db.session.add(retry)
+    db.session.commit()
+    return retry
+
+
+def submit_import_job(job, point_values):
+    """Hands a queued job to the worker pool; returns immediately."""
+    app = current_app._get_current_object()
+    config = {key: app.config.get(key) for key in _WORKER_CONFIG_KEYS}
+    try:
+        future = _get_executor().submit(run_import_job, config, job.id, dict(point_values))
+    except BrokenProcessPool:
+        _reset_executor()  # A worker died earlier; start a fresh pool
+        future = _get_executor().submit(run_import_job, config, job.id, dict(point_values))
+    future.add_done_callback(partial(_on_job_done, app, job.id))
+    prune_import_files(job.user_id)
+
+
+def _on_job_done(app, job_id, future):
+    """Marks the job failed if its worker crashed before it could record an outcome itself."""
+    error = 'cancelled before it started' if future.cancelled() else future.exception()
+    if error is None:
+        return
+    with app.app_context():
+        if isinstance(error, BrokenProcessPool):
+            _reset_executor()
+        app.logger.error(f"Import job {job_id} did not finish: {error!r}")
+        job = db.session.get(ImportJob, job_id)
+        if job is not None and not job.is_finished:
+            job.status = 'failed'
+            job.error_message = 'The import worker stopped unexpectedly.'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+        db.session.remove()
+
+
+def cancel_import_job(job):
+    """Cancels a queued job outright; a running one stops after its current chunk."""
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+    elif job.status == 'running':
+        job.cancel_requested = True
+    db.session.commit()
+
+
+def prune_import_files(user_id):
+    """Deletes uploads and reports of all but the user's IMPORT_JOBS_KEPT most recent jobs."""
+    jobs = ImportJob.query.filter_by(user_id=user_id).order_by(ImportJob.created_at.desc(), ImportJob.id.desc()).all()
+    kept, old = jobs[:IMPORT_JOBS_KEPT], jobs[IMPORT_JOBS_KEPT:]
+    kept_uploads = {job.upload_token for job in kept}  # Retries share their original's upload
+    changed = False
+    for job in old:
+        if not job.is_finished:
+            continue
+        if job.upload_token not in kept_uploads:
+            _remove_file(_upload_path(job))
+        if job.report_token:
+            _remove_file(_report_path(job))
+            job.report_token = None
+            changed = True
+    if changed:
+        db.session.commit()
+
+
+# --- Running (worker process) ---
+class _RetryFilter:
+    """Row filter for a retry: lines the original job reported as errors (plus the following rows of the
+    same trade) and every line after the point where the original stopped. When the original was itself a
+    retry, only lines that were in its scope count."""
+
+    def __init__(self, job):
+        self.scope = _RetryFilter(job.retry_of) if job.retry_of_id else None
+        self.resume_after = job.last_line if job.status != 'completed' else None
+        self.error_lines = set()
+        if job.report_token and os.path.exists(_report_path(job)):
+            with open(_report_path(job), newline='', encoding='utf-8') as report:
+                for row in csv.DictReader(report):
+                    if row.get('Severity') == 'error' and (row.get('Line') or '').isdigit():
+                        self.error_lines.add(int(row['Line']))
+        self._continuing = None
+
+    def __call__(self, line, trade_ref):
+        in_scope = self.scope(line, trade_ref) if self.scope is not None else True  # Always called: it has state
+        if self.resume_after is not None and line > self.resume_after:
+            return in_scope
+        if line in self.error_lines:
+            self._continuing = trade_ref or None
+            return True
+        if trade_ref and trade_ref == self._continuing:
+            return True
+        self._continuing = None
+        return False
+
+
+def run_import_job(config, job_id, point_values):
+    """Worker-process entry point: runs one ImportJob to completion, failure or cancellation."""
+    global _worker_app
+    if _worker_app is None:
+        from app import create_app
+        _worker_app = create_app(SimpleNamespace(**config))
+    with _worker_app.app_context():
+        try:
+            _run_job(job_id, point_values)
+        finally:
+            db.session.remove()
+
+
+def _run_job(job_id, point_values):
+    job = db.session.get(ImportJob, job_id)
+    if job is None or job.status != 'queued':
+        return
+    job.status, job.started_at = 'running', datetime.utcnow()
+    db.session.commit()
+
+    job.report_token = uuid.uuid4().hex
+    os.makedirs(import_reports_dir(job.user_id), exist_ok=True)
+    report_path = _report_path(job)
+    with open(_upload_path(job), 'rb') as upload, open(report_path, 'w', newline='', encoding='utf-8') as report:
+        def progress(result):
+            _record_counts(job, result)
+            job.bytes_read = upload.tell()
+            db.session.commit()
+            if job.cancel_requested:  # Reloaded after the commit, so a cancel from the web process is seen
+                raise ImportCancelled()
+
+        if job.file_format == 'fills':
+            # Fills are grouped across the whole file, so a retry re-reads all of it; source keys skip repeats
+            importer = FillsTradeImporter(job.user_id, point_values, report=report, progress=progress,
+                                          exchange_timezone=current_app.config['TRADING_TIMEZONE'])
+            run = partial(importer.run, upload)
+        else:
+            include = _RetryFilter(job.retry_of) if job.retry_of_id else None
+            importer = CsvTradeImporter(job.user_id, point_values, report=report, progress=progress)
+            run = partial(importer.run, upload, include=include)
+        try:
+            run()
+            job.status = 'completed'
+        except ImportCancelled:
+            job.status = 'cancelled'
+        except UnicodeDecodeError:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error_message = 'The file is not valid UTF-8 text. Save it as a UTF-8 CSV and try again.'
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error_message = f'Error importing trades file: {e}'
+            current_app.logger.error(f"Fatal error in import job {job.id}: {e}", exc_info=True)
+
+    _record_counts(job, importer.result)
+    job.bytes_read = job.bytes_total if job.status == 'completed' else job.bytes_read
+    job.finished_at = datetime.utcnow()
+    if not importer.result.has_issues:
+        _remove_file(report_path)
+        job.report_token = None
+    if job.imported:
+        Activity.log(job.user_id, 'trades_imported', f"Imported {job.imported} trades from CSV '{job.filename}'",
+                     resource_id=job.id, resource_type='import_job')
+    db.session.commit()
+
+
+def _record_counts(job, result):
+    job.rows_read = result.rows_read
+    job.imported = result.imported
+    job.skipped = result.skipped
+    job.warnings = result.warnings
+    job.duplicates = result.duplicates
+    job.last_line = result.last_line
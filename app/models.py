@@ -1,9 +1,13 @@
 from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, date as py_date, time as py_time
 from datetime import datetime as dt # Alias for dt.utcnow
 import enum
+import itertools
 import uuid
 import os
 import statistics
@@ -36,10 +40,13 @@ class User(db.Model, UserMixin): # ... (Keep as previously corrected) ...
     profile_picture = db.Column(db.String(200), nullable=True)
     bio = db.Column(db.Text, nullable=True)
     is_email_verified = db.Column(db.Boolean, nullable=False, server_default='0')
+    # Bumped whenever the user's trades, journals or models change; part of every analytics cache key
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     activities = db.relationship('Activity', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     files = db.relationship('File', backref='user', lazy='dynamic', cascade='all, delete-orphan') # General files
     settings = db.relationship('Settings', backref='user', uselist=False, cascade='all, delete-orphan')
     api_keys = db.relationship('ApiKey', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    storage_counters = db.relationship('StorageUsage', lazy='dynamic', cascade='all, delete-orphan')
     trading_models = db.relationship('TradingModel', backref='user', lazy='dynamic')
     trades = db.relationship('Trade', backref='user', lazy='dynamic')
     daily_journals = db.relationship('DailyJournal', backref='user', lazy='dynamic')
@@ -55,7 +62,8 @@ class User(db.Model, UserMixin): # ... (Keep as previously corrected) ...
         api_key = ApiKey(user_id=self.id, name=name, key=uuid.uuid4().hex, expires_at=datetime.utcnow() + timedelta(days=expiration_days))
         db.session.add(api_key); return api_key
     @property
-    def storage_usage(self): return db.session.query(db.func.sum(File.filesize)).filter_by(user_id=self.id).scalar() or 0
+    def storage_usage(self):  # Bytes of all the user's uploads, from the counters kept by app.storage_usage
+        return db.session.query(db.func.sum(StorageUsage.bytes)).filter_by(user_id=self.id).scalar() or 0
     @classmethod
     def find_by_username(cls, username): return cls.query.filter_by(username=username).first()
     @classmethod
@@ -73,6 +81,7 @@ class Activity(db.Model): # ... (Keep as previously corrected) ...
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     resource_id = db.Column(db.Integer, nullable=True)
     resource_type = db.Column(db.String(50), nullable=True)
+    __table_args__ = (db.Index('ix_activity_user_timestamp', 'user_id', 'timestamp'),)  # Per-user activity feed
     @classmethod
     def log(cls, user_id, action, details=None, ip_address=None, user_agent=None, resource_id=None, resource_type=None):
         activity = cls(user_id=user_id, action=action, details=details, ip_address=ip_address, user_agent=user_agent, resource_id=resource_id, resource_type=resource_type)
@@ -93,6 +102,8 @@ class File(db.Model): # ... (Keep as previously corrected) ...
     description = db.Column(db.Text, nullable=True)
     is_public = db.Column(db.Boolean, nullable=False, default=False)
     download_count = db.Column(db.Integer, nullable=False, default=0)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the file; its ETag (app.file_delivery)
+    __table_args__ = (db.Index('ix_file_user_upload_date', 'user_id', 'upload_date'),)  # "My Files", newest first
     @property
     def full_disk_path(self):
         upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
@@ -260,6 +271,12 @@ class TradeImage(db.Model): # ... (Keep as previously corrected) ...
     mime_type = db.Column(db.String(100), nullable=True)
     upload_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     caption = db.Column(db.String(255), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the original; its ETag (app.file_delivery)
+    # Web-sized renditions next to the original, filled in by app.image_derivatives after upload
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    medium_filepath = db.Column(db.String(255), nullable=True)
+    thumbnail_filepath = db.Column(db.String(255), nullable=True)
     uploader = db.relationship('User', backref='uploaded_trade_images', lazy=True)
     @property
     def full_disk_path(self):
@@ -267,6 +284,68 @@ class TradeImage(db.Model): # ... (Keep as previously corrected) ...
         return os.path.join(upload_folder, self.filepath)
     def __repr__(self): return f'<TradeImage {self.filename} for Trade ID {self.trade_id}>'
 
+class PendingFileRemoval(db.Model):
+    """An upload whose row was deleted; queued in the same transaction and removed by app.file_cleanup."""
+    __tablename__ = 'pending_file_removal'
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), nullable=False)  # Relative to UPLOAD_FOLDER, like TradeImage.filepath
+    queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    def __repr__(self): return f"<PendingFileRemoval {self.path}>"
+
+def compute_trade_metrics(trade_date, direction, point_value, initial_stop_loss, terminus_target, how_closed,
+                          entries, exits):
+    """Derives a trade's metrics from its legs without touching the database.
+
+    `entries` and `exits` are iterables of (time, contracts, price) tuples. Returns a dict keyed
+    by Trade.METRIC_FIELDS, so it can be applied to an instance or used in a bulk UPDATE.
+    """
+    entries = [e for e in entries if e[1] is not None]
+    exits = [x for x in exits if x[1] is not None]
+    contracts_in = sum(e[1] for e in entries)
+    contracts_out = sum(x[1] for x in exits)
+    avg_entry = (sum(e[1] * e[2] for e in entries if e[2] is not None) / contracts_in) if contracts_in else None
+    avg_exit = (sum(x[1] * x[2] for x in exits if x[2] is not None) / contracts_out) if contracts_out else None
+    pv = point_value
+
+    gross_pnl = 0.0
+    if avg_entry is not None and avg_exit is not None and contracts_out and pv:
+        if direction == "Long": gross_pnl = (avg_exit - avg_entry) * contracts_out * pv
+        elif direction == "Short": gross_pnl = (avg_entry - avg_exit) * contracts_out * pv
+
+    risk_reward = None
+    sl, tp = initial_stop_loss, terminus_target
+    if avg_entry is not None and sl is not None and tp is not None and sl != avg_entry:
+        risk_per_contract = abs(avg_entry - sl)
+        risk_reward = abs(tp - avg_entry) / risk_per_contract if risk_per_contract > 0 else None
+
+    timed_entries = sorted((e for e in entries if e[0] is not None), key=lambda e: e[0])
+    first_entry = timed_entries[0] if timed_entries else (entries[0] if entries else None)
+    dollar_risk = None
+    if first_entry is not None and sl is not None and pv:
+        risk_points = 0.0
+        if direction == "Long": risk_points = first_entry[2] - sl
+        elif direction == "Short": risk_points = sl - first_entry[2]
+        dollar_risk = risk_points * first_entry[1] * pv if risk_points > 0 else 0.0
+
+    pnl_in_r = None
+    if dollar_risk and contracts_out > 0 and how_closed not in ["Still Open", None, '']:
+        pnl_in_r = gross_pnl / dollar_risk
+
+    time_in_trade_seconds = None
+    exit_times = [x[0] for x in exits if x[0] is not None]
+    if timed_entries and exit_times and trade_date is not None:
+        opened = datetime.combine(trade_date, timed_entries[0][0])
+        closed = datetime.combine(trade_date, max(exit_times))
+        time_in_trade_seconds = int((closed - opened).total_seconds())
+
+    return {
+        'total_contracts_entered': contracts_in, 'total_contracts_exited': contracts_out,
+        'average_entry_price': avg_entry, 'average_exit_price': avg_exit,
+        'gross_pnl': gross_pnl, 'dollar_risk': dollar_risk, 'pnl_in_r': pnl_in_r,
+        'risk_reward_ratio': risk_reward, 'time_in_trade_seconds': time_in_trade_seconds,
+    }
+
+
 class Trade(db.Model): # ... (Keep as previously corrected) ...
     __tablename__ = 'trade'
     id = db.Column(db.Integer, primary_key=True)
@@ -294,88 +373,175 @@ class Trade(db.Model): # ... (Keep as previously corrected) ...
     trade_management_notes = db.Column(db.Text, nullable=True)
     errors_notes = db.Column(db.Text, nullable=True)
     improvements_notes = db.Column(db.Text, nullable=True)
-    tags = db.Column(db.String(255), nullable=True)
     trading_model_id = db.Column(db.Integer, db.ForeignKey('trading_model.id', name='fk_trade_trading_model'), nullable=True)
     trading_model = db.relationship('TradingModel', backref=db.backref('trades', lazy='dynamic'))
     entries = db.relationship('EntryPoint', backref='trade', lazy='dynamic', cascade="all, delete-orphan")
     exits = db.relationship('ExitPoint', backref='trade', lazy='dynamic', cascade="all, delete-orphan")
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_trade_user'), nullable=False, index=True)
     images = db.relationship('TradeImage', backref='trade', lazy='dynamic', cascade="all, delete-orphan")
-    @property
-    def total_contracts_entered(self):
-        if not self.entries: return 0
-        return sum(entry.contracts for entry in self.entries if entry.contracts is not None)
-    @property
-    def average_entry_price(self):
-        total_contracts = self.total_contracts_entered
-        if not total_contracts or total_contracts == 0: return None
-        total_value = sum(entry.contracts * entry.entry_price for entry in self.entries if entry.contracts is not None and entry.entry_price is not None)
-        return total_value / total_contracts
-    @property
-    def total_contracts_exited(self):
-        if not self.exits: return 0
-        return sum(exit_point.contracts for exit_point in self.exits if exit_point.contracts is not None)
-    @property
-    def average_exit_price(self):
-        total_exited = self.total_contracts_exited
-        if not total_exited or total_exited == 0: return None
-        total_exit_value = sum(exit_point.contracts * exit_point.exit_price for exit_point in self.exits if exit_point.contracts is not None and exit_point.exit_price is not None)
-        return total_exit_value / total_exited
-    @property
-    def gross_pnl(self):
-        avg_entry = self.average_entry_price; avg_exit = self.average_exit_price
-        contracts_exited = self.total_contracts_exited; pv = self.point_value
-        if avg_entry is None or avg_exit is None or contracts_exited == 0 or pv is None or pv == 0: return 0.0
-        pnl_per_contract_in_points = 0.0
-        if self.direction == "Long": pnl_per_contract_in_points = avg_exit - avg_entry
-        elif self.direction == "Short": pnl_per_contract_in_points = avg_entry - avg_exit
-        return pnl_per_contract_in_points * contracts_exited * pv
-    @property
-    def risk_reward_ratio(self):
-        avg_entry = self.average_entry_price; sl = self.initial_stop_loss; tp = self.terminus_target
-        if avg_entry is None or sl is None or tp is None or sl == avg_entry: return None
-        potential_risk_per_contract = abs(avg_entry - sl)
-        potential_reward_per_contract = abs(tp - avg_entry)
-        return potential_reward_per_contract / potential_risk_per_contract if potential_risk_per_contract > 0 else None
+    # Normalized tags (see Tag/TradeTag); loaded in one extra query per page of trades
+    tag_links = db.relationship('TradeTag', back_populates='trade', lazy='selectin', cascade="all, delete-orphan")
+
+    # Materialized metrics, derived from the entry/exit legs by recalculate_metrics().
+    # Stored so list pages, exports and analytics don't re-query the legs per row.
+    total_contracts_entered = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_contracts_exited = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    average_entry_price = db.Column(db.Float, nullable=True)
+    average_exit_price = db.Column(db.Float, nullable=True)
+    gross_pnl = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    dollar_risk = db.Column(db.Float, nullable=True)
+    pnl_in_r = db.Column(db.Float, nullable=True)
+    risk_reward_ratio = db.Column(db.Float, nullable=True)
+    time_in_trade_seconds = db.Column(db.Integer, nullable=True)  # None while open; negative if exit precedes entry
+    metrics_updated_at = db.Column(db.DateTime, nullable=True)
+    # Fingerprint of the broker fills a trade was built from (app.trade_import); stops re-imports duplicating it
+    source_key = db.Column(db.String(64), nullable=True)
+
+    METRIC_FIELDS = ('total_contracts_entered', 'total_contracts_exited', 'average_entry_price',
+                     'average_exit_price', 'gross_pnl', 'dollar_risk', 'pnl_in_r', 'risk_reward_ratio',
+                     'time_in_trade_seconds')
+
+    # Indexes backing the trades list filters/sorts on the materialized metrics
+    __table_args__ = (
+        db.Index('ix_trade_user_date', 'user_id', 'trade_date'),
+        db.Index('ix_trade_user_gross_pnl', 'user_id', 'gross_pnl'),
+        db.Index('ix_trade_user_pnl_in_r', 'user_id', 'pnl_in_r'),
+        db.Index('ix_trade_user_time_in_trade', 'user_id', 'time_in_trade_seconds'),
+        db.Index('ix_trade_user_source_key', 'user_id', 'source_key', unique=True),
+    )
+
+    def recalculate_metrics(self, entries=None, exits=None):
+        """Recomputes the materialized metric columns from this trade's legs.
+
+        Pass already-loaded `entries`/`exits` to avoid re-querying them; otherwise the
+        dynamic relationships are queried once each (autoflush picks up pending legs).
+        """
+        if entries is None: entries = self.entries.all()
+        if exits is None: exits = self.exits.all()
+        metrics = compute_trade_metrics(
+            self.trade_date, self.direction, self.point_value, self.initial_stop_loss,
+            self.terminus_target, self.how_closed,
+            [(e.entry_time, e.contracts, e.entry_price) for e in entries],
+            [(x.exit_time, x.contracts, x.exit_price) for x in exits])
+        for field, value in metrics.items():
+            setattr(self, field, value)
+        self.metrics_updated_at = datetime.utcnow()
+        return metrics
+
+    @hybrid_property
+    def is_open(self):
+        return self.how_closed == 'Still Open' or self.total_contracts_exited < self.total_contracts_entered
+
+    @is_open.expression
+    def is_open(cls):
+        return db.or_(cls.how_closed == 'Still Open', cls.total_contracts_exited < cls.total_contracts_entered)
+
     @property
     def time_in_trade(self):
-        if not self.entries.first(): return "N/A"
-        first_entry_obj = self.entries.order_by(EntryPoint.entry_time).first()
-        if not first_entry_obj or not first_entry_obj.entry_time: return "Open"
-        min_entry_datetime = datetime.combine(self.trade_date, first_entry_obj.entry_time)
-        last_exit_obj = self.exits.order_by(ExitPoint.exit_time.desc()).first()
-        if not last_exit_obj or not last_exit_obj.exit_time: return "Open"
-        max_exit_datetime = datetime.combine(self.trade_date, last_exit_obj.exit_time)
-        if max_exit_datetime >= min_entry_datetime:
-            duration = max_exit_datetime - min_entry_datetime; total_seconds = int(duration.total_seconds())
-            hours = total_seconds // 3600; minutes = (total_seconds % 3600) // 60
-            return f"{hours:02d}h {minutes:02d}m"
-        return "N/A (Exit before Entry?)"
+        if not self.total_contracts_entered: return "N/A"
+        if self.time_in_trade_seconds is None: return "Open"
+        if self.time_in_trade_seconds < 0: return "N/A (Exit before Entry?)"
+        hours = self.time_in_trade_seconds // 3600; minutes = (self.time_in_trade_seconds % 3600) // 60
+        return f"{hours:02d}h {minutes:02d}m"
     @property
-    def dollar_risk(self):
-        first_entry = self.entries.order_by(EntryPoint.entry_time).first(); sl = self.initial_stop_loss; pv = self.point_value
-        if not first_entry or sl is None or pv is None or pv == 0: return None
-        entry_price = first_entry.entry_price; contracts = first_entry.contracts
-        risk_per_contract_in_points = 0.0
-        if self.direction == "Long": risk_per_contract_in_points = entry_price - sl
-        elif self.direction == "Short": risk_per_contract_in_points = sl - entry_price
-        return risk_per_contract_in_points * contracts * pv if risk_per_contract_in_points > 0 else 0.0
-    @property
-    def pnl_in_r(self):
-        initial_risk_dollars = self.dollar_risk; pnl_dollars = self.gross_pnl
-        if initial_risk_dollars is None or initial_risk_dollars == 0 or pnl_dollars is None: return None
-        if self.total_contracts_exited > 0 and self.how_closed not in ["Still Open", None, '']: return pnl_dollars / initial_risk_dollars
-        return None
+    def tags(self):
+        """The trade's tag names, sorted."""
+        return sorted(link.tag.name for link in self.tag_links)
+
+    @tags.setter
+    def tags(self, names):
+        """Replaces the trade's tags; accepts a list of names or a comma/semicolon separated string."""
+        names = Tag.parse_names(names)
+        wanted = set(names)
+        for link in list(self.tag_links):
+            if link.tag.name not in wanted:
+                self.tag_links.remove(link)
+        existing = {link.tag.name for link in self.tag_links}
+        missing = [name for name in names if name not in existing]
+        if missing:
+            for tag in Tag.resolve(self.user_id, missing):
+                self.tag_links.append(TradeTag(tag=tag, user_id=self.user_id))
+
     def __repr__(self): return f"<Trade {self.id} {self.instrument} on {self.trade_date} (User: {self.user_id})>"
 
 
+class Tag(db.Model):
+    __tablename__ = 'tag'
+    NAME_MAX_LENGTH = 50
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_tag_user'), nullable=False)
+    name = db.Column(db.String(NAME_MAX_LENGTH), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='uq_user_tag_name'),)
+
+    @staticmethod
+    def parse_names(value):
+        """Normalizes a list or a comma/semicolon separated string into unique, stripped tag names."""
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.replace(';', ',').split(',')
+        names = []
+        for name in value:
+            name = (name or '').strip()[:Tag.NAME_MAX_LENGTH]
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    @classmethod
+    def resolve(cls, user_id, names):
+        """Returns the user's Tag rows for `names`, creating (and adding to the session) any missing ones."""
+        names = cls.parse_names(names)
+        if not names:
+            return []
+        with db.session.no_autoflush:
+            found = {tag.name: tag for tag in cls.query.filter(cls.user_id == user_id, cls.name.in_(names))}
+            # Tags created earlier in this unit of work (not yet flushed) must be reused, not duplicated
+            for obj in db.session.new:
+                if isinstance(obj, cls) and obj.user_id == user_id and obj.name in names:
+                    found.setdefault(obj.name, obj)
+        tags = []
+        for name in names:
+            tag = found.get(name)
+            if tag is None:
+                tag = found[name] = cls(user_id=user_id, name=name)
+                db.session.add(tag)
+            tags.append(tag)
+        return tags
+
+    @classmethod
+    def counts_for_user(cls, user_id):
+        """{tag name: number of trades carrying it} for all of the user's tags, in one grouped query."""
+        rows = db.session.execute(
+            db.select(cls.name, db.func.count(TradeTag.trade_id))
+            .outerjoin(TradeTag, TradeTag.tag_id == cls.id)
+            .where(cls.user_id == user_id)
+            .group_by(cls.id, cls.name)).all()
+        return dict(rows)
+
+    def __repr__(self): return f"<Tag '{self.name}' (User: {self.user_id})>"
+
+
+class TradeTag(db.Model):
+    """Trade <-> Tag association. user_id is denormalized so tag filters are index-only scans."""
+    __tablename__ = 'trade_tag'
+    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id', name='fk_tradetag_trade'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', name='fk_tradetag_tag'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_tradetag_user'), nullable=False)
+    trade = db.relationship('Trade', back_populates='tag_links')
+    tag = db.relationship('Tag', lazy='joined')
+    __table_args__ = (db.Index('ix_trade_tag_user_tag_trade', 'user_id', 'tag_id', 'trade_id'),)
+
+    def __repr__(self): return f"<TradeTag trade={self.trade_id} tag={self.tag_id}>"
+
+
 class EntryPoint(db.Model): # ... (Keep as previously corrected) ...
     __tablename__ = 'entry_point'
     id = db.Column(db.Integer, primary_key=True)
     entry_time = db.Column(db.Time, nullable=False)
     contracts = db.Column(db.Integer, nullable=False)
     entry_price = db.Column(db.Float, nullable=False)
-    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id', name='fk_entrypoint_trade'), nullable=False)
+    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id', name='fk_entrypoint_trade'), nullable=False, index=True)
     def __repr__(self): return f"<EntryPoint ID: {self.id} for Trade ID: {self.trade_id} ({self.contracts} @ {self.entry_price})>"
 
 class ExitPoint(db.Model): # ... (Keep as previously corrected) ...
@@ -384,7 +550,7 @@ class ExitPoint(db.Model): # ... (Keep as previously corrected) ...
     exit_time = db.Column(db.Time, nullable=True)
     contracts = db.Column(db.Integer, nullable=True)
     exit_price = db.Column(db.Float, nullable=True)
-    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id', name='fk_exitpoint_trade'), nullable=False)
+    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id', name='fk_exitpoint_trade'), nullable=False, index=True)
     def __repr__(self): return f"<ExitPoint ID: {self.id} for Trade ID: {self.trade_id} ({self.contracts} @ {self.exit_price})>"
 
 
@@ -403,6 +569,12 @@ class DailyJournalImage(db.Model):
     upload_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     image_type = db.Column(db.String(50), nullable=True)  # e.g., 'pre_market_analysis', 'eod_chart'
     caption = db.Column(db.String(255), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the original; its ETag (app.file_delivery)
+    # Web-sized renditions next to the original, filled in by app.image_derivatives after upload
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    medium_filepath = db.Column(db.String(255), nullable=True)
+    thumbnail_filepath = db.Column(db.String(255), nullable=True)
 
     uploader = db.relationship('User', backref='uploaded_daily_journal_images', lazy=True)
 
@@ -699,4 +871,166 @@ class AccountSetting(db.Model): # ... (Keep as previously corrected) ...
     value_float = db.Column(db.Float, nullable=True)
     value_bool = db.Column(db.Boolean, nullable=True)
     description = db.Column(db.Text, nullable=True)
-    def __repr__(self): return f"<AccountSetting '{self.setting_name}'>"
\ No newline at end of file
+    def __repr__(self): return f"<AccountSetting '{self.setting_name}'>"
+
+class PerformanceRollup(db.Model):
+    """Pre-aggregated trade results per user, period and (optional) model/instrument.
+
+    Maintained incrementally by app.rollups on every trade flush; `flask rebuild-performance-rollups`
+    recomputes it from scratch.
+    """
+    __tablename__ = 'performance_rollup'
+    PERIOD_TYPES = ('day', 'week', 'month', 'quarter', 'year')
+    DIMENSIONS = ('all', 'model', 'instrument')
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_performancerollup_user'), nullable=False)
+    period_type = db.Column(db.String(10), nullable=False)  # One of PERIOD_TYPES
+    period_start = db.Column(db.Date, nullable=False)  # First day of the period (weeks start on Monday)
+    dimension = db.Column(db.String(20), nullable=False, default='all')  # One of DIMENSIONS
+    dimension_value = db.Column(db.String(100), nullable=False, default='')  # Model id / instrument; '' for all
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    win_count = db.Column(db.Integer, nullable=False, default=0)
+    loss_count = db.Column(db.Integer, nullable=False, default=0)
+    gross_pnl = db.Column(db.Float, nullable=False, default=0.0)
+    sum_r = db.Column(db.Float, nullable=False, default=0.0)
+    max_mae = db.Column(db.Float, nullable=True)
+    __table_args__ = (db.UniqueConstraint('user_id', 'period_type', 'period_start', 'dimension', 'dimension_value',
+                                          name='uq_performance_rollup_bucket'),)
+
+    @property
+    def win_rate(self):
+        return round(self.win_count / self.trade_count * 100, 1) if self.trade_count else None
+
+    def __repr__(self):
+        return (f"<PerformanceRollup {self.period_type} {self.period_start} {self.dimension}={self.dimension_value!r} "
+                f"(User: {self.user_id})>")
+
+class StorageUsage(db.Model):
+    """Bytes and number of one user's uploads of one category (general files, trade or journal images).
+
+    Maintained by app.storage_usage in the same transaction as every upload and delete;
+    `flask reconcile-storage-usage` recomputes it from the upload tables.
+    """
+    __tablename__ = 'storage_usage'
+    CATEGORIES = ('file', 'trade_image', 'journal_image')
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_storageusage_user'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)  # One of CATEGORIES
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('user_id', 'category', name='uq_storage_usage_user_category'),)
+
+    def __repr__(self):
+        return f"<StorageUsage {self.category}: {self.file_count} files, {self.bytes} B (User: {self.user_id})>"
+
+class PeriodSummary(db.Model):
+    """Cached performance summary of one week/month/quarter/year of a user's trading (see app.period_summaries).
+
+    Rows are deleted whenever a trade or daily journal inside the period changes and rebuilt on next view.
+    """
+    __tablename__ = 'period_summary'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_periodsummary_user'), nullable=False)
+    period_type = db.Column(db.String(10), nullable=False)  # week, month, quarter or year
+    period_start = db.Column(db.Date, nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('user_id', 'period_type', 'period_start', name='uq_period_summary'),)
+
+    def __repr__(self):
+        return f"<PeriodSummary {self.period_type} {self.period_start} (User: {self.user_id})>"
+
+class ImportJob(db.Model):
+    """A CSV trade import run in the background by app.import_jobs; polled by the import page for progress."""
+    __tablename__ = 'import_job'
+    STATUSES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+    FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+    FORMATS = {'trades': 'Trades CSV', 'fills': 'Broker fills'}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_importjob_user'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # Name of the uploaded file, for display
+    file_format = db.Column(db.String(20), nullable=False, default='trades', server_default='trades')  # FORMATS key
+    upload_token = db.Column(db.String(32), nullable=False)  # Stored upload: import_uploads/<user_id>/<token>.csv
+    report_token = db.Column(db.String(32), nullable=True)  # Error report, if the import had issues
+    retry_of_id = db.Column(db.Integer, db.ForeignKey('import_job.id', name='fk_importjob_retry_of'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # One of STATUSES
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    bytes_total = db.Column(db.Integer, nullable=False, default=0)
+    bytes_read = db.Column(db.Integer, nullable=False, default=0)
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    warnings = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_line = db.Column(db.Integer, nullable=False, default=0)  # Last CSV line fully handled (resume point)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    retry_of = db.relationship('ImportJob', remote_side=[id])
+    __table_args__ = (db.Index('ix_import_job_user_created', 'user_id', 'created_at'),)
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def progress_percent(self):
+        if self.status == 'completed':
+            return 100
+        return min(99, int(self.bytes_read * 100 / self.bytes_total)) if self.bytes_total else 0
+
+    @property
+    def can_retry(self):
+        """Finished with rows left over: skipped trades, or rows never reached because it failed or was cancelled."""
+        return self.is_finished and (self.skipped > 0 or self.status != 'completed')
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status, 'cancel_requested': self.cancel_requested,
+                'progress_percent': self.progress_percent, 'rows_read': self.rows_read, 'imported': self.imported,
+                'skipped': self.skipped, 'warnings': self.warnings, 'duplicates': self.duplicates,
+                'error_message': self.error_message,
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None}
+
+    def __repr__(self): return f"<ImportJob {self.id} {self.status} '{self.filename}' (User: {self.user_id})>"
+
+# --- Per-user data version (invalidates cached analytics) ---
+# Rows that carry user_id directly, and trade legs whose owner is found through trade_id.
+VERSIONED_USER_MODELS = (Trade, TradeTag, Tag, DailyJournal, TradingModel)
+VERSIONED_TRADE_CHILD_MODELS = (EntryPoint, ExitPoint)
+
+
+def bump_data_version(user_ids, connection=None):
+    """Increments User.data_version for the given users.
+
+    Called automatically after every ORM flush touching a versioned model; bulk Core writes that bypass
+    the unit of work (e.g. `db.session.execute(db.update(Trade), rows)`) must call it themselves.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    user_table = User.__table__
+    statement = (db.update(user_table).where(user_table.c.id.in_(user_ids))
+                 .values(data_version=user_table.c.data_version + 1))
+    (connection or db.session.connection()).execute(statement)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_data_versions_after_flush(session, flush_context):
+    user_ids, trade_ids = set(), set()
+    for obj in itertools.chain(session.new, session.deleted, session.dirty):
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        # Read from the instance dict so no lazy load is attempted mid-flush (deleted rows are gone)
+        if isinstance(obj, VERSIONED_USER_MODELS):
+            user_ids.add(sa_inspect(obj).dict.get('user_id'))
+        elif isinstance(obj, VERSIONED_TRADE_CHILD_MODELS):
+            trade_ids.add(sa_inspect(obj).dict.get('trade_id'))
+    trade_ids.discard(None)
+    connection = session.connection()
+    if trade_ids:
+        user_ids.update(connection.execute(
+            db.select(Trade.__table__.c.user_id).where(Trade.__table__.c.id.in_(trade_ids))).scalars())
+    bump_data_version(user_ids, connection)
@@ -0,0 +1,190 @@
+"""Performance summaries shown next to the weekly, monthly, quarterly and yearly journals.
+
+A summary holds the period's totals (read from its PerformanceRollup row), trading days, the best and
+worst TOP_TRADES trades, the days with a rules violation and the average daily journal ratings. The
+trades are read in a single streaming pass that feeds two bounded heaps, so a yearly summary touches
+each trade of the year once and never sorts them.
+
+Summaries are cached in the `period_summary` table, which every process shares. A cached row is deleted
+when a trade or daily journal dated inside its period changes: through the session listener below for
+ORM writes, and through rollups._apply_deltas() for bulk trade writes, whose deltas name the periods.
+"""
+import heapq
+import itertools
+from datetime import date as py_date
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.analytics import JOURNAL_RATING_FIELDS, _round
+from app.models import DailyJournal, PerformanceRollup, PeriodSummary, Trade
+from app.rollups import period_end, period_start
+
+SUMMARY_PERIOD_TYPES = ('week', 'month', 'quarter', 'year')
+TOP_TRADES = 5
+RULE_VIOLATION_RATING = 2  # A trade whose rules rating is this or lower marks its day as a rules violation
+_INVALIDATE_BATCH_SIZE = 500
+
+
+def period_keys(user_id, day):
+    """The (user_id, period_type, period_start) of every summary period containing `day`."""
+    return [(user_id, period_type, period_start(period_type, day)) for period_type in SUMMARY_PERIOD_TYPES]
+
+
+def invalidate_period_summaries(connection, keys):
+    """Deletes the cached summaries for the given (user_id, period_type, period_start) keys."""
+    table = PeriodSummary.__table__
+    keys = [key for key in set(keys) if key[1] in SUMMARY_PERIOD_TYPES]
+    for offset in range(0, len(keys), _INVALIDATE_BATCH_SIZE):
+        batch = keys[offset:offset + _INVALIDATE_BATCH_SIZE]
+        connection.execute(db.delete(table).where(
+            db.tuple_(table.c.user_id, table.c.period_type, table.c.period_start).in_(batch)))
+
+
+def clear_period_summaries(connection, user_ids=None):
+    """Deletes all cached summaries of the given users (everyone when None)."""
+    table = PeriodSummary.__table__
+    statement = db.delete(table)
+    if user_ids is not None:
+        statement = statement.where(table.c.user_id.in_(list(user_ids)))
+    connection.execute(statement)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_summaries_after_flush(session, flush_context):
+    keys = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Trade):
+            date_attribute = 'trade_date'
+        elif isinstance(obj, DailyJournal):
+            date_attribute = 'journal_date'
+        else:
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        state = sa_inspect(obj)
+        history = state.attrs[date_attribute].history  # Still the pre-flush history here: old and new dates
+        for day in itertools.chain(history.added, history.unchanged, history.deleted):
+            if day is not None:
+                keys.update(period_keys(state.dict.get('user_id'), day))
+    if keys:
+        invalidate_period_summaries(session.connection(), keys)
+
+
+def _trade_entry(row):
+    return {'id': row.id, 'trade_date': row.trade_date.isoformat(), 'instrument': row.instrument,
+            'direction': row.direction, 'pnl': _round(row.gross_pnl or 0.0), 'r': _round(row.pnl_in_r, 2)}
+
+
+def build_period_summary(user_id, period_type, start):
+    """Computes the summary of the period of `period_type` starting on `start` (no caching)."""
+    end = period_end(period_type, start)
+    connection = db.session.connection()
+
+    rollups = PerformanceRollup.__table__
+    totals = connection.execute(
+        db.select(rollups.c.trade_count, rollups.c.win_count, rollups.c.loss_count, rollups.c.gross_pnl,
+                  rollups.c.sum_r)
+        .where(rollups.c.user_id == user_id, rollups.c.period_type == period_type,
+               rollups.c.period_start == start, rollups.c.dimension == 'all')).first()
+    trade_count, wins, losses, net_pnl, net_r = totals or (0, 0, 0, 0.0, 0.0)
+
+    # One pass: min-heap of the best trades and min-heap (on -pnl) of the worst, each capped at TOP_TRADES
+    trades = Trade.__table__
+    best, worst, trading_days, violation_days = [], [], set(), set()
+    result = connection.execute(
+        db.select(trades.c.id, trades.c.trade_date, trades.c.instrument, trades.c.direction, trades.c.gross_pnl,
+                  trades.c.pnl_in_r, trades.c.rules_rating)
+        .where(trades.c.user_id == user_id, trades.c.trade_date.between(start, end))
+        .execution_options(yield_per=2000))
+    for row in result:
+        pnl = row.gross_pnl or 0.0
+        trading_days.add(row.trade_date)
+        if row.rules_rating is not None and row.rules_rating <= RULE_VIOLATION_RATING:
+            violation_days.add(row.trade_date)
+        for heap, key in ((best, pnl), (worst, -pnl)):
+            item = (key, -row.id, row)  # -id: among equal P&L the earlier trade ranks first
+            if len(heap) < TOP_TRADES:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+
+    journals = DailyJournal.__table__
+    journal_row = connection.execute(
+        db.select(db.func.count(), *(db.func.avg(journals.c[field]) for field in JOURNAL_RATING_FIELDS))
+        .where(journals.c.user_id == user_id, journals.c.journal_date.between(start, end))).first()
+
+    return {
+        'period_type': period_type,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'trade_count': trade_count,
+        'trading_days': len(trading_days),
+        'wins': wins,
+        'losses': losses,
+        'win_rate': _round(wins / trade_count * 100, 1) if trade_count else None,
+        'net_pnl': _round(net_pnl),
+        'net_r': _round(net_r),
+        'expectancy': _round(net_pnl / trade_count) if trade_count else None,
+        'best_trades': [_trade_entry(item[2]) for item in sorted(best, key=lambda item: item[:2], reverse=True)
+                        if item[0] > 0],
+        'worst_trades': [_trade_entry(item[2]) for item in sorted(worst, key=lambda item: item[:2], reverse=True)
+                         if item[0] > 0],
+        'rule_violation_days': [day.isoformat() for day in sorted(violation_days)],
+        'journal_days': journal_row[0],
+        'average_ratings': {field: _round(value) for field, value in zip(JOURNAL_RATING_FIELDS, journal_row[1:])},
+    }
+
+
+def get_period_summary(user_id, period_type, day):
+    """The summary of the `period_type` period containing `day`, from the cache or computed and stored."""
+    start = period_start(period_type, day)
+    cached = db.session.execute(
+        db.select(PeriodSummary.payload).where(PeriodSummary.user_id == user_id,
+                                               PeriodSummary.period_type == period_type,
+                                               PeriodSummary.period_start == start)).scalar()
+    if cached is not None:
+        return cached
+    summary = build_period_summary(user_id, period_type, start)
+    try:
+        db.session.execute(db.insert(PeriodSummary.__table__).values(
+            user_id=user_id, period_type=period_type, period_start=start, payload=summary))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Another request stored the same period first
+    return summary
+
+
+def parse_period(period_type, text):
+    """First day of the period named by `text`: '2024-W07', '2024-03', '2024-Q1' or '2024'; None if invalid."""
+    try:
+        if period_type == 'week':
+            year, week = text.upper().split('-W')
+            return py_date.fromisocalendar(int(year), int(week), 1)
+        if period_type == 'month':
+            year, month = text.split('-')
+            return py_date(int(year), int(month), 1)
+        if period_type == 'quarter':
+            year, quarter = text.upper().split('-Q')
+            if not 1 <= int(quarter) <= 4:
+                return None
+            return py_date(int(year), 3 * int(quarter) - 2, 1)
+        if period_type == 'year':
+            return py_date(int(text), 1, 1)
+    except ValueError:
+        return None
+    return None
+
+
+def format_period(period_type, start):
+    """Inverse of parse_period()."""
+    if period_type == 'week':
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period_type == 'month':
+        return f"{start.year}-{start.month:02d}"
+    if period_type == 'quarter':
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    return str(start.year)
@@ -0,0 +1,286 @@
+"""Incrementally maintained P&L rollups (day -> week -> month -> quarter -> year).
+
+Every trade contributes to one bucket per (period type, dimension): 5 periods x {all, model, instrument}.
+Session listeners diff each flushed trade against its previously persisted row and apply the deltas to
+the affected `PerformanceRollup` rows inside the same transaction, so the rollups can never drift from
+the trades they summarize. Bulk Core writes bypass the unit of work: bulk inserts can pass the new rows
+to `add_inserted_trades()`, bulk deletes use `rollup_rows_for_trades()` + `remove_deleted_trades()`, and
+anything else must call `rebuild_performance_rollups()` for the users it touched. Applying deltas also
+drops the cached period summaries of the periods touched.
+"""
+from datetime import date as py_date, timedelta
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import PerformanceRollup, Trade
+
+_ROLLUP_COLUMNS = ('user_id', 'trade_date', 'trading_model_id', 'instrument', 'gross_pnl', 'pnl_in_r', 'mae')
+_SNAPSHOT_KEY = 'performance_rollup_snapshot'
+
+
+def period_start(period_type, day):
+    """Returns the first day of the period of the given type containing `day`."""
+    if period_type == 'day':
+        return day
+    if period_type == 'week':
+        return day - timedelta(days=day.weekday())
+    if period_type == 'month':
+        return day.replace(day=1)
+    if period_type == 'quarter':
+        return py_date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    if period_type == 'year':
+        return py_date(day.year, 1, 1)
+    raise ValueError(f"Unknown period type: {period_type}")
+
+
+def period_end(period_type, start):
+    """Returns the last day of the period starting on `start`."""
+    if period_type == 'day':
+        return start
+    if period_type == 'week':
+        return start + timedelta(days=6)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[period_type]
+    year, month = divmod(start.month - 1 + months, 12)
+    return py_date(start.year + year, month + 1, 1) - timedelta(days=1)
+
+
+@lru_cache(maxsize=4096)
+def _period_starts(day):
+    """((period_type, start), ...) for every period type; cached since bulk writes repeat the same dates."""
+    return tuple((period_type, period_start(period_type, day)) for period_type in PerformanceRollup.PERIOD_TYPES)
+
+
+def _bucket_keys(user_id, trade_date, trading_model_id, instrument):
+    dimensions = (('all', ''), ('model', str(trading_model_id) if trading_model_id else ''),
+                  ('instrument', instrument or ''))
+    for period_type, start in _period_starts(trade_date):
+        for dimension, value in dimensions:
+            yield user_id, period_type, start, dimension, value
+
+
+def _empty_delta():
+    return {'trade_count': 0, 'win_count': 0, 'loss_count': 0, 'gross_pnl': 0.0, 'sum_r': 0.0,
+            'added_mae': None, 'removed_mae': None}
+
+
+def _add_trade_to_delta(delta, gross_pnl, pnl_in_r, mae, sign):
+    pnl = gross_pnl or 0.0
+    delta['trade_count'] += sign
+    delta['win_count'] += sign if pnl > 0 else 0
+    delta['loss_count'] += sign if pnl < 0 else 0
+    delta['gross_pnl'] += sign * pnl
+    delta['sum_r'] += sign * (pnl_in_r or 0.0)
+    if mae is not None:
+        field = 'added_mae' if sign > 0 else 'removed_mae'
+        delta[field] = mae if delta[field] is None else max(delta[field], mae)
+
+
+def _merge_delta(target, delta):
+    for field in ('trade_count', 'win_count', 'loss_count', 'gross_pnl', 'sum_r'):
+        target[field] += delta[field]
+    for field in ('added_mae', 'removed_mae'):
+        if delta[field] is not None:
+            target[field] = delta[field] if target[field] is None else max(target[field], delta[field])
+
+
+def _accumulate(deltas, row, sign):
+    """Adds (sign=+1) or removes (sign=-1) one trade row's contribution to the pending bucket deltas."""
+    user_id, trade_date, trading_model_id, instrument, gross_pnl, pnl_in_r, mae = row
+    if user_id is None or trade_date is None:
+        return
+    for key in _bucket_keys(user_id, trade_date, trading_model_id, instrument):
+        _add_trade_to_delta(deltas.setdefault(key, _empty_delta()), gross_pnl, pnl_in_r, mae, sign)
+
+
+def _accumulate_many(deltas, rows, sign):
+    """_accumulate for many rows: trades sharing a day, model and instrument are summed first, so each
+    such group (rather than each trade) is spread over its 15 buckets."""
+    groups = {}
+    for user_id, trade_date, trading_model_id, instrument, gross_pnl, pnl_in_r, mae in rows:
+        if user_id is None or trade_date is None:
+            continue
+        group = groups.setdefault((user_id, trade_date, trading_model_id, instrument), _empty_delta())
+        _add_trade_to_delta(group, gross_pnl, pnl_in_r, mae, sign)
+    for group_key, group in groups.items():
+        for key in _bucket_keys(*group_key):
+            _merge_delta(deltas.setdefault(key, _empty_delta()), group)
+
+
+def _is_noop(delta):
+    """True when a trade moved out of and back into the same bucket with identical numbers."""
+    return (not any(delta[field] for field in ('trade_count', 'win_count', 'loss_count', 'gross_pnl', 'sum_r'))
+            and delta['added_mae'] == delta['removed_mae'])
+
+
+def _select_trade_rows(connection, trade_ids):
+    table = Trade.__table__
+    rows = connection.execute(db.select(table.c.id, *[table.c[name] for name in _ROLLUP_COLUMNS])
+                              .where(table.c.id.in_(trade_ids))).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _bucket_filter(table, user_id, period_type, start, dimension, value):
+    """Trade-table WHERE clause matching the trades that fall into one rollup bucket."""
+    clauses = [table.c.user_id == user_id, table.c.trade_date >= start,
+               table.c.trade_date <= period_end(period_type, start)]
+    if dimension == 'model':
+        clauses.append(table.c.trading_model_id == int(value) if value else table.c.trading_model_id.is_(None))
+    elif dimension == 'instrument':
+        clauses.append(table.c.instrument == value)
+    return db.and_(*clauses)
+
+
+def _apply_deltas(connection, deltas):
+    if not deltas:
+        return
+    rollups = PerformanceRollup.__table__
+    trades = Trade.__table__
+    user_ids = {key[0] for key in deltas}
+    starts = {key[2] for key in deltas}
+    existing = {}
+    for row in connection.execute(db.select(rollups).where(rollups.c.user_id.in_(user_ids),
+                                                            rollups.c.period_start.in_(starts))):
+        existing[(row.user_id, row.period_type, row.period_start, row.dimension, row.dimension_value)] = row
+
+    inserts, updates, deletes = [], [], []
+    for key, delta in deltas.items():
+        current = existing.get(key)
+        if current is None:
+            if delta['trade_count'] > 0:
+                inserts.append({'user_id': key[0], 'period_type': key[1], 'period_start': key[2],
+                                'dimension': key[3], 'dimension_value': key[4],
+                                'trade_count': delta['trade_count'], 'win_count': delta['win_count'],
+                                'loss_count': delta['loss_count'], 'gross_pnl': delta['gross_pnl'],
+                                'sum_r': delta['sum_r'], 'max_mae': delta['added_mae']})
+            continue
+        trade_count = current.trade_count + delta['trade_count']
+        if trade_count <= 0:
+            deletes.append(current.id)
+            continue
+        max_mae = current.max_mae
+        if delta['removed_mae'] is not None and max_mae is not None and delta['removed_mae'] >= max_mae:
+            # The bucket's maximum may have just left it; only this case needs a look at the trades.
+            max_mae = connection.execute(db.select(db.func.max(trades.c.mae))
+                                         .where(_bucket_filter(trades, *key))).scalar()
+        elif delta['added_mae'] is not None:
+            max_mae = delta['added_mae'] if max_mae is None else max(max_mae, delta['added_mae'])
+        updates.append({'b_id': current.id, 'trade_count': trade_count,
+                        'win_count': current.win_count + delta['win_count'],
+                        'loss_count': current.loss_count + delta['loss_count'],
+                        'gross_pnl': current.gross_pnl + delta['gross_pnl'],
+                        'sum_r': current.sum_r + delta['sum_r'], 'max_mae': max_mae})
+
+    if deletes:
+        connection.execute(db.delete(rollups).where(rollups.c.id.in_(deletes)))
+    if updates:
+        connection.execute(db.update(rollups).where(rollups.c.id == db.bindparam('b_id')), updates)
+    if inserts:
+        connection.execute(db.insert(rollups), inserts)
+
+    from app.period_summaries import invalidate_period_summaries  # Imports this module
+    invalidate_period_summaries(connection, {key[:3] for key in deltas})
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_trades_before_flush(session, flush_context, instances):
+    """Records the persisted state of trades about to be updated/deleted (their 'old' contribution)."""
+    trade_ids = [obj.id for obj in session.dirty.union(session.deleted)
+                 if isinstance(obj, Trade) and obj.id is not None]
+    session.info[_SNAPSHOT_KEY] = _select_trade_rows(session.connection(), trade_ids) if trade_ids else {}
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups_after_flush(session, flush_context):
+    old_rows = session.info.pop(_SNAPSHOT_KEY, {})
+    changed_ids = {obj.id for obj in session.new.union(session.dirty) if isinstance(obj, Trade)}
+    if not old_rows and not changed_ids:
+        return
+    connection = session.connection()
+    new_rows = _select_trade_rows(connection, changed_ids) if changed_ids else {}
+    deltas = {}
+    for trade_id in set(old_rows) | set(new_rows):
+        old, new = old_rows.get(trade_id), new_rows.get(trade_id)
+        if old == new:
+            continue
+        if old is not None:
+            _accumulate(deltas, old, -1)
+        if new is not None:
+            _accumulate(deltas, new, +1)
+    _apply_deltas(connection, {key: delta for key, delta in deltas.items() if not _is_noop(delta)})
+
+
+def add_inserted_trades(rows):
+    """Folds trades that were bulk-inserted with Core into the rollups, in the caller's transaction.
+
+    `rows` are mappings with at least the rollup columns (user_id, trade_date, trading_model_id,
+    instrument, gross_pnl, pnl_in_r, mae), e.g. the parameter dicts of the INSERT.
+    """
+    deltas = {}
+    _accumulate_many(deltas, (tuple(row.get(name) for name in _ROLLUP_COLUMNS) for row in rows), +1)
+    _apply_deltas(db.session.connection(), deltas)
+
+
+def rollup_rows_for_trades(trade_ids):
+    """The rollup columns of the given trades, read before a bulk Core DELETE for remove_deleted_trades()."""
+    trades = Trade.__table__
+    return db.session.execute(db.select(*(trades.c[name] for name in _ROLLUP_COLUMNS))
+                              .where(trades.c.id.in_(trade_ids))).all()
+
+
+def remove_deleted_trades(rows):
+    """Takes trades deleted with a bulk Core DELETE out of the rollups, in the caller's transaction.
+
+    `rows` come from rollup_rows_for_trades() before the DELETE; call this after it, since a bucket whose
+    largest MAE left re-reads its maximum from the remaining trades.
+    """
+    deltas = {}
+    _accumulate_many(deltas, rows, -1)
+    _apply_deltas(db.session.connection(), deltas)
+
+
+def rebuild_performance_rollups(user_ids=None):
+    """Recomputes the rollup rows from the trades table for the given users (all users when None).
+
+    Runs on the current session's connection; the caller commits.
+    """
+    rollups = PerformanceRollup.__table__
+    trades = Trade.__table__
+    connection = db.session.connection()
+    delete_query = db.delete(rollups)
+    select_query = db.select(*[trades.c[name] for name in _ROLLUP_COLUMNS])
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        delete_query = delete_query.where(rollups.c.user_id.in_(user_ids))
+        select_query = select_query.where(trades.c.user_id.in_(user_ids))
+    connection.execute(delete_query)
+
+    deltas = {}
+    _accumulate_many(deltas, connection.execute(select_query), +1)
+    inserts = [{'user_id': key[0], 'period_type': key[1], 'period_start': key[2], 'dimension': key[3],
+                'dimension_value': key[4], 'trade_count': delta['trade_count'], 'win_count': delta['win_count'],
+                'loss_count': delta['loss_count'], 'gross_pnl': delta['gross_pnl'], 'sum_r': delta['sum_r'],
+                'max_mae': delta['added_mae']}
+               for key, delta in deltas.items()]
+    if inserts:
+        connection.execute(db.insert(rollups), inserts)
+
+    from app.period_summaries import clear_period_summaries
+    clear_period_summaries(connection, user_ids)
+    return len(inserts)
+
+
+def get_period_rollups(user_id, day, period_types=PerformanceRollup.PERIOD_TYPES, dimension='all',
+                       dimension_value=''):
+    """Returns {period_type: PerformanceRollup or None} for the periods containing `day` (one query)."""
+    conditions = [db.and_(PerformanceRollup.period_type == period_type,
+                          PerformanceRollup.period_start == period_start(period_type, day))
+                  for period_type in period_types]
+    rows = PerformanceRollup.query.filter(PerformanceRollup.user_id == user_id,
+                                          PerformanceRollup.dimension == dimension,
+                                          PerformanceRollup.dimension_value == dimension_value,
+                                          db.or_(*conditions)).all()
+    by_type = {row.period_type: row for row in rows}
+    return {period_type: by_type.get(period_type) for period_type in period_types}
@@ -0,0 +1,217 @@
+"""Full-text search over a user's trade notes, journals and trading model playbooks.
+
+Every searchable row (a trade, a daily/weekly/monthly/quarterly/yearly journal, a trading model) has one
+document in `search_index` holding its text columns joined together. Database triggers keep the documents
+in step with the source tables, so ORM writes, bulk Core writes and the import worker processes are all
+covered without application hooks. `flask rebuild-search-index` refills the index from scratch.
+
+On SQLite the index is an FTS5 table ranked by bm25; on PostgreSQL it is a plain table with a tsvector
+column under a GIN index, ranked by ts_rank_cd. A document's rowid encodes its source as
+`source id * 8 + kind code`, so triggers replace a document by rowid and hits map back to their rows.
+The owner is stored as a `u<user id>` token, which FTS5 matches from the index like any other term.
+"""
+import re
+from collections import namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import event
+
+from app import db
+from app.models import (DailyJournal, MonthlyJournal, QuarterlyJournal, Trade, TradingModel, WeeklyJournal,
+                        YearlyJournal)
+
+SEARCH_TABLE = 'search_index'
+# kind -> (rowid code, model); codes are stored in rowids, so never renumber them
+SEARCH_KINDS = {
+    'trade': (1, Trade),
+    'daily_journal': (2, DailyJournal),
+    'weekly_journal': (3, WeeklyJournal),
+    'monthly_journal': (4, MonthlyJournal),
+    'quarterly_journal': (5, QuarterlyJournal),
+    'yearly_journal': (6, YearlyJournal),
+    'trading_model': (7, TradingModel),
+}
+_KINDS_BY_CODE = {code: kind for kind, (code, _) in SEARCH_KINDS.items()}
+_CODE_MODULUS = 8
+_EXTRA_COLUMNS = {'trading_model': ('name',)}  # Searchable non-Text columns
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\x02', '\x03'  # Snippet markers, swapped for <mark> after escaping
+
+SearchHit = namedtuple('SearchHit', 'kind source_id snippet')
+
+
+def _text_columns(kind):
+    table = SEARCH_KINDS[kind][1].__table__
+    return list(_EXTRA_COLUMNS.get(kind, ())) + [column.name for column in table.columns
+                                                  if isinstance(column.type, db.Text)]
+
+
+def _document_insert(kind, ref, from_clause=''):
+    """INSERT ... SELECT of the document for the row(s) named `ref` (NEW in a trigger, the table in a rebuild)."""
+    code = SEARCH_KINDS[kind][0]
+    columns = _text_columns(kind)
+    body = ' || '.join(f"coalesce({ref}.{name} || ' ', '')" for name in columns)
+    present = ', '.join([f"nullif({ref}.{name}, '')" for name in columns] + ['NULL'])  # coalesce() needs 2+ args
+    return (f"INSERT INTO {SEARCH_TABLE} (rowid, owner, body) "
+            f"SELECT {ref}.id * {_CODE_MODULUS} + {code}, 'u' || {ref}.user_id, {body}{from_clause} "
+            f"WHERE coalesce({present}) IS NOT NULL")
+
+
+def _document_delete(kind, ref):
+    return f"DELETE FROM {SEARCH_TABLE} WHERE rowid = {ref}.id * {_CODE_MODULUS} + {SEARCH_KINDS[kind][0]}"
+
+
+def _trigger_statements(dialect_name, kind):
+    table = SEARCH_KINDS[kind][1].__tablename__
+    watched = ', '.join(_text_columns(kind) + ['user_id'])
+    name = f"{SEARCH_TABLE}_{table}"
+    if dialect_name == 'postgresql':
+        return [
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            f"IF TG_OP <> 'INSERT' THEN {_document_delete(kind, 'OLD')}; END IF; "
+            f"IF TG_OP <> 'DELETE' THEN {_document_insert(kind, 'NEW')}; END IF; "
+            f"RETURN NULL; END $$",
+            f"DROP TRIGGER IF EXISTS {name} ON {table}",
+            f"CREATE TRIGGER {name} AFTER INSERT OR DELETE OR UPDATE OF {watched} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {name}()",
+        ]
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table} "
+        f"BEGIN {_document_insert(kind, 'new')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {watched} ON {table} "
+        f"BEGIN {_document_delete(kind, 'old')}; {_document_insert(kind, 'new')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table} "
+        f"BEGIN {_document_delete(kind, 'old')}; END",
+    ]
+
+
+def create_search_index(connection):
+    """Creates the index table and the triggers on every source table (idempotent); returns True if the
+    table is new, i.e. needs rebuild_search_index() when the source tables already hold rows."""
+    dialect_name = connection.dialect.name
+    is_new = not db.inspect(connection).has_table(SEARCH_TABLE)
+    if dialect_name == 'postgresql':
+        statements = [
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (rowid BIGINT PRIMARY KEY, owner TEXT NOT NULL, "
+            f"body TEXT NOT NULL, document tsvector GENERATED ALWAYS AS (to_tsvector('english', body)) STORED)",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_owner ON {SEARCH_TABLE} (owner)",
+        ]
+    else:
+        statements = [f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                      f"USING fts5(owner, body, tokenize='porter unicode61')"]
+    for kind in SEARCH_KINDS:
+        statements += _trigger_statements(dialect_name, kind)
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    return is_new
+
+
+def drop_search_index(connection):
+    """Drops the triggers and the index table."""
+    for kind, (_, model) in SEARCH_KINDS.items():
+        name = f"{SEARCH_TABLE}_{model.__tablename__}"
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name} ON {model.__tablename__}")
+            connection.exec_driver_sql(f"DROP FUNCTION IF EXISTS {name}()")
+        else:
+            for suffix in ('insert', 'update', 'delete'):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}_{suffix}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def rebuild_search_index(connection):
+    """Refills the index from the source tables; returns the number of documents."""
+    connection.exec_driver_sql(f"DELETE FROM {SEARCH_TABLE}")
+    for kind, (_, model) in SEARCH_KINDS.items():
+        table = model.__tablename__
+        connection.exec_driver_sql(_document_insert(kind, table, from_clause=f" FROM {table}"))
+    return connection.exec_driver_sql(f"SELECT count(*) FROM {SEARCH_TABLE}").scalar()
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index_with_tables(target, connection, **kw):
+    if create_search_index(connection):
+        rebuild_search_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index_with_tables(target, connection, **kw):
+    drop_search_index(connection)
+
+
+# --- Querying ---
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _fts5_query(text):
+    """Translates web-search style input into an FTS5 expression over the body column.
+
+    Words are ANDed, "quoted phrases" match in order, `word*` matches a prefix, `a OR b` matches either
+    and `-word` excludes. Everything the user typed is quoted, so FTS5 operators can't be injected.
+    """
+    required, excluded, pending_or = [], [], False
+    for phrase, word in _QUERY_TOKEN.findall(text):
+        if word.upper() == 'OR' and required:
+            pending_or = True
+            continue
+        negate = word.startswith('-')
+        prefix = word.endswith('*')
+        term = (phrase if phrase else word.strip('-*')).replace('"', '').strip()
+        if not term:
+            continue
+        term = f'"{term}"' + ('*' if prefix else '')
+        if negate:
+            excluded.append(term)
+        elif pending_or:
+            required[-1] = f'({required[-1]} OR {term})'
+        else:
+            required.append(term)
+        pending_or = False
+    if not required:
+        return None
+    expression = ' AND '.join(required)
+    for term in excluded:
+        expression = f'({expression}) NOT {term}'
+    return f'body : ({expression})'
+
+
+def search_documents(user_id, text, kinds=None, limit=20, offset=0):
+    """The user's documents matching `text`, best first: (a list of up to `limit` SearchHit, has_more).
+
+    `kinds` optionally restricts the hits to some SEARCH_KINDS. Snippets are HTML-safe Markup with the
+    matched terms in <mark>.
+    """
+    connection = db.session.connection()
+    codes = sorted(SEARCH_KINDS[kind][0] for kind in kinds) if kinds else None
+    kind_filter = f" AND rowid % {_CODE_MODULUS} IN ({', '.join(map(str, codes))})" if codes else ''
+    parameters = {'owner': f'u{user_id}', 'limit': limit + 1, 'offset': offset}
+    if connection.dialect.name == 'postgresql':
+        parameters['text'] = text
+        parameters['headline_options'] = (f'StartSel="{_HIGHLIGHT_START}", StopSel="{_HIGHLIGHT_END}", '
+                                          f'MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "')
+        # Headlines are expensive, so only the page of hits picked by the inner query gets one
+        statement = (
+            f"SELECT hit.rowid, ts_headline('english', hit.body, hit.query, :headline_options) "
+            f"FROM (SELECT rowid, body, query, ts_rank_cd(document, query) AS rank "
+            f"FROM {SEARCH_TABLE}, websearch_to_tsquery('english', :text) AS query "
+            f"WHERE owner = :owner AND document @@ query{kind_filter} "
+            f"ORDER BY rank DESC, rowid DESC LIMIT :limit OFFSET :offset) AS hit "
+            f"ORDER BY hit.rank DESC, hit.rowid DESC")
+    else:
+        expression = _fts5_query(text)
+        if expression is None:
+            return [], False
+        parameters['match'] = f'owner : "{parameters.pop("owner")}" AND {expression}'
+        statement = (
+            f"SELECT rowid, snippet({SEARCH_TABLE}, 1, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', ' … ', 24) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match{kind_filter} "
+            f"ORDER BY bm25({SEARCH_TABLE}, 0.0, 1.0), rowid DESC LIMIT :limit OFFSET :offset")
+    rows = connection.execute(db.text(statement), parameters).all()
+    hits = [SearchHit(_KINDS_BY_CODE[rowid % _CODE_MODULUS], rowid // _CODE_MODULUS, _highlight(snippet))
+            for rowid, snippet in rows[:limit]]
+    return hits, len(rows) > limit
+
+
+def _highlight(snippet):
+    html = str(escape(snippet or ''))
+    return Markup(html.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>'))
@@ -0,0 +1,142 @@
+"""Sharded on-disk layout for uploaded files.
+
+Uploads are named `<uuid4 hex><ext>` and stored two directory levels deep on the first four hex digits,
+e.g. `3f/a9/3fa9c2...e1.png`, so no directory holds more than a few hundred entries however many files
+there are. The path stored on the row (File.filepath, TradeImage.filepath, User.profile_picture, ...)
+is that relative path; image derivatives share their original's directory because they share its name.
+
+Files saved before the layout existed sit flat in their root folder. `flask shard-uploads` moves them
+in batches while the app keeps running: each file is hard-linked (or copied) to its sharded path, the
+row is switched over in a short transaction, and only then is the flat name removed, through the
+deferred file cleanup queue for uploads. Rows still holding a flat path are the remaining work, so an
+interrupted run simply resumes.
+"""
+import os
+import shutil
+import uuid
+
+from flask import current_app
+
+from app import db
+from app.file_cleanup import queue_file_paths
+from app.models import DailyJournalImage, File, TradeImage, User
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+MIGRATION_BATCH_SIZE = 500
+# model -> (config key of the root folder, path columns; the first one names the row's primary file)
+SHARDED_MODELS = {
+    File: ('UPLOAD_FOLDER', ('filepath',)),
+    TradeImage: ('UPLOAD_FOLDER', ('filepath', 'medium_filepath', 'thumbnail_filepath')),
+    DailyJournalImage: ('UPLOAD_FOLDER', ('filepath', 'medium_filepath', 'thumbnail_filepath')),
+    User: ('PROFILE_PICS_SAVE_PATH', ('profile_picture',)),
+}
+_UNSHARDED_NAMES = ('default.jpg',)  # Shipped static files that rows point to
+
+
+def sharded_path(filename):
+    """The sharded relative path of a bare file name: 'abcdef12.png' -> 'ab/cd/abcdef12.png'."""
+    name = os.path.basename(filename)
+    shards = [name[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(SHARD_LEVELS)]
+    return '/'.join(shards + [name])
+
+
+def new_file_path(root, extension):
+    """A fresh sharded path for a new upload under `root`: (relative path to store, absolute path to write).
+
+    `extension` includes its dot (or is empty). The shard directories are created.
+    """
+    relative = sharded_path(uuid.uuid4().hex + extension)
+    absolute = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(absolute), exist_ok=True)
+    return relative, absolute
+
+
+def _link(source, target):
+    """Gives `source` a second name `target` (hard link, else copy); an existing target is replaced."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)  # Left over from an interrupted run
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _shard_row(root, columns, row):
+    """Links the flat files of one row to their sharded paths; returns {column: new path}, or None when the
+    row's primary file is missing (the row is then left alone)."""
+    values = {}
+    for column, old in zip(columns, row[1:]):
+        if not old or '/' in old:
+            continue
+        source = os.path.join(root, old)
+        if not os.path.exists(source):
+            if column == columns[0]:
+                return None
+            continue  # A lost derivative is re-rendered by backfill-image-derivatives
+        values[column] = sharded_path(old)
+        _link(source, os.path.join(root, values[column]))
+    return values
+
+
+def _shard_rows(model, root, columns, rows):
+    """Moves one batch of rows to sharded paths; returns (moved, missing, flat paths to remove)."""
+    table = model.__table__
+    moved, missing, old_paths = 0, 0, []
+    for row in rows:
+        values = _shard_row(root, columns, row)
+        if values is None:
+            missing += 1
+            current_app.logger.warning(f"Not sharding {model.__name__} {row[0]}: file {row[1]} is missing")
+            continue
+        result = db.session.execute(db.update(table).where(table.c.id == row[0], table.c[columns[0]] == row[1])
+                                    .values(**values))
+        if result.rowcount:
+            moved += 1
+            old_paths += [old for column, old in zip(columns, row[1:]) if column in values]
+        else:  # The row changed or went away meanwhile: drop the new names again
+            for new in values.values():
+                os.remove(os.path.join(root, new))
+    return moved, missing, old_paths
+
+
+def shard_existing_uploads(batch_size=MIGRATION_BATCH_SIZE, models=None):
+    """Moves every flat upload to its sharded path; returns {model name: (moved, missing)}.
+
+    Commits once per batch. Flat upload names are queued for the deferred file cleanup (the caller
+    sweeps them); flat profile pictures are removed after their batch commits.
+    """
+    summary = {}
+    for model in models or SHARDED_MODELS:
+        root_key, columns = SHARDED_MODELS[model]
+        root = current_app.config[root_key]
+        table = model.__table__
+        primary = table.c[columns[0]]
+        moved = missing = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(table.c.id, *(table.c[column] for column in columns))
+                .where(table.c.id > last_id, primary.isnot(None), ~primary.contains('/'),
+                       primary.notin_(_UNSHARDED_NAMES))
+                .order_by(table.c.id).limit(batch_size)).all()
+            if not rows:
+                break
+            batch_moved, batch_missing, old_paths = _shard_rows(model, root, columns, rows)
+            if old_paths and root_key == 'UPLOAD_FOLDER':
+                queue_file_paths(old_paths)
+            db.session.commit()
+            if root_key != 'UPLOAD_FOLDER':
+                for path in old_paths:
+                    try:
+                        os.remove(os.path.join(root, path))
+                    except OSError:
+                        pass
+            moved += batch_moved
+            missing += batch_missing
+            last_id = rows[-1][0]
+        summary[model.__name__] = (moved, missing)
+    return summary
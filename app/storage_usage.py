@@ -0,0 +1,158 @@
+"""Per-user storage usage counters and the upload quota.
+
+Every user has one StorageUsage row per category (general files, trade images, journal images) holding
+the bytes and number of their uploads. Session listeners add each flushed new upload row and take each
+deleted one out, in the same transaction, so the counters move with the rows they count. Bulk Core
+deletes bypass the unit of work and call `remove_deleted_uploads()` before their DELETE;
+`flask reconcile-storage-usage` recomputes the counters from the upload tables and reports any drift.
+
+The counters cover what users uploaded (the `filesize` of each original); image derivatives are small
+renditions made by the app and are not charged. STORAGE_QUOTA_BYTES (0 = unlimited) caps a user's total:
+uploads are measured from the parsed request, before anything is written, and refused when they would go
+over. Concurrent uploads may overshoot the quota by what they carry together.
+"""
+import os
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import DailyJournalImage, File, StorageUsage, TradeImage
+from app.utils import format_filesize
+
+UPLOAD_CATEGORIES = {File: 'file', TradeImage: 'trade_image', DailyJournalImage: 'journal_image'}
+_DELETED_KEY = 'storage_usage_deleted'
+
+
+def _add(deltas, user_id, category, size, count):
+    delta = deltas.setdefault((user_id, category), [0, 0])
+    delta[0] += size or 0
+    delta[1] += count
+
+
+def _apply_deltas(connection, deltas):
+    """Adds {(user_id, category): [bytes, count]} to the counters; missing counters are created."""
+    table = StorageUsage.__table__
+    now = datetime.utcnow()
+    for (user_id, category), (size, count) in deltas.items():
+        if not size and not count:
+            continue
+        result = connection.execute(
+            db.update(table).where(table.c.user_id == user_id, table.c.category == category)
+            .values(bytes=table.c.bytes + size, file_count=table.c.file_count + count, updated_at=now))
+        if result.rowcount == 0 and count > 0:
+            connection.execute(db.insert(table).values(user_id=user_id, category=category, bytes=size,
+                                                       file_count=count, updated_at=now))
+
+
+@event.listens_for(Session, 'before_flush')
+def _snapshot_deleted_uploads(session, flush_context, instances):
+    """Records the owner and size of upload rows about to be deleted (they may be expired after the flush)."""
+    session.info[_DELETED_KEY] = [(obj.user_id, UPLOAD_CATEGORIES[type(obj)], obj.filesize)
+                                  for obj in session.deleted if type(obj) in UPLOAD_CATEGORIES]
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_usage_after_flush(session, flush_context):
+    deltas = {}
+    for user_id, category, size in session.info.pop(_DELETED_KEY, ()):
+        _add(deltas, user_id, category, -size, -1)
+    for obj in session.new:
+        if type(obj) in UPLOAD_CATEGORIES:
+            _add(deltas, obj.user_id, UPLOAD_CATEGORIES[type(obj)], obj.filesize, +1)
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+def remove_deleted_uploads(model, *conditions):
+    """Takes the `model` rows matching `conditions` out of the counters, in the caller's transaction.
+
+    Call it right before a bulk Core DELETE with the same WHERE clause.
+    """
+    table = model.__table__
+    deltas = {}
+    for user_id, size, count in db.session.execute(
+            db.select(table.c.user_id, db.func.sum(table.c.filesize), db.func.count())
+            .where(*conditions).group_by(table.c.user_id)):
+        _add(deltas, user_id, UPLOAD_CATEGORIES[model], -size, -count)
+    _apply_deltas(db.session.connection(), deltas)
+
+
+def get_storage_usage(user_ids):
+    """{user_id: {category: (bytes, file_count)}} for the given users, read from the counters alone."""
+    table = StorageUsage.__table__
+    usage = {user_id: {} for user_id in user_ids}
+    if usage:
+        for user_id, category, size, count in db.session.execute(
+                db.select(table.c.user_id, table.c.category, table.c.bytes, table.c.file_count)
+                .where(table.c.user_id.in_(usage))):
+            usage[user_id][category] = (size, count)
+    return usage
+
+
+def upload_size(files):
+    """Total bytes of the given uploaded FileStorage objects (already spooled by the request parser)."""
+    total = 0
+    for storage in files:
+        stream = storage.stream
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        total += stream.tell()
+        stream.seek(position)
+    return total
+
+
+def check_storage_quota(user_id, incoming_bytes):
+    """None if the user may store `incoming_bytes` more, else the message explaining the refusal."""
+    quota = current_app.config['STORAGE_QUOTA_BYTES']
+    if not quota or not incoming_bytes:
+        return None
+    # An ORM query, so pending deletes are flushed first and the space they free counts
+    used = db.session.execute(db.select(db.func.sum(StorageUsage.bytes))
+                              .where(StorageUsage.user_id == user_id)).scalar() or 0
+    if used + incoming_bytes <= quota:
+        return None
+    return (f"Upload refused: it needs {format_filesize(incoming_bytes)} but only "
+            f"{format_filesize(max(quota - used, 0))} of your {format_filesize(quota)} storage quota is left.")
+
+
+def reconcile_storage_usage(user_ids=None):
+    """Recomputes the counters from the upload tables (all users when None); returns the counters corrected.
+
+    Runs on the current session's connection; the caller commits.
+    """
+    table = StorageUsage.__table__
+    connection = db.session.connection()
+    actual = {}
+    for model, category in UPLOAD_CATEGORIES.items():
+        uploads = model.__table__
+        query = (db.select(uploads.c.user_id, db.func.sum(uploads.c.filesize), db.func.count())
+                 .group_by(uploads.c.user_id))
+        if user_ids is not None:
+            query = query.where(uploads.c.user_id.in_(user_ids))
+        for user_id, size, count in connection.execute(query):
+            actual[(user_id, category)] = (size, count)
+
+    query = db.select(table.c.id, table.c.user_id, table.c.category, table.c.bytes, table.c.file_count)
+    if user_ids is not None:
+        query = query.where(table.c.user_id.in_(user_ids))
+    stored = {(row.user_id, row.category): row for row in connection.execute(query)}
+
+    now = datetime.utcnow()
+    corrected = 0
+    for key in set(actual) | set(stored):
+        size, count = actual.get(key, (0, 0))
+        row = stored.get(key)
+        if row is None:
+            connection.execute(db.insert(table).values(user_id=key[0], category=key[1], bytes=size,
+                                                       file_count=count, updated_at=now))
+        elif (row.bytes, row.file_count) != (size, count):
+            connection.execute(db.update(table).where(table.c.id == row.id)
+                               .values(bytes=size, file_count=count, updated_at=now))
+        else:
+            continue
+        current_app.logger.info(f"Storage usage of user {key[0]} ({key[1]}) corrected to {count} files, {size} B")
+        corrected += 1
+    return corrected
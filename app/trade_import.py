@@ -0,0 +1,511 @@
+"""Streaming CSV trade import.
+
+The upload is read row by row and turned into plain parameter dicts; every IMPORT_CHUNK_SIZE trades the
+chunk is written with a handful of executemany INSERTs (trades, entry legs, exit legs, tag links) and
+committed, so memory stays flat and a 100k-row file is a few hundred statements rather than a few
+hundred thousand. Legs can be given as numbered columns ("Entry 1 Time", "Entry 1 Contracts",
+"Entry 1 Price", "Exit 2 Price", ...) and/or on extra rows sharing the trade's ID, including the
+"Row Type" / "Leg ..." rows of the detailed CSV export. Problems are written to an error report CSV
+instead of aborting the import. FillsTradeImporter builds the trades from a broker's raw execution fills
+instead and shares the same chunked writer.
+"""
+import csv
+import hashlib
+import io
+import itertools
+import re
+from datetime import date, datetime, time, timezone
+from operator import itemgetter
+from zoneinfo import ZoneInfo
+
+from app import db
+from app.models import (EntryPoint, ExitPoint, Tag, Trade, TradeTag, TradingModel, bump_data_version,
+                        compute_trade_metrics)
+from app.rollups import add_inserted_trades
+
+IMPORT_CHUNK_SIZE = 5000
+DIRECTIONS = ('Long', 'Short')
+REPORT_HEADERS = ['Line', 'Trade ID', 'Severity', 'Message']
+_LEG_COLUMN = re.compile(r'^(entry|exit)\s*(\d+)\s+(time|contracts|price)$', re.IGNORECASE)
+# CSV column -> Trade column for the free-form fields copied as-is
+_TEXT_FIELDS = {
+    'How Closed': 'how_closed',
+    'Trade Notes': 'trade_notes',
+    'Overall Analysis': 'overall_analysis_notes',
+    'Management Notes': 'trade_management_notes',
+    'Errors': 'errors_notes',
+    'Improvements': 'improvements_notes',
+    'External Screenshot Link': 'screenshot_link',
+}
+_FLOAT_FIELDS = {'Initial SL': 'initial_stop_loss', 'Terminus Target': 'terminus_target', 'MAE': 'mae', 'MFE': 'mfe'}
+
+
+class ImportRowError(ValueError):
+    """A problem with one trade's rows; the trade is skipped and the message goes to the report."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.warnings = 0
+        self.rows_read = 0
+        self.duplicates = 0  # Trades already imported from the same broker fills
+        self.last_line = 0  # Last CSV line whose trade is committed (or skipped); a resume point
+
+    @property
+    def has_issues(self):
+        return bool(self.skipped or self.warnings)
+
+    def to_dict(self):
+        return {'imported': self.imported, 'skipped': self.skipped, 'warnings': self.warnings,
+                'rows_read': self.rows_read, 'duplicates': self.duplicates, 'last_line': self.last_line}
+
+
+def _parse_float(value, label):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ImportRowError(f"{label}: '{value}' is not a number.")
+
+
+def _parse_contracts(value, label):
+    number = _parse_float(value, label)
+    if number is None:
+        return None
+    if number <= 0 or number != int(number):
+        raise ImportRowError(f"{label}: contracts must be a positive whole number.")
+    return int(number)
+
+
+def _parse_time(value, label):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return time.fromisoformat(value)  # HH:MM or HH:MM:SS; far cheaper than strptime on large files
+    except ValueError:
+        raise ImportRowError(f"{label}: '{value}' is not a time (HH:MM or HH:MM:SS).")
+
+
+class CsvTradeImporter:
+    """Imports trades for one user from a CSV byte stream; usable outside a request (no current_user)."""
+
+    def __init__(self, user_id, point_values, report=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        self.user_id = user_id
+        self.point_values = point_values
+        self.chunk_size = chunk_size
+        self.progress = progress  # Optional callable(ImportResult), invoked after each committed chunk
+        self.result = ImportResult()
+        self._report = csv.writer(report) if report is not None else None
+        self._models = {}
+        self._tags = {}
+        self._chunk = []
+        self._chunk_last_line = 0
+
+    # --- Reporting ---
+    def _note(self, line, trade_ref, severity, message):
+        if severity == 'error':
+            self.result.skipped += 1
+        else:
+            self.result.warnings += 1
+        if self._report is not None:
+            if self.result.skipped + self.result.warnings == 1:
+                self._report.writerow(REPORT_HEADERS)
+            self._report.writerow([line, trade_ref or '', severity, message])
+
+    # --- Reading ---
+    def run(self, binary_stream, encoding='utf-8-sig', include=None):
+        """Imports every trade in the stream and returns the ImportResult (chunks are committed as they fill).
+
+        `include`, if given, is a callable(line, trade_id) deciding which rows are read at all; line numbers
+        in the report still refer to the original file (used to retry only the failed rows of a file).
+        """
+        self._models = dict(db.session.execute(db.select(TradingModel.name, TradingModel.id)
+                                               .where(TradingModel.user_id == self.user_id)).all())
+        self._tags = dict(db.session.execute(db.select(Tag.name, Tag.id).where(Tag.user_id == self.user_id)).all())
+
+        text = io.TextIOWrapper(binary_stream, encoding=encoding, newline='')
+        reader = csv.DictReader(text)
+        leg_columns = self._leg_columns(reader.fieldnames or [])
+        group, group_id, seen_ids = [], None, set()
+        for row in reader:
+            line = reader.line_num
+            trade_ref = (row.get('ID') or '').strip()
+            if include is not None and not include(line, trade_ref):
+                continue
+            self.result.rows_read += 1
+            if group and trade_ref and trade_ref == group_id:
+                group.append((line, row))
+                continue
+            if group:
+                self._add_trade(group, leg_columns)
+            if trade_ref and trade_ref in seen_ids:
+                self._note(line, trade_ref, 'error',
+                           "Rows for one trade ID must be consecutive; this row was skipped.")
+                group, group_id = [], None
+                continue
+            if trade_ref:
+                seen_ids.add(trade_ref)
+            group, group_id = [(line, row)], trade_ref
+        if group:
+            self._add_trade(group, leg_columns)
+        self._chunk_last_line = reader.line_num
+        self._flush()
+        self.result.last_line = reader.line_num
+        return self.result
+
+    @staticmethod
+    def _leg_columns(fieldnames):
+        """{('entry'|'exit', n): {'time'|'contracts'|'price': column}} for numbered leg columns."""
+        columns = {}
+        for name in fieldnames:
+            match = _LEG_COLUMN.match((name or '').strip())
+            if match:
+                kind, number, part = match.group(1).lower(), int(match.group(2)), match.group(3).lower()
+                columns.setdefault((kind, number), {})[part] = name
+        return dict(sorted(columns.items()))
+
+    @staticmethod
+    def _read_leg(row, kind, label, time_column, contracts_column, price_column):
+        leg_time = _parse_time(row.get(time_column), label)
+        contracts = _parse_contracts(row.get(contracts_column), label)
+        price = _parse_float(row.get(price_column), label)
+        if leg_time is None and contracts is None and price is None:
+            return None
+        if contracts is None or price is None:
+            raise ImportRowError(f"{label}: contracts and price are both required.")
+        if kind == 'entry' and leg_time is None:
+            raise ImportRowError(f"{label}: entry time is required.")
+        return leg_time, contracts, price
+
+    def _legs_from_rows(self, group, leg_columns):
+        entries, exits = [], []
+        for line, row in group:
+            for (kind, number), parts in leg_columns.items():
+                leg = self._read_leg(row, kind, f"{kind.title()} {number}",
+                                     parts.get('time'), parts.get('contracts'), parts.get('price'))
+                if leg:
+                    (entries if kind == 'entry' else exits).append(leg)
+            row_type = (row.get('Row Type') or '').strip().lower()
+            if row_type in ('entry', 'exit'):
+                leg = self._read_leg(row, row_type, f"Line {line} {row_type}", 'Leg Time', 'Leg Contracts', 'Leg Price')
+                if leg:
+                    (entries if row_type == 'entry' else exits).append(leg)
+        return entries, exits
+
+    # --- Building rows ---
+    def _add_trade(self, group, leg_columns):
+        first_line, head = group[0]
+        # The trade's own fields come from its "Trade" row (detailed export) or else the first row
+        for line, row in group:
+            if (row.get('Row Type') or '').strip().lower() == 'trade':
+                first_line, head = line, row
+                break
+        trade_ref = (head.get('ID') or '').strip()
+        try:
+            trade, tag_names, warnings = self._trade_values(head)
+            entries, exits = self._legs_from_rows(group, leg_columns)
+        except ImportRowError as e:
+            self._note(first_line, trade_ref, 'error', str(e))
+            return
+        for message in warnings:
+            self._note(first_line, trade_ref, 'warning', message)
+
+        self._queue_trade(trade, entries, exits, tag_names, group[-1][0])
+
+    def _queue_trade(self, trade, entries, exits, tag_names, last_line):
+        """Adds a validated trade (column dict plus (time, contracts, price) legs) to the pending chunk.
+
+        Metrics already present in `trade` are kept: the legs only carry wall-clock times, so a caller that
+        knows better (e.g. the duration of a position held over midnight) sets them first.
+        """
+        metrics = compute_trade_metrics(trade['trade_date'], trade['direction'], trade['point_value'],
+                                        trade.get('initial_stop_loss'), trade.get('terminus_target'),
+                                        trade.get('how_closed'), entries, exits)
+        for field, value in metrics.items():
+            trade.setdefault(field, value)
+        self._chunk.append((trade, entries, exits, tag_names))
+        self._chunk_last_line = last_line
+        if len(self._chunk) >= self.chunk_size:
+            self._flush()
+
+    def _trade_values(self, row):
+        date_value = (row.get('Date') or '').strip()
+        if not date_value:
+            raise ImportRowError("Missing Date.")
+        try:
+            trade_date = date.fromisoformat(date_value)
+        except ValueError:
+            raise ImportRowError(f"Date: '{date_value}' is not YYYY-MM-DD.")
+        instrument = (row.get('Instrument') or '').strip()
+        direction = (row.get('Direction') or '').strip().title()
+        if not instrument or not direction:
+            raise ImportRowError("Missing Instrument or Direction.")
+        if direction not in DIRECTIONS:
+            raise ImportRowError(f"Direction must be Long or Short, not '{direction}'.")
+
+        now = datetime.utcnow()
+        trade = {'user_id': self.user_id, 'trade_date': trade_date, 'instrument': instrument,
+                 'direction': direction, 'point_value': self.point_values.get(instrument, 1.0),
+                 'metrics_updated_at': now}
+        for column, field in _FLOAT_FIELDS.items():
+            trade[field] = _parse_float(row.get(column), column)
+        for column, field in _TEXT_FIELDS.items():
+            trade[field] = (row.get(column) or '').strip() or None
+
+        warnings = []
+        trade['trading_model_id'] = None
+        model_name = (row.get('Trading Model') or '').strip()
+        if model_name:
+            trade['trading_model_id'] = self._models.get(model_name)
+            if trade['trading_model_id'] is None:
+                warnings.append(f"Trading Model '{model_name}' not found. Trade imported without model.")
+        return trade, Tag.parse_names(row.get('Tags')), warnings
+
+    # --- Writing ---
+    def _tag_ids(self, names):
+        missing = [name for name in names if name not in self._tags]
+        if missing:
+            tag_table = Tag.__table__
+            now = datetime.utcnow()
+            rows = db.session.execute(
+                db.insert(tag_table).returning(tag_table.c.name, tag_table.c.id, sort_by_parameter_order=True),
+                [{'user_id': self.user_id, 'name': name, 'created_at': now} for name in missing]).all()
+            self._tags.update(dict(rows))
+        return [self._tags[name] for name in names]
+
+    def _drop_duplicates(self):
+        """Removes pending trades whose source_key is already stored for the user (or repeats within the chunk)."""
+        keys = [trade['source_key'] for trade, _, _, _ in self._chunk if trade.get('source_key')]
+        if not keys:
+            return
+        seen = set(db.session.execute(db.select(Trade.source_key).where(
+            Trade.user_id == self.user_id, Trade.source_key.in_(keys))).scalars())
+        pending = []
+        for item in self._chunk:
+            key = item[0].get('source_key')
+            if key in seen:
+                self.result.duplicates += 1
+                continue
+            if key:
+                seen.add(key)
+            pending.append(item)
+        self._chunk = pending
+
+    def _flush(self):
+        if not self._chunk:
+            return
+        self._drop_duplicates()
+        if self._chunk:
+            self._write_chunk()
+        self.result.last_line = self._chunk_last_line
+        self._chunk = []
+        if self.progress:
+            self.progress(self.result)
+
+    def _write_chunk(self):
+        trade_rows = [trade for trade, _, _, _ in self._chunk]
+        trade_table = Trade.__table__
+        trade_ids = db.session.execute(
+            db.insert(trade_table).returning(trade_table.c.id, sort_by_parameter_order=True), trade_rows).scalars().all()
+
+        entry_rows, exit_rows, link_rows = [], [], []
+        all_tag_names = list(dict.fromkeys(name for _, _, _, names in self._chunk for name in names))
+        tag_ids = dict(zip(all_tag_names, self._tag_ids(all_tag_names)))
+        for trade_id, (trade, entries, exits, tag_names) in zip(trade_ids, self._chunk):
+            trade['id'] = trade_id
+            entry_rows.extend({'trade_id': trade_id, 'entry_time': leg_time, 'contracts': contracts,
+                               'entry_price': price} for leg_time, contracts, price in entries)
+            exit_rows.extend({'trade_id': trade_id, 'exit_time': leg_time, 'contracts': contracts,
+                              'exit_price': price} for leg_time, contracts, price in exits)
+            link_rows.extend({'trade_id': trade_id, 'tag_id': tag_ids[name], 'user_id': self.user_id}
+                             for name in tag_names)
+        for model, rows in ((EntryPoint, entry_rows), (ExitPoint, exit_rows), (TradeTag, link_rows)):
+            if rows:
+                db.session.execute(db.insert(model.__table__), rows)
+
+        # Core inserts bypass the session listeners: keep the rollups and the cache version in step
+        add_inserted_trades(trade_rows)
+        bump_data_version([self.user_id])
+        db.session.commit()
+        self.result.imported += len(trade_rows)
+
+
+# --- Broker fills ---
+# Accepted header names (case-insensitive) for each fill field
+_FILL_COLUMNS = {
+    'timestamp': ('timestamp', 'date/time', 'datetime', 'fill time', 'time'),
+    'date': ('date', 'trade date'),
+    'symbol': ('symbol', 'instrument', 'contract'),
+    'side': ('side', 'action', 'b/s', 'buy/sell'),
+    'qty': ('qty', 'quantity', 'filled qty', 'filled', 'size'),
+    'price': ('price', 'fill price', 'avg price', 'avg fill price'),
+}
+_BUY_SIDES = frozenset(('buy', 'b', 'bot', 'bought', 'long'))
+_SELL_SIDES = frozenset(('sell', 's', 'sld', 'sold', 'short'))
+FILLS_TIMEZONE = 'America/New_York'  # Exchange clock the fill times are stored in
+_TIMESTAMP_FORMATS = ('%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M:%S.%f', '%m/%d/%Y %H:%M')
+
+
+def _parse_timestamp(value, zone):
+    """(UTC instant, wall-clock time in `zone`) of a fill time. A value with a UTC offset is converted to
+    `zone`; a naive value is taken to be in it already."""
+    value = (value or '').strip()
+    if not value:
+        raise ImportRowError("Missing fill time.")
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in _TIMESTAMP_FORMATS:
+            try:
+                timestamp = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ImportRowError(f"'{value}' is not a date and time (YYYY-MM-DD HH:MM:SS or MM/DD/YYYY HH:MM:SS).")
+    if timestamp.tzinfo is None:
+        instant = timestamp.replace(tzinfo=zone).astimezone(timezone.utc)
+        return instant, timestamp
+    instant = timestamp.astimezone(timezone.utc)
+    return instant, instant.astimezone(zone).replace(tzinfo=None)
+
+
+class FillsTradeImporter(CsvTradeImporter):
+    """Builds trades from a broker's execution fills (time, symbol, side, quantity, price).
+
+    All fills are read into compact tuples and sorted once by (contract, time, file order); the sorted
+    list is then replayed in a single pass through a per-contract position state machine: flat -> open ->
+    scale in / scale out -> flat. Each flat-to-flat round trip becomes one trade with a leg per fill; a
+    fill that crosses zero closes the position and opens the opposite one with the remainder. Every trade
+    gets a source_key fingerprinting its fills, so re-importing an overlapping file skips trades already
+    stored. A position still open at the end of the file is not imported (a later file will contain it).
+
+    Fills are ordered and paired on their UTC instant and stored as wall-clock times on the exchange
+    clock (`exchange_timezone`, the TRADING_TIMEZONE setting). Each timestamp with a UTC offset is
+    converted from its own offset, so a file straddling a DST change stays on the exchange clock; naive
+    timestamps are taken to be on it already.
+    """
+
+    def __init__(self, user_id, point_values, exchange_timezone=FILLS_TIMEZONE, **kwargs):
+        super().__init__(user_id, point_values, **kwargs)
+        self.zone = ZoneInfo(exchange_timezone)
+
+    def run(self, binary_stream, encoding='utf-8-sig'):
+        text = io.TextIOWrapper(binary_stream, encoding=encoding, newline='')
+        reader = csv.DictReader(text)
+        columns = self._fill_columns(reader.fieldnames or [])
+        missing = [field for field in ('timestamp', 'symbol', 'qty', 'price') if field not in columns]
+        if missing:
+            self._note(1, None, 'error', "Missing column(s): " + ', '.join(missing) + ". Expected time, symbol, "
+                                         "side, quantity and price columns.")
+            return self.result
+
+        fills, unreadable = [], {}
+        for row in reader:
+            self.result.rows_read += 1
+            line = reader.line_num
+            try:
+                fills.append(self._read_fill(row, columns, line))
+            except ImportRowError as e:
+                symbol = (row.get(columns['symbol']) or '').strip().upper()
+                unreadable.setdefault(symbol, line)
+                self._note(line, symbol, 'error', str(e))
+        fills.sort()
+
+        for symbol, symbol_fills in itertools.groupby(fills, key=itemgetter(0)):
+            if symbol in unreadable:
+                # Replaying around a missing fill would produce wrong positions for every later trade
+                self._note(unreadable[symbol], symbol, 'error',
+                           f"No trades imported for {symbol} because a fill could not be read; fix the row and "
+                           f"import the file again (trades already imported are not duplicated).")
+                continue
+            self._replay(symbol, symbol_fills)
+        self._chunk_last_line = reader.line_num
+        self._flush()
+        self.result.last_line = reader.line_num
+        return self.result
+
+    @staticmethod
+    def _fill_columns(fieldnames):
+        by_name = {(name or '').strip().lower(): name for name in fieldnames}
+        columns = {}
+        for field, aliases in _FILL_COLUMNS.items():
+            for alias in aliases:
+                if alias in by_name and by_name[alias] not in columns.values():
+                    columns[field] = by_name[alias]
+                    break
+        if 'timestamp' not in columns and 'date' in columns:
+            columns['timestamp'] = columns.pop('date')  # A single "Date" column holding date and time
+        return columns
+
+    def _read_fill(self, row, columns, line):
+        """(symbol, UTC instant, line, sign, quantity, price, wall-clock time); the line keeps equal instants in
+        file order."""
+        symbol = (row.get(columns['symbol']) or '').strip().upper()
+        if not symbol:
+            raise ImportRowError("Missing symbol.")
+        stamp = (row.get(columns['timestamp']) or '').strip()
+        if 'date' in columns and stamp and (row.get(columns['date']) or '').strip() not in stamp:
+            stamp = f"{row[columns['date']].strip()} {stamp}"  # Separate date and time columns
+        instant, timestamp = _parse_timestamp(stamp, self.zone)
+        quantity = _parse_float(row.get(columns['qty']), 'Quantity')
+        price = _parse_float(row.get(columns['price']), 'Price')
+        if not quantity or price is None:
+            raise ImportRowError("Quantity and price are required.")
+        if quantity != int(quantity):
+            raise ImportRowError("Quantity must be a whole number of contracts.")
+        side = (row.get(columns['side']) or '').strip().lower() if 'side' in columns else ''
+        if side in _BUY_SIDES:
+            sign = 1
+        elif side in _SELL_SIDES:
+            sign = -1
+        elif not side:
+            sign = 1 if quantity > 0 else -1  # Signed quantities: negative means sold
+        else:
+            raise ImportRowError(f"Side must be Buy or Sell, not '{side}'.")
+        return symbol, instant, line, sign, abs(int(quantity)), price, timestamp
+
+    def _instrument_for(self, symbol):
+        """Maps a contract symbol (e.g. 'MNQH4', '/ES Z24') to a journal instrument and its point value."""
+        root = symbol.lstrip('/@')
+        for instrument in sorted((name for name in self.point_values if name != 'Other'), key=len, reverse=True):
+            if root.startswith(instrument):
+                return instrument, self.point_values[instrument]
+        self._note(None, symbol, 'warning', f"No point value known for {symbol}; 1.0 used.")
+        return symbol[:10], self.point_values.get('Other', 1.0)
+
+    def _replay(self, symbol, fills):
+        instrument, point_value = self._instrument_for(symbol)
+        position, direction = 0, 0
+        for _, instant, line, sign, quantity, price, timestamp in fills:
+            while quantity:
+                if position == 0:  # Flat: this fill opens a new trade
+                    direction, opened, opened_at, opened_line = sign, timestamp, instant, line
+                    entries, exits = [], []
+                    fingerprint = hashlib.sha1(symbol.encode())
+                if sign == direction:
+                    filled = quantity
+                    entries.append((timestamp.time(), filled, price))
+                    position += filled
+                else:
+                    filled = min(quantity, position)
+                    exits.append((timestamp.time(), filled, price))
+                    position -= filled
+                fingerprint.update(f"|{timestamp.isoformat()},{sign},{filled},{price!r}".encode())
+                quantity -= filled
+                if position == 0:
+                    trade = {'user_id': self.user_id, 'trade_date': opened.date(), 'instrument': instrument,
+                             'direction': 'Long' if direction > 0 else 'Short', 'point_value': point_value,
+                             'source_key': fingerprint.hexdigest(), 'metrics_updated_at': datetime.utcnow(),
+                             # From the instants: the legs' wall-clock times go negative past midnight
+                             'time_in_trade_seconds': int((instant - opened_at).total_seconds())}
+                    self._queue_trade(trade, entries, exits, [], 0)
+        if position:
+            self._note(opened_line, symbol, 'warning',
+                       f"{symbol}: {position} contract(s) opened {opened:%Y-%m-%d %H:%M:%S} are still open at the end "
+                       f"of the file; that trade is imported from a file that includes its exit.")
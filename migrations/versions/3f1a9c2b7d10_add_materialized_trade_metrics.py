@@ -0,0 +1,47 @@
+"""add materialized trade metric columns
+
+Revision ID: 3f1a9c2b7d10
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+Existing rows start with zeroed/NULL metrics; run `flask backfill-trade-metrics`
+after upgrading to populate them.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_contracts_entered', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('total_contracts_exited', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('average_entry_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('average_exit_price', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('gross_pnl', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('dollar_risk', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('pnl_in_r', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('risk_reward_ratio', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('time_in_trade_seconds', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('metrics_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.drop_column('metrics_updated_at')
+        batch_op.drop_column('time_in_trade_seconds')
+        batch_op.drop_column('risk_reward_ratio')
+        batch_op.drop_column('pnl_in_r')
+        batch_op.drop_column('dollar_risk')
+        batch_op.drop_column('gross_pnl')
+        batch_op.drop_column('average_exit_price')
+        batch_op.drop_column('average_entry_price')
+        batch_op.drop_column('total_contracts_exited')
+        batch_op.drop_column('total_contracts_entered')
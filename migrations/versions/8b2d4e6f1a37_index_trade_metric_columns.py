@@ -0,0 +1,32 @@
+"""index trade metric columns for list filtering and sorting
+
+Revision ID: 8b2d4e6f1a37
+Revises: 3f1a9c2b7d10
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a37'
+down_revision = '3f1a9c2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.create_index('ix_trade_user_date', ['user_id', 'trade_date'], unique=False)
+        batch_op.create_index('ix_trade_user_gross_pnl', ['user_id', 'gross_pnl'], unique=False)
+        batch_op.create_index('ix_trade_user_pnl_in_r', ['user_id', 'pnl_in_r'], unique=False)
+        batch_op.create_index('ix_trade_user_time_in_trade', ['user_id', 'time_in_trade_seconds'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.drop_index('ix_trade_user_time_in_trade')
+        batch_op.drop_index('ix_trade_user_pnl_in_r')
+        batch_op.drop_index('ix_trade_user_gross_pnl')
+        batch_op.drop_index('ix_trade_user_date')
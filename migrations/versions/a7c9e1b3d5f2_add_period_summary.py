@@ -0,0 +1,34 @@
+"""add period_summary cache for weekly/monthly/quarterly/yearly reviews
+
+Revision ID: a7c9e1b3d5f2
+Revises: d4f6a8c0e2b3
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1b3d5f2'
+down_revision = 'd4f6a8c0e2b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('period_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('period_type', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_periodsummary_user'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'period_type', 'period_start', name='uq_period_summary')
+    )
+
+
+def downgrade():
+    op.drop_table('period_summary')
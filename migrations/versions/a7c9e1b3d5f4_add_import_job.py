@@ -0,0 +1,49 @@
+"""add import_job table for background trade imports
+
+Revision ID: a7c9e1b3d5f4
+Revises: f1b3d5e7a9c2
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1b3d5f4'
+down_revision = 'f1b3d5e7a9c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('upload_token', sa.String(length=32), nullable=False),
+        sa.Column('report_token', sa.String(length=32), nullable=True),
+        sa.Column('retry_of_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+        sa.Column('bytes_total', sa.Integer(), nullable=False),
+        sa.Column('bytes_read', sa.Integer(), nullable=False),
+        sa.Column('rows_read', sa.Integer(), nullable=False),
+        sa.Column('imported', sa.Integer(), nullable=False),
+        sa.Column('skipped', sa.Integer(), nullable=False),
+        sa.Column('warnings', sa.Integer(), nullable=False),
+        sa.Column('last_line', sa.Integer(), nullable=False),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_importjob_user'),
+        sa.ForeignKeyConstraint(['retry_of_id'], ['import_job.id'], name='fk_importjob_retry_of'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_import_job_user_created', 'import_job', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_import_job_user_created', table_name='import_job')
+    op.drop_table('import_job')
@@ -0,0 +1,36 @@
+"""add trade.source_key and import_job fills columns
+
+Revision ID: b8d0f2a4c6e8
+Revises: a7c9e1b3d5f4
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d0f2a4c6e8'
+down_revision = 'a7c9e1b3d5f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('source_key', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_trade_user_source_key', ['user_id', 'source_key'], unique=True)
+
+    with op.batch_alter_table('import_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_format', sa.String(length=20), nullable=False, server_default='trades'))
+        batch_op.add_column(sa.Column('duplicates', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('import_job', schema=None) as batch_op:
+        batch_op.drop_column('duplicates')
+        batch_op.drop_column('file_format')
+
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.drop_index('ix_trade_user_source_key')
+        batch_op.drop_column('source_key')
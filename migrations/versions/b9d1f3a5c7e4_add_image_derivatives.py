@@ -0,0 +1,36 @@
+"""add web-sized derivative columns to trade and daily journal images
+
+Revision ID: b9d1f3a5c7e4
+Revises: a7c9e1b3d5f2
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9d1f3a5c7e4'
+down_revision = 'a7c9e1b3d5f2'
+branch_labels = None
+depends_on = None
+
+IMAGE_TABLES = ('trade_image', 'daily_journal_image')
+
+
+def upgrade():
+    for table_name in IMAGE_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('medium_filepath', sa.String(length=255), nullable=True))
+            batch_op.add_column(sa.Column('thumbnail_filepath', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    for table_name in IMAGE_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('thumbnail_filepath')
+            batch_op.drop_column('medium_filepath')
+            batch_op.drop_column('height')
+            batch_op.drop_column('width')
@@ -0,0 +1,29 @@
+"""add pending_file_removal queue for deferred upload cleanup
+
+Revision ID: c2e4a6b8d0f1
+Revises: b8d0f2a4c6e8
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e4a6b8d0f1'
+down_revision = 'b8d0f2a4c6e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pending_file_removal',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('path', sa.String(length=255), nullable=False),
+        sa.Column('queued_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('pending_file_removal')
@@ -0,0 +1,30 @@
+"""add content_hash (ETag) to uploaded files and images
+
+Revision ID: c3e5a7b9d1f6
+Revises: b9d1f3a5c7e4
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f6'
+down_revision = 'b9d1f3a5c7e4'
+branch_labels = None
+depends_on = None
+
+UPLOAD_TABLES = ('file', 'trade_image', 'daily_journal_image')
+
+
+def upgrade():
+    for table_name in UPLOAD_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    for table_name in UPLOAD_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('content_hash')
@@ -0,0 +1,26 @@
+"""add user data_version for analytics cache invalidation
+
+Revision ID: c5e7a1d3f9b2
+Revises: 8b2d4e6f1a37
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e7a1d3f9b2'
+down_revision = '8b2d4e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
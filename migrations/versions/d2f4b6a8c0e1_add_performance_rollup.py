@@ -0,0 +1,43 @@
+"""add performance_rollup table
+
+Revision ID: d2f4b6a8c0e1
+Revises: c5e7a1d3f9b2
+Create Date: 2026-10-18 13:00:00.000000
+
+Run `flask rebuild-performance-rollups` after upgrading to populate it.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f4b6a8c0e1'
+down_revision = 'c5e7a1d3f9b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('performance_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('period_type', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('dimension', sa.String(length=20), nullable=False),
+        sa.Column('dimension_value', sa.String(length=100), nullable=False),
+        sa.Column('trade_count', sa.Integer(), nullable=False),
+        sa.Column('win_count', sa.Integer(), nullable=False),
+        sa.Column('loss_count', sa.Integer(), nullable=False),
+        sa.Column('gross_pnl', sa.Float(), nullable=False),
+        sa.Column('sum_r', sa.Float(), nullable=False),
+        sa.Column('max_mae', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_performancerollup_user'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'period_type', 'period_start', 'dimension', 'dimension_value',
+                            name='uq_performance_rollup_bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('performance_rollup')
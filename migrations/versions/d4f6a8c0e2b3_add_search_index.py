@@ -0,0 +1,28 @@
+"""add full-text search index over notes, journals and trading models
+
+Revision ID: d4f6a8c0e2b3
+Revises: c2e4a6b8d0f1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+
+from app.search import create_search_index, drop_search_index, rebuild_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6a8c0e2b3'
+down_revision = 'c2e4a6b8d0f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The FTS5 table / tsvector table and the triggers are dialect-specific DDL generated by app/search.py
+    connection = op.get_bind()
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+
+def downgrade():
+    drop_search_index(op.get_bind())
@@ -0,0 +1,43 @@
+"""add per-user storage_usage counters, filled from the existing uploads
+
+Revision ID: d5f7b9c1e3a8
+Revises: c3e5a7b9d1f6
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f7b9c1e3a8'
+down_revision = 'c3e5a7b9d1f6'
+branch_labels = None
+depends_on = None
+
+# category -> upload table, as in app.storage_usage.UPLOAD_CATEGORIES
+UPLOAD_TABLES = {'file': 'file', 'trade_image': 'trade_image', 'journal_image': 'daily_journal_image'}
+
+
+def upgrade():
+    op.create_table('storage_usage',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=20), nullable=False),
+        sa.Column('bytes', sa.BigInteger(), nullable=False),
+        sa.Column('file_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_storageusage_user'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'category', name='uq_storage_usage_user_category')
+    )
+    for category, table in UPLOAD_TABLES.items():
+        op.execute(
+            f"INSERT INTO storage_usage (user_id, category, bytes, file_count, updated_at) "
+            f"SELECT user_id, '{category}', SUM(filesize), COUNT(*), CURRENT_TIMESTAMP "
+            f"FROM {table} GROUP BY user_id"
+        )
+
+
+def downgrade():
+    op.drop_table('storage_usage')
@@ -0,0 +1,88 @@
+"""normalize trade tags into tag / trade_tag tables
+
+Revision ID: e4a6c8f0b2d3
+Revises: d2f4b6a8c0e1
+Create Date: 2026-10-18 15:00:00.000000
+
+Existing comma/semicolon separated `trade.tags` strings are split into per-user
+tag rows and trade_tag links before the column is dropped.
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a6c8f0b2d3'
+down_revision = 'd2f4b6a8c0e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tag_table = op.create_table('tag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_tag_user'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'name', name='uq_user_tag_name')
+    )
+    trade_tag_table = op.create_table('trade_tag',
+        sa.Column('trade_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['trade_id'], ['trade.id'], name='fk_tradetag_trade'),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], name='fk_tradetag_tag'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_tradetag_user'),
+        sa.PrimaryKeyConstraint('trade_id', 'tag_id')
+    )
+    op.create_index('ix_trade_tag_user_tag_trade', 'trade_tag', ['user_id', 'tag_id', 'trade_id'], unique=False)
+
+    # Data migration: split the legacy free-text column into normalized rows
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, user_id, tags FROM trade WHERE tags IS NOT NULL AND tags != ''")).all()
+    tag_ids = {}
+    links = []
+    now = datetime.utcnow()
+    for trade_id, user_id, raw in rows:
+        names = []
+        for name in raw.replace(';', ',').split(','):
+            name = name.strip()[:50]
+            if name and name not in names:
+                names.append(name)
+        for name in names:
+            key = (user_id, name)
+            if key not in tag_ids:
+                result = bind.execute(tag_table.insert().values(user_id=user_id, name=name, created_at=now))
+                tag_ids[key] = result.inserted_primary_key[0]
+            links.append({'trade_id': trade_id, 'tag_id': tag_ids[key], 'user_id': user_id})
+    if links:
+        op.bulk_insert(trade_tag_table, links)
+
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.drop_column('tags')
+
+
+def downgrade():
+    with op.batch_alter_table('trade', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tags', sa.String(length=255), nullable=True))
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT trade_tag.trade_id, tag.name FROM trade_tag JOIN tag ON tag.id = trade_tag.tag_id "
+        "ORDER BY trade_tag.trade_id, tag.name")).all()
+    joined = {}
+    for trade_id, name in rows:
+        joined.setdefault(trade_id, []).append(name)
+    for trade_id, names in joined.items():
+        bind.execute(sa.text("UPDATE trade SET tags = :tags WHERE id = :id"),
+                     {'tags': ', '.join(names)[:255], 'id': trade_id})
+
+    op.drop_index('ix_trade_tag_user_tag_trade', table_name='trade_tag')
+    op.drop_table('trade_tag')
+    op.drop_table('tag')
@@ -0,0 +1,44 @@
+"""composite indexes for hot per-user and per-trade lookups
+
+Revision ID: f1b3d5e7a9c2
+Revises: e4a6c8f0b2d3
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b3d5e7a9c2'
+down_revision = 'e4a6c8f0b2d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entry_point', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_entry_point_trade_id'), ['trade_id'], unique=False)
+
+    with op.batch_alter_table('exit_point', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_exit_point_trade_id'), ['trade_id'], unique=False)
+
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_user_timestamp', ['user_id', 'timestamp'], unique=False)
+
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.create_index('ix_file_user_upload_date', ['user_id', 'upload_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('file', schema=None) as batch_op:
+        batch_op.drop_index('ix_file_user_upload_date')
+
+    with op.batch_alter_table('activity', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_user_timestamp')
+
+    with op.batch_alter_table('exit_point', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_exit_point_trade_id'))
+
+    with op.batch_alter_table('entry_point', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entry_point_trade_id'))
@@ -0,0 +1,80 @@
+import os
+import uuid
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from app import create_app, db
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Application bound to a throwaway SQLite database."""
+    instance = tmp_path_factory.mktemp('instance')
+
+    class TestConfig:
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(instance, 'test.db')
+        UPLOAD_FOLDER = os.path.join(instance, 'uploads')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    """A fresh user without any data, for tests that write through the application code."""
+    from app.models import User
+
+    user = User(username=f'user-{uuid.uuid4().hex[:12]}', email=f'{uuid.uuid4().hex[:12]}@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture(scope='session')
+def seeded_db(app):
+    """A few users with enough trades, legs, journals, activity and files for the planner to have real choices."""
+    from app.models import Activity, DailyJournal, EntryPoint, ExitPoint, File, Trade, TradingModel, User
+
+    users = []
+    for n in range(3):
+        user = User(username=f'trader{n}', email=f'trader{n}@example.com')
+        user.set_password('password123')
+        users.append(user)
+    db.session.add_all(users)
+    db.session.flush()
+
+    start = date(2024, 1, 1)
+    for user in users:
+        model = TradingModel(user_id=user.id, name='Model A')
+        db.session.add(model)
+        db.session.flush()
+        for i in range(200):
+            direction = 'Long' if i % 3 else 'Short'
+            trade = Trade(user_id=user.id, instrument='NQ' if i % 2 else 'ES', direction=direction,
+                          trade_date=start + timedelta(days=i // 2), trading_model_id=model.id, how_closed='TP',
+                          point_value=20.0 if i % 2 else 50.0,
+                          # Every fifth trade has no stop or exit time, so no R or duration
+                          initial_stop_loss=(95.0 if direction == 'Long' else 105.0) if i % 5 else None)
+            entry = EntryPoint(entry_time=time(9, 30), contracts=1, entry_price=100.0)
+            exit_ = ExitPoint(exit_time=time(10, 30) if i % 5 else None, contracts=1, exit_price=100.0 + (i % 7) - 3)
+            trade.entries.append(entry)
+            trade.exits.append(exit_)
+            trade.recalculate_metrics(entries=[entry], exits=[exit_])
+            db.session.add(trade)
+        for i in range(100):
+            db.session.add(DailyJournal(user_id=user.id, journal_date=start + timedelta(days=i)))
+            db.session.add(Activity(user_id=user.id, action='login', timestamp=datetime(2024, 1, 1) + timedelta(hours=i)))
+            db.session.add(File(user_id=user.id, filename=f'f{i}.txt', filepath=f'{user.id}/f{i}.txt', filesize=10,
+                                upload_date=datetime(2024, 1, 1) + timedelta(hours=i)))
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+    return users
@@ -0,0 +1,138 @@
+"""Behaviour of the broker-fills importer: the flat -> open -> scale -> flat position replay."""
+import io
+from datetime import time
+
+import pytest
+
+from app import db
+from app.models import Trade
+from app.trade_import import FillsTradeImporter
+
+POINT_VALUES = {'NQ': 20.0, 'ES': 50.0, 'MNQ': 2.0, 'Other': 1.0}
+
+
+def _import(user, text):
+    report = io.StringIO()
+    result = FillsTradeImporter(user.id, POINT_VALUES, report=report).run(io.BytesIO(text.encode()))
+    return result, report.getvalue()
+
+
+def _trades(user):
+    return Trade.query.filter_by(user_id=user.id).order_by(Trade.trade_date, Trade.id).all()
+
+
+def _legs(leg_query, time_column, price_column):
+    return sorted((getattr(leg, time_column), leg.contracts, getattr(leg, price_column)) for leg in leg_query)
+
+
+def test_scale_in_and_partial_exits_make_one_trade(user):
+    result, _ = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-01 09:30:00,NQH4,Buy,1,100
+2024-02-01 09:31:00,NQH4,Buy,1,102
+2024-02-01 09:40:00,NQH4,Sell,1,105
+2024-02-01 09:45:00,NQH4,Sell,1,107
+""")
+    assert result.imported == 1 and not result.has_issues
+    trade, = _trades(user)
+    assert (trade.instrument, trade.direction, trade.point_value) == ('NQ', 'Long', 20.0)
+    assert _legs(trade.entries, 'entry_time', 'entry_price') == [(time(9, 30), 1, 100.0), (time(9, 31), 1, 102.0)]
+    assert _legs(trade.exits, 'exit_time', 'exit_price') == [(time(9, 40), 1, 105.0), (time(9, 45), 1, 107.0)]
+    assert trade.gross_pnl == pytest.approx((106.0 - 101.0) * 2 * 20.0)
+    assert trade.time_in_trade_seconds == 15 * 60
+
+
+def test_fill_crossing_zero_reverses_the_position(user):
+    result, _ = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-01 09:30:00,ESH4,Buy,2,5000
+2024-02-01 09:35:00,ESH4,Sell,3,5010
+2024-02-01 09:50:00,ESH4,Buy,1,5004
+""")
+    assert result.imported == 2
+    long_trade, short_trade = sorted(_trades(user), key=lambda trade: trade.direction)
+    assert long_trade.direction == 'Long' and short_trade.direction == 'Short'
+    assert _legs(long_trade.exits, 'exit_time', 'exit_price') == [(time(9, 35), 2, 5010.0)]
+    assert _legs(short_trade.entries, 'entry_time', 'entry_price') == [(time(9, 35), 1, 5010.0)]
+    assert long_trade.gross_pnl == pytest.approx(10 * 2 * 50.0)
+    assert short_trade.gross_pnl == pytest.approx(6 * 1 * 50.0)
+
+
+def test_reimporting_overlapping_fills_skips_stored_trades(user):
+    first = """Time,Symbol,Side,Qty,Price
+2024-02-01 09:30:00,NQH4,Buy,1,100
+2024-02-01 09:40:00,NQH4,Sell,1,105
+"""
+    second = first + """2024-02-01 10:00:00,NQH4,Sell,1,110
+2024-02-01 10:05:00,NQH4,Buy,1,108
+"""
+    assert _import(user, first)[0].imported == 1
+    result, _ = _import(user, second)
+    assert (result.imported, result.duplicates) == (1, 1)
+    assert len(_trades(user)) == 2
+
+
+def test_open_position_at_end_of_file_is_not_imported(user):
+    result, report = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-01 09:30:00,NQH4,Buy,2,100
+2024-02-01 09:40:00,NQH4,Sell,1,105
+""")
+    assert result.imported == 0 and result.warnings == 1
+    assert 'still open' in report
+    assert _trades(user) == []
+
+
+def test_position_held_over_midnight_keeps_a_positive_duration(user):
+    result, _ = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-01 23:50:00,NQH4,Buy,1,100
+2024-02-02 00:10:00,NQH4,Sell,1,104
+""")
+    assert result.imported == 1
+    trade, = _trades(user)
+    assert str(trade.trade_date) == '2024-02-01'
+    assert trade.time_in_trade_seconds == 20 * 60
+
+
+def test_offset_timestamps_are_stored_on_the_exchange_clock(user):
+    result, _ = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-03T14:50:00+00:00,NQH4,Buy,1,100
+2024-02-03 10:00:00,NQH4,Sell,1,101
+2024-02-03T10:30:00-05:00,NQH4,Sell,1,99
+2024-02-03T16:40:00+01:00,NQH4,Buy,1,98
+""")
+    assert result.imported == 2 and not result.has_issues
+    long_trade, short_trade = sorted(_trades(user), key=lambda trade: trade.direction)
+    # Every offset is converted to New York time, whatever the first fill's offset; naive times already are
+    assert _legs(long_trade.entries, 'entry_time', 'entry_price') == [(time(9, 50), 1, 100.0)]
+    assert _legs(short_trade.entries, 'entry_time', 'entry_price') == [(time(10, 30), 1, 99.0)]
+    assert _legs(short_trade.exits, 'exit_time', 'exit_price') == [(time(10, 40), 1, 98.0)]
+    assert long_trade.time_in_trade_seconds == 10 * 60
+
+
+def test_fills_straddling_a_dst_change_keep_the_exchange_wall_time(user):
+    result, _ = _import(user, """Time,Symbol,Side,Qty,Price
+2024-03-08T09:30:00-05:00,ESH4,Buy,1,5000
+2024-03-11T09:30:00-04:00,ESH4,Sell,1,5010
+2024-03-11T13:45:00+00:00,ESH4,Sell,1,5020
+2024-03-11 09:50:00,ESH4,Buy,1,5015
+""")
+    assert result.imported == 2 and not result.has_issues
+    long_trade, short_trade = sorted(_trades(user), key=lambda trade: trade.direction)
+    assert str(long_trade.trade_date) == '2024-03-08'
+    assert _legs(long_trade.exits, 'exit_time', 'exit_price') == [(time(9, 30), 1, 5010.0)]
+    # Friday 09:30 EST to Monday 09:30 EDT is three days less the hour skipped
+    assert long_trade.time_in_trade_seconds == (3 * 24 - 1) * 3600
+    assert str(short_trade.trade_date) == '2024-03-11'
+    assert _legs(short_trade.entries, 'entry_time', 'entry_price') == [(time(9, 45), 1, 5020.0)]
+    assert short_trade.time_in_trade_seconds == 5 * 60
+
+
+def test_unreadable_fill_skips_that_symbol_only(user):
+    result, report = _import(user, """Time,Symbol,Side,Qty,Price
+2024-02-01 09:30:00,NQH4,Buy,1,100
+2024-02-01 09:35:00,NQH4,Hold,1,101
+2024-02-01 09:40:00,NQH4,Sell,1,105
+2024-02-01 09:30:00,ESH4,Sell,1,5000
+2024-02-01 09:40:00,ESH4,Buy,1,4990
+""")
+    assert result.imported == 1
+    assert [trade.instrument for trade in _trades(user)] == ['ES']
+    assert 'No trades imported for NQH4' in report
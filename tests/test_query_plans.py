@@ -0,0 +1,89 @@
+"""EXPLAIN QUERY PLAN regression tests for the hot queries.
+
+Each named query is built the way the application builds it and must be answered from an index:
+a plan step that scans a whole table (or a whole index) or sorts through a temporary B-tree fails.
+"""
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.blueprints.trades_bp import TRADE_SORT_COLUMNS, _apply_trade_sort, _encode_cursor, _keyset_page
+from app.models import Activity, DailyJournal, EntryPoint, ExitPoint, File, Trade
+
+
+def _query_plan(query):
+    statement = getattr(query, 'statement', query)
+    connection = db.session.connection()
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+
+
+def _executed_plans(run):
+    """Query plans of every SELECT issued while `run()` executes."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    connection = db.session.connection()
+    return [[row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            for statement, parameters in statements]
+
+
+def _assert_indexed(plan):
+    bad_steps = [step for step in plan if step.startswith('SCAN ') or 'TEMP B-TREE' in step]
+    assert not bad_steps, 'query plan regressed:\n  ' + '\n  '.join(plan)
+
+
+def _trade_id(user):
+    return db.session.execute(db.select(Trade.id).where(Trade.user_id == user.id).limit(1)).scalar()
+
+
+HOT_QUERIES = {
+    'journal_trades_for_day': lambda user: Trade.query.filter_by(user_id=user.id, trade_date='2024-01-10')
+        .order_by(Trade.id.asc()),
+    'daily_journal_by_date': lambda user: DailyJournal.query.filter_by(user_id=user.id, journal_date='2024-01-10'),
+    'entry_points_for_trade': lambda user: EntryPoint.query.filter_by(trade_id=_trade_id(user)),
+    'exit_points_for_trade': lambda user: ExitPoint.query.filter_by(trade_id=_trade_id(user)),
+    'activity_feed': lambda user: user.activities.order_by(Activity.timestamp.desc()).limit(20),
+    'my_files': lambda user: user.files.order_by(File.upload_date.desc()),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(seeded_db, name):
+    _assert_indexed(_query_plan(HOT_QUERIES[name](seeded_db[0])))
+
+
+@pytest.mark.parametrize('sort_dir', ['desc', 'asc'])
+@pytest.mark.parametrize('sort_by', sorted(TRADE_SORT_COLUMNS))
+def test_trade_list_page_uses_index(seeded_db, sort_by, sort_dir):
+    query = _apply_trade_sort(Trade.query.filter_by(user_id=seeded_db[0].id), sort_by, sort_dir)
+    _assert_indexed(_query_plan(query.limit(25)))
+
+
+@pytest.mark.parametrize('with_null_cursor', [False, True])
+@pytest.mark.parametrize('direction', ['after', 'before'])
+@pytest.mark.parametrize('sort_dir', ['desc', 'asc'])
+@pytest.mark.parametrize('sort_by', sorted(TRADE_SORT_COLUMNS))
+def test_trade_list_keyset_seek_uses_index(seeded_db, sort_by, sort_dir, direction, with_null_cursor):
+    column = TRADE_SORT_COLUMNS[sort_by]
+    if with_null_cursor and not column.nullable:
+        pytest.skip('column is never NULL')
+    user = seeded_db[0]
+    condition = column.is_(None) if with_null_cursor else column.isnot(None)
+    trade = Trade.query.filter(Trade.user_id == user.id, condition).order_by(Trade.id).offset(10).first()
+    cursor = _encode_cursor(getattr(trade, column.key), trade.id)
+    query = Trade.query.filter_by(user_id=user.id)
+    plans = _executed_plans(lambda: _keyset_page(query, sort_by, sort_dir, 25, **{direction: cursor}))
+    assert plans
+    for plan in plans:
+        _assert_indexed(plan)
+        # A seek must narrow the index range past the user prefix, or deep pages walk every earlier row
+        assert not any(step.endswith('(user_id=?)') for step in plan), '\n'.join(plan)
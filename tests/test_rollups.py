@@ -0,0 +1,72 @@
+"""The incrementally maintained P&L rollups must always equal a rebuild from the trades table."""
+from datetime import date, time
+
+import pytest
+
+from app import db
+from app.models import EntryPoint, ExitPoint, PerformanceRollup, Trade
+from app.rollups import get_period_rollups, rebuild_performance_rollups, remove_deleted_trades, rollup_rows_for_trades
+
+
+def _add_trade(user, trade_date, exit_price, instrument='NQ'):
+    trade = Trade(user_id=user.id, instrument=instrument, direction='Long', trade_date=trade_date,
+                  point_value=20.0, how_closed='TP', initial_stop_loss=95.0)
+    entry = EntryPoint(entry_time=time(9, 30), contracts=1, entry_price=100.0)
+    exit_ = ExitPoint(exit_time=time(10, 0), contracts=1, exit_price=exit_price)
+    trade.entries.append(entry)
+    trade.exits.append(exit_)
+    trade.recalculate_metrics(entries=[entry], exits=[exit_])
+    db.session.add(trade)
+    db.session.commit()
+    return trade
+
+
+def _snapshot(user):
+    rows = PerformanceRollup.query.filter_by(user_id=user.id).all()
+    return {(row.period_type, row.period_start, row.dimension, row.dimension_value):
+            (row.trade_count, row.win_count, row.loss_count, round(row.gross_pnl, 6), round(row.sum_r, 6), row.max_mae)
+            for row in rows}
+
+
+def _assert_matches_rebuild(user):
+    incremental = _snapshot(user)
+    rebuild_performance_rollups([user.id])
+    db.session.commit()
+    assert incremental == _snapshot(user)
+
+
+def test_insert_update_and_delete_keep_rollups_exact(user):
+    winner = _add_trade(user, date(2024, 3, 4), 110.0)
+    loser = _add_trade(user, date(2024, 3, 5), 96.0, instrument='ES')
+    rollups = get_period_rollups(user.id, date(2024, 3, 5))
+    assert rollups['day'].trade_count == 1 and rollups['day'].gross_pnl == pytest.approx(-80.0)
+    assert (rollups['week'].trade_count, rollups['week'].win_count, rollups['week'].loss_count) == (2, 1, 1)
+    assert rollups['month'].gross_pnl == pytest.approx(200.0 - 80.0)
+    _assert_matches_rebuild(user)
+
+    # Moving a trade to another month takes it out of every old bucket and into the new ones
+    winner.trade_date = date(2024, 4, 2)
+    winner.mae = 3.5
+    db.session.commit()
+    assert get_period_rollups(user.id, date(2024, 3, 5))['month'].trade_count == 1
+    assert get_period_rollups(user.id, date(2024, 4, 2))['month'].max_mae == 3.5
+    _assert_matches_rebuild(user)
+
+    db.session.delete(loser)
+    db.session.commit()
+    assert get_period_rollups(user.id, date(2024, 3, 5))['month'] is None
+    _assert_matches_rebuild(user)
+
+
+def test_bulk_core_delete_is_folded_in(user):
+    trades = [_add_trade(user, date(2024, 5, day), 100.0 + day) for day in (6, 7, 8)]
+    doomed = [trades[0].id, trades[2].id]
+    rows = rollup_rows_for_trades(doomed)
+    for leg_table in (EntryPoint.__table__, ExitPoint.__table__):
+        db.session.execute(db.delete(leg_table).where(leg_table.c.trade_id.in_(doomed)))
+    db.session.execute(db.delete(Trade.__table__).where(Trade.__table__.c.id.in_(doomed)))
+    remove_deleted_trades(rows)
+    db.session.commit()
+    week = get_period_rollups(user.id, date(2024, 5, 7))['week']
+    assert week.trade_count == 1 and week.gross_pnl == pytest.approx(7 * 20.0)
+    _assert_matches_rebuild(user)
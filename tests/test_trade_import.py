@@ -0,0 +1,64 @@
+"""Behaviour of the streaming CSV trade importer: grouping rows and legs into trades."""
+import io
+from datetime import time
+
+from app.models import Trade
+from app.trade_import import CsvTradeImporter
+
+POINT_VALUES = {'NQ': 20.0, 'ES': 50.0, 'Other': 1.0}
+
+
+def _import(user, text, chunk_size=5000):
+    report = io.StringIO()
+    result = CsvTradeImporter(user.id, POINT_VALUES, report=report, chunk_size=chunk_size).run(
+        io.BytesIO(text.encode()))
+    return result, report.getvalue()
+
+
+def _trades(user):
+    return Trade.query.filter_by(user_id=user.id).order_by(Trade.id).all()
+
+
+def _legs(trade):
+    return (sorted((leg.entry_time, leg.contracts, leg.entry_price) for leg in trade.entries),
+            sorted((leg.exit_time, leg.contracts, leg.exit_price) for leg in trade.exits))
+
+
+def test_numbered_leg_columns_and_extra_rows_share_a_trade(user):
+    result, _ = _import(user, """ID,Date,Instrument,Direction,Entry 1 Time,Entry 1 Contracts,Entry 1 Price,Exit 1 Time,Exit 1 Contracts,Exit 1 Price,Entry 2 Time,Entry 2 Contracts,Entry 2 Price
+7,2024-03-01,NQ,Long,09:30,1,100,10:00,1,110,09:35,1,102
+7,,,,,,,10:05,1,112,,,
+8,2024-03-01,ES,Short,09:40,2,5000,09:50,2,4995,,,
+""", chunk_size=1)
+    assert (result.imported, result.skipped) == (2, 0)
+    nq, es = _trades(user)
+    assert _legs(nq) == ([(time(9, 30), 1, 100.0), (time(9, 35), 1, 102.0)],
+                         [(time(10, 0), 1, 110.0), (time(10, 5), 1, 112.0)])
+    assert nq.total_contracts_entered == 2 and nq.total_contracts_exited == 2
+    assert _legs(es) == ([(time(9, 40), 2, 5000.0)], [(time(9, 50), 2, 4995.0)])
+
+
+def test_detailed_export_row_types_are_regrouped(user):
+    result, _ = _import(user, """ID,Row Type,Date,Instrument,Direction,Leg Time,Leg Contracts,Leg Price
+3,Entry,,,,09:30,2,100
+3,Trade,2024-03-04,NQ,Short,,,
+3,Exit,,,,09:45,1,98
+3,Exit,,,,09:50,1,97
+""")
+    assert result.imported == 1
+    trade, = _trades(user)
+    assert (trade.instrument, trade.direction) == ('NQ', 'Short')
+    assert _legs(trade) == ([(time(9, 30), 2, 100.0)], [(time(9, 45), 1, 98.0), (time(9, 50), 1, 97.0)])
+
+
+def test_bad_and_non_consecutive_rows_are_reported_not_fatal(user):
+    result, report = _import(user, """ID,Date,Instrument,Direction,Entry 1 Time,Entry 1 Contracts,Entry 1 Price
+1,2024-03-05,NQ,Long,09:30,1,100
+2,2024-03-05,NQ,Sideways,09:30,1,100
+1,2024-03-05,NQ,Long,09:31,1,101
+""")
+    assert (result.imported, result.skipped) == (1, 2)
+    assert 'Direction must be Long or Short' in report
+    assert 'must be consecutive' in report
+    trade, = _trades(user)
+    assert _legs(trade)[0] == [(time(9, 30), 1, 100.0)]